@@ -0,0 +1,342 @@
+"""
+Барьеры уровня (стены и яд).
+
+BarrierEdges - канонический набор рёбер сетки с барьерами: общая сторона
+двух клеток и повторы из пересекающихся описаний хранятся один раз.
+BarrierIndex - скомпилированный индекс по клеткам, строится из рёбер при
+обработке уровня и даёт проверку барьера за O(1) независимо от их количества.
+"""
+
+from array import array
+from bisect import bisect_left
+
+# Коды направлений: противоположное - code ^ 1, бит стороны в масках - 1 << code.
+# Строки ('u', 'up', ...) переводятся в коды один раз - при разборе уровня и на входе хода.
+UP, DOWN, LEFT, RIGHT = 0, 1, 2, 3
+DIR_NAMES = ('up', 'down', 'left', 'right')
+DIR_DELTA = ((0, -1), (0, 1), (-1, 0), (1, 0))
+DIR_CODES = {'u': UP, 'd': DOWN, 'l': LEFT, 'r': RIGHT,
+             'up': UP, 'down': DOWN, 'left': LEFT, 'right': RIGHT}
+
+# Биты сторон клетки. Младшие 4 бита маски - inner, старшие 4 бита - outer.
+SIDE_BITS = {name: 1 << code for code, name in enumerate(DIR_NAMES)}
+OUTER_SHIFT = 4
+
+OPPOSITE = {'up': 'down', 'down': 'up', 'left': 'right', 'right': 'left'}
+
+# Флаги ребра. "Вперёд" - движение из (x-1, y) / (x, y-1) в (x, y), "назад" - обратно.
+# inner - барьер стороны клетки, из которой выходят, outer - клетки, в которую входят.
+FWD_INNER, FWD_OUTER, BACK_INNER, BACK_OUTER = 1, 2, 4, 8
+FWD = FWD_INNER | FWD_OUTER
+BACK = BACK_INNER | BACK_OUTER
+# Младшие 4 бита флагов - стены, старшие - яд
+KIND_SHIFT = {'walls': 0, 'poison': 4}
+
+# Сторона клетки -> (сдвиг ребра dx, dy, ориентация, клетка - вторая по ходу "вперёд")
+_SIDE_EDGE = {
+    'left': (0, 0, 0, True), 'up': (0, 0, 1, True),
+    'right': (1, 0, 0, False), 'down': (0, 1, 1, False),
+}
+
+
+class BarrierEdges:
+    """
+    Канонический набор барьеров: по одной записи на ребро сетки.
+
+    Ребро (x, y, o): o=0 - вертикальная линия слева от клетки (x, y),
+    o=1 - горизонтальная сверху. id = (y * (cols + 1) + x) * 2 + o, поэтому
+    рёбра одной строки идут подряд. Хранятся отсортированные id (array 'I')
+    и флаги (array 'B') - память растёт только с числом различных рёбер.
+    """
+
+    __slots__ = ("cols", "rows", "ids", "flags")
+
+    def __init__(self, cols, rows, ids=None, flags=None):
+        self.cols = cols
+        self.rows = rows
+        self.ids = ids if ids is not None else array('I')
+        self.flags = flags if flags is not None else array('B')
+
+    @classmethod
+    def build(cls, barriers, cols, rows):
+        """
+        Args:
+            barriers: итерируемое (kind, cell, side, type), kind - 'walls' или 'poison'
+        Барьеры неизвестного типа и рёбра вне сетки отбрасываются.
+        """
+        stride = cols + 1
+        edges = {}
+        for kind, (cx, cy), side, b_type in barriers:
+            edge = _SIDE_EDGE.get(side)
+            if edge is None:
+                continue
+            dx, dy, o, is_second = edge
+            x, y = cx + dx, cy + dy
+            if o == 0 and not (0 <= x <= cols and 0 <= y < rows):
+                continue
+            if o == 1 and not (0 <= x < cols and 0 <= y <= rows):
+                continue
+
+            bits = 0
+            if b_type in ("inner", "both"):
+                bits |= BACK_INNER if is_second else FWD_INNER
+            if b_type in ("outer", "both"):
+                bits |= FWD_OUTER if is_second else BACK_OUTER
+            if bits:
+                key = (y * stride + x) * 2 + o
+                edges[key] = edges.get(key, 0) | bits << KIND_SHIFT[kind]
+
+        ids = sorted(edges)
+        return cls(cols, rows, array('I', ids), array('B', [edges[i] for i in ids]))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __bool__(self):
+        return len(self.ids) > 0
+
+    def __iter__(self):
+        """(x, y, o, flags) по всем рёбрам."""
+        stride = self.cols + 1
+        for edge_id, flags in zip(self.ids, self.flags):
+            cell, o = divmod(edge_id, 2)
+            y, x = divmod(cell, stride)
+            yield x, y, o, flags
+
+    def in_rect(self, x0, y0, x1, y1):
+        """
+        Рёбра, лежащие в прямоугольнике клеток [x0, x1) x [y0, y1), включая его границу.
+        По строке - двоичный поиск, поэтому O(видимых строк * log n + видимых рёбер).
+        """
+        stride = self.cols + 1
+        ids, flags = self.ids, self.flags
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.cols), min(y1, self.rows)
+        for y in range(y0, y1 + 1):
+            base = y * stride
+            i = bisect_left(ids, (base + x0) * 2)
+            end = (base + x1) * 2 + 2
+            while i < len(ids) and ids[i] < end:
+                x, o = divmod(ids[i] - base * 2, 2)
+                yield x, y, o, flags[i]
+                i += 1
+
+
+class BarrierIndex:
+    """Побитовый индекс барьеров: по одному байту на клетку сетки."""
+
+    __slots__ = ("cols", "rows", "masks", "count")
+
+    def __init__(self, barriers, cols, rows):
+        """
+        Args:
+            barriers: список (cell, side, type) после BarrierParser
+            cols, rows: размер сетки
+        """
+        self.cols = cols
+        self.rows = rows
+        self.masks = array('B', bytes(cols * rows))
+        self.count = 0
+
+        for b_pos, b_side, b_type in barriers:
+            x, y = b_pos
+            bit = SIDE_BITS.get(b_side)
+            # Барьеры вне сетки недостижимы - игрок туда не попадает
+            if not bit or not (0 <= x < cols and 0 <= y < rows):
+                continue
+
+            mask = 0
+            if b_type in ("inner", "both"):
+                mask |= bit
+            if b_type in ("outer", "both"):
+                mask |= bit << OUTER_SHIFT
+            if mask:
+                self.masks[y * cols + x] |= mask
+                self.count += 1
+
+    @classmethod
+    def from_edges(cls, edges, kind):
+        """Индекс одного вида барьеров (kind - 'walls' или 'poison') из BarrierEdges."""
+        cols, rows = edges.cols, edges.rows
+        index = cls((), cols, rows)
+        masks = index.masks
+        shift = KIND_SHIFT[kind]
+        for x, y, o, flags in edges:
+            flags = (flags >> shift) & 15
+            if not flags:
+                continue
+            # Первая клетка ребра (слева/сверху) и вторая, и их стороны на этом ребре
+            if o == 0:
+                first, first_side, second, second_side = (x - 1, y), 'right', (x, y), 'left'
+            else:
+                first, first_side, second, second_side = (x, y - 1), 'down', (x, y), 'up'
+            for (cx, cy), side, inner, outer in ((first, first_side, FWD_INNER, BACK_OUTER),
+                                                 (second, second_side, BACK_INNER, FWD_OUTER)):
+                if not (0 <= cx < cols and 0 <= cy < rows):
+                    continue
+                mask = 0
+                if flags & inner:
+                    mask |= SIDE_BITS[side]
+                if flags & outer:
+                    mask |= SIDE_BITS[side] << OUTER_SHIFT
+                if mask:
+                    masks[cy * cols + cx] |= mask
+                    index.count += 1
+        return index
+
+    @classmethod
+    def from_masks(cls, masks, cols, rows, count):
+        """Восстанавливает индекс из байтов масок (кэш уровней)."""
+        index = cls((), cols, rows)
+        index.masks = array('B', masks)
+        index.count = count
+        return index
+
+    def __bool__(self):
+        return self.count > 0
+
+    def __len__(self):
+        return self.count
+
+    def blocks_exit(self, pos, side):
+        """Есть ли inner-барьер на стороне side клетки pos (нельзя выйти)."""
+        x, y = pos
+        if not (0 <= x < self.cols and 0 <= y < self.rows):
+            return False
+        return bool(self.masks[y * self.cols + x] & SIDE_BITS[side])
+
+    def blocks_entry(self, pos, side):
+        """Есть ли outer-барьер на стороне side клетки pos (нельзя войти)."""
+        x, y = pos
+        if not (0 <= x < self.cols and 0 <= y < self.rows):
+            return False
+        return bool(self.masks[y * self.cols + x] & (SIDE_BITS[side] << OUTER_SHIFT))
+
+    def is_path_clear(self, current_pos, next_pos):
+        """Аналог game.is_path_clear для соседних клеток."""
+        cx, cy = current_pos
+        nx, ny = next_pos
+
+        if nx > cx: move_dir = "right"
+        elif nx < cx: move_dir = "left"
+        elif ny > cy: move_dir = "down"
+        elif ny < cy: move_dir = "up"
+        else: return True
+
+        if self.blocks_exit(current_pos, move_dir):
+            return False
+        return not self.blocks_entry(next_pos, OPPOSITE[move_dir])
+
+
+def step_masks(walls, poison, cols, rows):
+    """
+    Проходимость сетки для горячего пути ходов: байт на клетку, бит code
+    младшей тетрады - ход из клетки по направлению code закрыт стеной,
+    старшей тетрады - ядом. Учитываются inner-барьеры клетки и outer-барьеры
+    соседа, поэтому проверка хода - одно чтение байта.
+
+    Args:
+        walls, poison: BarrierIndex (пустые/None - без барьеров)
+    Returns:
+        array('B') длины cols * rows
+    """
+    steps = array('B', bytes(cols * rows))
+    for shift, index in ((0, walls), (4, poison)):
+        if not index:
+            continue
+        for i, mask in enumerate(index.masks):
+            if not mask:
+                continue
+            if mask & 15:
+                steps[i] |= (mask & 15) << shift
+            outer = mask >> OUTER_SHIFT
+            if not outer:
+                continue
+            y, x = divmod(i, cols)
+            for code in range(4):
+                if outer & (1 << code):
+                    # В клетку через сторону code входят из соседа ходом code ^ 1
+                    dx, dy = DIR_DELTA[code]
+                    nx, ny = x + dx, y + dy
+                    if 0 <= nx < cols and 0 <= ny < rows:
+                        steps[ny * cols + nx] |= (1 << (code ^ 1)) << shift
+    return steps
+
+
+# =============================================================================
+# ПРОВЕРКА ПРОХОДИМОСТИ
+# =============================================================================
+
+def is_path_clear(current_pos, next_pos, barriers_data):
+    if not barriers_data:
+        return True
+    
+    if isinstance(barriers_data, BarrierIndex):
+        return barriers_data.is_path_clear(current_pos, next_pos)
+
+    cx, cy = current_pos
+    nx, ny = next_pos
+    
+    if nx > cx: move_dir = "right"
+    elif nx < cx: move_dir = "left"
+    elif ny > cy: move_dir = "down"
+    elif ny < cy: move_dir = "up"
+    else: return True
+    
+    opposite = {"right": "left", "left": "right", "down": "up", "up": "down"}
+    entry_side = opposite[move_dir]
+
+    for b_pos, b_side, b_type in barriers_data:
+        if tuple(current_pos) == b_pos and b_side == move_dir and b_type in ["inner", "both"]:
+            return False
+        if tuple(next_pos) == b_pos and b_side == entry_side and b_type in ["outer", "both"]:
+            return False
+    return True
+
+
+# =============================================================================
+# ПРОВЕРКА ЯДА НА ГРАНИЦАХ УРОВНЯ
+# =============================================================================
+
+def check_poison_on_exit(current_pos, move_dir, poison_data):
+    """
+    Проверяет, есть ли яд при попытке выйти из клетки (inner barrier).
+    Вызывается ПЕРЕД проверкой валидности целевой позиции.
+    """
+    if not poison_data:
+        return False
+    
+    if isinstance(poison_data, BarrierIndex):
+        return poison_data.blocks_exit(current_pos, move_dir)
+    
+    for b_pos, b_side, b_type in poison_data:
+        if tuple(current_pos) == b_pos and b_side == move_dir and b_type in ["inner", "both"]:
+            return True
+    return False
+
+
+def check_poison_on_entry(next_pos, move_dir, poison_data, grid_cols, grid_rows):
+    """
+    Проверяет, есть ли яд при попытке войти в клетку (outer barrier).
+    Также проверяет границы уровня.
+    """
+    if not poison_data:
+        return False
+    
+    opposite = {"right": "left", "left": "right", "down": "up", "up": "down"}
+    entry_side = opposite.get(move_dir, move_dir)
+    
+    nx, ny = next_pos
+    
+    # Проверка выхода за границы - если есть outer яд на текущей клетке
+    if not (0 <= nx < grid_cols and 0 <= ny < grid_rows):
+        return False  # За границей нет яда по entry, только по exit
+    
+    if isinstance(poison_data, BarrierIndex):
+        return poison_data.blocks_entry(next_pos, entry_side)
+    
+    for b_pos, b_side, b_type in poison_data:
+        if tuple(next_pos) == b_pos and b_side == entry_side and b_type in ["outer", "both"]:
+            return True
+    
+    return False
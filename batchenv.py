@@ -0,0 +1,744 @@
+"""
+Пакетная среда для автоматических игроков: N независимых агентов на одном уровне.
+
+Состояние всех агентов хранится массивами NumPy (позиции, счётчики посещений,
+раскладки коробок), и step(actions) делает ход всех агентов одним векторным
+вызовом: стены и яд проверяются по таблице barriers.step_masks, коробки и
+связанные группы толкаются по правилам MovableManager, победа - по условиям
+уровня. Ход агента совпадает с Engine.apply_move: смерть возвращает агента
+на старт.
+
+Поддерживаются все условия ConditionTracker; sequence идёт по таблицам того же
+автомата SequenceMatcher, состояние автомата и счётчики вхождений - у каждого
+агента свои.
+
+Использование:
+    env = BatchEnv(lvl, n_agents=4096)
+    result = env.step(actions)      # actions[N] - коды направлений barriers.UP...
+    result['won']                   # bool[N]
+"""
+
+import numpy as np
+
+import movable
+from barriers import DIR_DELTA, step_masks
+from conditions import OPERATORS, SequenceMatcher, normalize_moves, parse_steps, resolve_cells
+from levels import calculate_target_pos
+
+DIR_BITS = np.array([1, 2, 4, 8], dtype=np.uint8)
+EMPTY = -1      # пустая клетка в раскладке коробок
+
+
+# =============================================================================
+# УСЛОВИЯ
+# =============================================================================
+#
+# Каждое условие компилируется в векторный трекер с методами:
+#   reset(idx)                      - агенты idx вернулись на старт
+#   enter(idx, cells, counts, runs) - агенты idx сделали шаг в клетки cells;
+#                                     counts - посещения клетки с учётом шага,
+#                                     runs - длина серии стояния в клетке
+#   satisfied()                     - bool[N]
+# Как и в ConditionTracker, заблокированный ход - тоже шаг в текущую клетку.
+
+class _VecStatic:
+    """Условие, которое вычисляется по текущему состоянию без счётчиков."""
+
+    def __init__(self, func):
+        self.func = func
+
+    def reset(self, idx):
+        pass
+
+    def enter(self, idx, cells, counts, runs):
+        pass
+
+    def satisfied(self):
+        return self.func()
+
+
+def _count_interval(cond):
+    """
+    Предикат счётчика посещений (_visit_predicate) как (lo, hi, negate):
+    v подходит, если (lo <= v <= hi) != negate. Так все условия visit уровня
+    проверяются одной векторной операцией.
+    """
+    top = np.iinfo(np.int32).max
+    if "min" in cond or "max" in cond:
+        return cond.get("min", 0), cond.get("max", top), False
+    count = cond.get("count", 1)
+    default_op = "==" if count == 0 else ">="
+    op = cond.get("operator", default_op)
+    op = op if op in OPERATORS else default_op
+    return {
+        "==": (count, count, False), "=": (count, count, False), "!=": (count, count, True),
+        ">=": (count, top, False), ">": (count + 1, top, False),
+        "<=": (-1, count, False), "<": (-1, count - 1, False),
+    }[op]
+
+
+class _VecVisits:
+    """
+    Все условия visit уровня сразу: у агента по счётчику на условие -
+    сколько клеток набора удовлетворяют условию (как _VisitTracker.ok).
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.specs = []
+
+    def add(self, cond, cells):
+        """Регистрирует условие. Returns: номер столбца счётчика."""
+        cells = [self.env.cell_index(c) for c in dict.fromkeys(cells)]
+        self.specs.append((cells, _count_interval(cond)))
+        return len(self.specs) - 1
+
+    def build(self):
+        env = self.env
+        count = len(self.specs)
+        member = np.zeros((env.cells + 1, count), dtype=np.int8)
+        for column, (cells, _) in enumerate(self.specs):
+            member[[c for c in cells if c < env.cells], column] = 1
+        self.sizes = np.array([len(cells) for cells, _ in self.specs], dtype=np.int32)
+        intervals = [interval for _, interval in self.specs]
+        lo = np.array([i[0] for i in intervals], dtype=np.int64)
+        hi = np.array([i[1] for i in intervals], dtype=np.int64)
+        negate = np.array([i[2] for i in intervals], dtype=bool)
+        self.pred = lambda v: ((v >= lo) & (v <= hi)) != negate
+
+        # Выше всех конечных границ предикат не меняется - счётчики дальше неразличимы
+        # Счётчики посещений - uint16, выше его границы кап не нужен
+        bounds = [b for i in intervals for b in i[:2] if 0 <= b < 2 ** 20]
+        self.cap = min(max(bounds, default=0) + 2, np.iinfo(np.uint16).max)
+        v = np.arange(self.cap + 1)[:, None]
+        change = self.pred(v).astype(np.int8) - self.pred(v - 1)
+        change[-1] = 0
+        # Изменение счётчиков при шаге в клетку с данным числом посещений: [клетка, посещения]
+        self.delta = member[:, None, :] * change[None, :, :]
+        self.watch = member.any(axis=1)
+        self.ok = np.zeros((env.n_agents, count), dtype=np.int32)
+
+    def reset(self, idx):
+        self.ok[idx] = self.sizes * self.pred(0)
+
+    def enter(self, idx, cells, counts):
+        if not len(self.specs):
+            return
+        watched = self.watch[cells]
+        if not watched.any():
+            return
+        counts = np.minimum(counts[watched], self.cap)
+        self.ok[idx[watched]] += self.delta[cells[watched], counts]
+
+
+class _VecVisit(_VecStatic):
+    def __init__(self, env, cond, cells):
+        visits = env.visit_sets
+        column = visits.add(cond, cells)
+        if cond.get("match", "all") == "any":
+            func = lambda: visits.ok[:, column] > 0
+        else:
+            func = lambda: visits.ok[:, column] == visits.sizes[column]
+        super().__init__(func)
+
+
+class _VecOrder:
+    def __init__(self, env, cells):
+        order = [env.cell_index(c) for c in cells]
+        self.watch = env.cell_lut(order)
+        # Курсор за концом порядка указывает на метку, не равную ни одной клетке
+        self.order = np.array(order + [-1], dtype=np.int32)
+        self.cursor = np.zeros(env.n_agents, dtype=np.int32)
+        self.broken = np.zeros(env.n_agents, dtype=bool)
+
+    def reset(self, idx):
+        self.cursor[idx] = 0
+        self.broken[idx] = False
+
+    def enter(self, idx, cells, counts, runs):
+        # Первое посещение: либо следующая клетка порядка, либо порядок нарушен
+        first = (counts == 1) & self.watch[cells]
+        if not first.any():
+            return
+        agents, cells = idx[first], cells[first]
+        live = ~self.broken[agents]
+        agents, cells = agents[live], cells[live]
+        hit = self.order[self.cursor[agents]] == cells
+        self.cursor[agents[hit]] += 1
+        self.broken[agents[~hit]] = True
+
+    def satisfied(self):
+        return ~self.broken & (self.cursor == len(self.order) - 1)
+
+
+class _VecConsecutive:
+    def __init__(self, env, cond, cells):
+        cells = list(dict.fromkeys(env.cell_index(c) for c in cells))
+        self.count = cond.get("count", 2)
+        self.reduce = np.any if cond.get("match", "all") == "any" else np.all
+        self.slot = np.full(env.cells + 1, -1, dtype=np.int32)
+        self.slot[cells] = np.arange(len(cells))
+        self.slot[env.cells] = -1
+        self.reached = np.zeros((env.n_agents, len(cells)), dtype=bool)
+
+    def reset(self, idx):
+        self.reached[idx] = False
+
+    def enter(self, idx, cells, counts, runs):
+        if self.count <= 0:
+            return
+        slot = self.slot[cells]
+        hit = (runs == self.count) & (slot >= 0)
+        self.reached[idx[hit], slot[hit]] = True
+
+    def satisfied(self):
+        if self.count <= 0:
+            # Серия длиной 0 есть у любой клетки
+            return np.ones(len(self.reached), dtype=bool)
+        return self.reduce(self.reached, axis=1)
+
+
+class _VecAtSteps:
+    def __init__(self, env, cond, cells):
+        cells = list(dict.fromkeys(env.cell_index(c) for c in cells))
+        self.env = env
+        self.columns = np.array(cells, dtype=np.intp)
+        self.reduce = np.any if cond.get("match", "all") == "any" else np.all
+        self.avoid = cond.get("mode", "require") == "avoid"
+        self.slot = np.full(env.cells + 1, -1, dtype=np.int32)
+        self.slot[cells] = np.arange(len(cells))
+        self.slot[env.cells] = -1
+
+        target_steps = parse_steps(cond)
+        if target_steps.is_finite:
+            # Клетка должна быть занята на всех целевых шагах; за последним - ложь
+            self.required_hits = len(target_steps)
+            self.lut = np.zeros(max(target_steps, default=-1) + 2, dtype=bool)
+            self.lut[[s for s in target_steps if s >= 0]] = True
+            self.step_pred = lambda steps: self.lut[np.minimum(steps, len(self.lut) - 1)]
+        else:
+            # step_expr: предикат считается по разным номерам шагов, их мало
+            self.required_hits = None
+            pred = target_steps.__contains__
+
+            def step_pred(steps):
+                unique, inverse = np.unique(steps, return_inverse=True)
+                return np.array([pred(int(s)) for s in unique], dtype=bool)[inverse]
+            self.step_pred = step_pred
+
+        self.violated = np.zeros(env.n_agents, dtype=bool)
+        self.hits = np.zeros((env.n_agents, len(cells)), dtype=np.int32)
+
+    def reset(self, idx):
+        self.violated[idx] = False
+        self.hits[idx] = 0
+
+    def enter(self, idx, cells, counts, runs):
+        slot = self.slot[cells]
+        watched = slot >= 0
+        if not watched.any():
+            return
+        idx, slot = idx[watched], slot[watched]
+        hit = self.step_pred(self.env.steps[idx])
+        if self.avoid:
+            self.violated[idx[hit]] = True
+        else:
+            self.hits[idx[hit], slot[hit]] += 1
+
+    def satisfied(self):
+        if self.avoid:
+            return ~self.violated
+        if self.required_hits is None:
+            ok = self.hits > 0
+        else:
+            ok = (self.env.visits[:, self.columns] > 0) & (self.hits == self.required_hits)
+        return self.reduce(ok, axis=1)
+
+
+class _VecSequences:
+    """
+    Общий автомат последовательностей уровня: таблицы SequenceMatcher
+    в массивах и состояние автомата у каждого агента.
+    """
+
+    def __init__(self, n_agents):
+        self.n_agents = n_agents
+        self.matcher = SequenceMatcher()
+
+    def build(self):
+        matcher = self.matcher
+        matcher.build()
+        n = self.n_agents
+        count = len(matcher.patterns)
+        self.size = count
+        self.goto = np.array(matcher.goto or [[0] * 4], dtype=np.int32)
+        self.out = np.zeros((len(self.goto), count), dtype=bool)
+        for state, pids in enumerate(matcher.outputs):
+            self.out[state, list(pids)] = True
+        self.lengths = np.array([len(p) for p in matcher.patterns], dtype=np.int32)
+
+        self.state = np.zeros(n, dtype=np.int32)
+        self.overlapping = np.zeros((n, count), dtype=np.int32)
+        self.non_overlapping = np.zeros((n, count), dtype=np.int32)
+        self.last_end = np.full((n, count), -1, dtype=np.int32)
+        self.started = np.zeros((n, count), dtype=bool)
+
+    def reset(self, idx):
+        self.state[idx] = 0
+        self.overlapping[idx] = 0
+        self.non_overlapping[idx] = 0
+        self.last_end[idx] = -1
+        self.started[idx] = False
+
+    def push(self, idx, moves, length):
+        """Ход moves агентов idx; length - длина истории с этим ходом."""
+        if not self.size:
+            return
+        state = self.goto[self.state[idx], moves]
+        self.state[idx] = state
+        out = self.out[state]
+        end = (length - 1)[:, None]
+        self.overlapping[idx] += out
+        last_end = self.last_end[idx]
+        counted = out & (end - self.lengths >= last_end)
+        self.non_overlapping[idx] += counted
+        self.last_end[idx] = np.where(counted, end, last_end)
+        self.started[idx] |= out & (self.lengths == length[:, None])
+
+
+class _VecSequence:
+    def __init__(self, env, cond, sequences):
+        self.env = env
+        self.seq = sequences
+        self.mode = cond.get("mode", "contains")
+        self.overlapping = cond.get("overlapping", False)
+        self.count_target = cond.get("count", 1)
+        self.op_func = OPERATORS.get(cond.get("operator", ">="), OPERATORS[">="])
+        self.min_count = cond.get("min", None)
+        self.max_count = cond.get("max", None)
+
+        if "any" in cond:
+            self.logic, specs = np.logical_or, cond["any"]
+        elif "all" in cond:
+            self.logic, specs = np.logical_and, cond["all"]
+        else:
+            self.logic, specs = np.logical_and, [cond.get("moves", "")]
+        self.pids = [sequences.matcher.add(normalize_moves(s)) for s in specs]
+
+    def reset(self, idx):
+        pass
+
+    def enter(self, idx, cells, counts, runs):
+        pass
+
+    def _check_single(self, pid):
+        seq = self.seq
+        if pid is None:
+            return np.ones(self.env.n_agents, dtype=bool)
+        ends = seq.out[seq.state, pid]
+        if self.mode == "exact":
+            return ends & (self.env.steps == seq.lengths[pid])
+        elif self.mode == "starts_with":
+            return seq.started[:, pid]
+        elif self.mode == "ends_with":
+            return ends
+
+        counts = seq.overlapping if self.overlapping else seq.non_overlapping
+        actual_count = counts[:, pid]
+        if self.mode == "not_contains":
+            if self.max_count is not None:
+                return actual_count <= self.max_count
+            return actual_count == 0
+        if self.min_count is not None and self.max_count is not None:
+            return (actual_count >= self.min_count) & (actual_count <= self.max_count)
+        elif self.min_count is not None:
+            return actual_count >= self.min_count
+        elif self.max_count is not None:
+            return actual_count <= self.max_count
+        return self.op_func(actual_count, self.count_target)
+
+    def satisfied(self):
+        return self.logic.reduce([self._check_single(pid) for pid in self.pids])
+
+
+class _VecNoRevisit:
+    def __init__(self, env, exceptions):
+        self.exceptions = env.cell_lut(env.cell_index(c) for c in exceptions)
+        self.violated = np.zeros(env.n_agents, dtype=bool)
+
+    def reset(self, idx):
+        self.violated[idx] = False
+
+    def enter(self, idx, cells, counts, runs):
+        self.violated[idx[(counts == 2) & ~self.exceptions[cells]]] = True
+
+    def satisfied(self):
+        return ~self.violated
+
+
+class _VecGroup(_VecStatic):
+    def __init__(self, env, logic, children):
+        self.children = children
+        true = lambda: np.ones(env.n_agents, dtype=bool)
+        false = lambda: np.zeros(env.n_agents, dtype=bool)
+
+        def func():
+            results = [c.satisfied() for c in children]
+            if logic == "AND":
+                return np.logical_and.reduce(results) if results else true()
+            if logic == "OR":
+                return np.logical_or.reduce(results) if results else false()
+            if logic == "NOT":
+                return ~results[0] if results else true()
+            if logic == "XOR":
+                return np.sum(results, axis=0) == 1 if results else false()
+            return false()
+        super().__init__(func)
+
+    def reset(self, idx):
+        for child in self.children:
+            child.reset(idx)
+
+    def enter(self, idx, cells, counts, runs):
+        for child in self.children:
+            child.enter(idx, cells, counts, runs)
+
+
+# =============================================================================
+# СРЕДА
+# =============================================================================
+
+class BatchEnv:
+    """
+    N независимых агентов на одном обработанном уровне (результат process_level_data).
+
+    Состояние (массивы длины N по первой оси):
+        pos      - клетка агента, y * cols + x
+        steps    - шагов с последнего старта
+        runs     - длина серии стояния в текущей клетке
+        visits   - посещения клеток, uint16[N, cells + 1]
+                   (последний столбец - клетки вне сетки, всегда 0)
+        boxes    - раскладка коробок: box_id по клеткам или EMPTY (None - коробок нет)
+        box_pos  - клетка каждой коробки
+    """
+
+    def __init__(self, lvl, n_agents, auto_reset=True):
+        """
+        Args:
+            lvl: обработанный уровень
+            n_agents: число агентов
+            auto_reset: агенты, прошедшие уровень, сразу возвращаются на старт
+        """
+        self.n_agents = n_agents
+        self.auto_reset = auto_reset
+        self.cols, self.rows = lvl.get("grid", (16, 12))
+        self.cells = self.cols * self.rows
+        self.start = self.cell_index(lvl["start"])
+
+        # Таблицы клеток: сосед по направлению (-1 - за сеткой), барьеры ходов, яд на выходе
+        x = np.arange(self.cells) % self.cols
+        y = np.arange(self.cells) // self.cols
+        self._nbr = np.empty((self.cells, 4), dtype=np.int32)
+        for code, (dx, dy) in enumerate(DIR_DELTA):
+            nx, ny = x + dx, y + dy
+            inside = (nx >= 0) & (nx < self.cols) & (ny >= 0) & (ny < self.rows)
+            self._nbr[:, code] = np.where(inside, ny * self.cols + nx, -1)
+        self._steps = np.frombuffer(step_masks(lvl["walls_index"], lvl["poison_index"],
+                                               self.cols, self.rows), dtype=np.uint8)
+        # Строка для индекса вне сетки (коробки за краем): ходов нет
+        self._nbr = np.vstack([self._nbr, np.full((1, 4), -1, dtype=np.int32)])
+        self._steps = np.append(self._steps, np.uint8(0))
+        self._exit = np.frombuffer(lvl["poison_index"].masks, dtype=np.uint8) & 15
+
+        self._build_boxes(movable.parse_movable_data(lvl.get("movable", [])))
+
+        self.pos = np.zeros(n_agents, dtype=np.int32)
+        self.steps = np.zeros(n_agents, dtype=np.int32)
+        self.runs = np.zeros(n_agents, dtype=np.int32)
+        self.visits = np.zeros((n_agents, self.cells + 1), dtype=np.uint16)
+        self._visits_flat = self.visits.reshape(-1)
+        self._row_base = np.arange(n_agents, dtype=np.intp) * (self.cells + 1)
+        self._all = np.arange(n_agents)
+
+        self.sequences = _VecSequences(n_agents)
+        self.visit_sets = _VecVisits(self)
+        self.conditions = [self._compile(c) for c in self._level_conditions(lvl)]
+        self.sequences.build()
+        self.visit_sets.build()
+        self.reset()
+
+    # =========================================================================
+    # ПОСТРОЕНИЕ
+    # =========================================================================
+
+    def cell_index(self, pos):
+        """Клетка (x, y) -> индекс; клетки вне сетки - общий индекс cells."""
+        x, y = pos
+        if 0 <= x < self.cols and 0 <= y < self.rows:
+            return y * self.cols + x
+        return self.cells
+
+    def cell_lut(self, cells):
+        """bool[cells + 1]: True для перечисленных индексов клеток (кроме индекса вне сетки)."""
+        lut = np.zeros(self.cells + 1, dtype=bool)
+        lut[list(cells)] = True
+        lut[self.cells] = False
+        return lut
+
+    def _build_boxes(self, manager):
+        boxes = manager.boxes
+        self.n_boxes = len(boxes)
+        # Лишний последний элемент: индекс EMPTY (-1) попадает в него
+        self._box_group = np.array([-1 if b.group_id is None else b.group_id for b in boxes] + [-1],
+                                   dtype=np.int32)
+        self._box_blocked = np.array([b.blocked_mask for b in boxes] + [0], dtype=np.uint8)
+        self._can_push = np.array([b.can_push for b in boxes] + [False], dtype=bool)
+        self._can_be_pushed = np.array([b.can_be_pushed_by for b in boxes] + [False], dtype=bool)
+        self._group_members = {
+            group_id: np.array([obj.box_id for obj in objs], dtype=np.intp)
+            for group_id, objs in manager.group_members.items()
+        }
+
+        self._initial_boxes = np.full(self.cells, EMPTY,
+                                      dtype=np.int16 if self.n_boxes < 2 ** 15 else np.int32)
+        self._initial_box_pos = np.zeros(self.n_boxes, dtype=np.int32)
+        for pos, box_id in manager.initial_layout.items():
+            cell = self.cell_index(pos)
+            if cell < self.cells:
+                self._initial_boxes[cell] = box_id
+            self._initial_box_pos[box_id] = cell
+
+        if self.n_boxes:
+            self.boxes = np.tile(self._initial_boxes, (self.n_agents, 1))
+            self.box_pos = np.tile(self._initial_box_pos, (self.n_agents, 1))
+        else:
+            self.boxes = self.box_pos = None
+
+    def _level_conditions(self, lvl):
+        """Условия уровня; для старого type="sequence" - как в Engine.load_level."""
+        conditions = list(lvl.get("conditions", []))
+        if lvl.get("type") == "sequence" and "ans" in lvl:
+            ans_moves = lvl.get("ans", "")
+            if not any(c.get("check") == "sequence" for c in conditions):
+                conditions.append({"check": "sequence", "moves": ans_moves, "mode": "exact"})
+            if not any(c.get("check") == "end_at" for c in conditions):
+                target = calculate_target_pos(lvl["start"], ans_moves, self.cols, self.rows)
+                conditions.append({"check": "end_at", "cells": [list(target)]})
+        return conditions
+
+    def _compile(self, cond):
+        check = cond.get("check", "")
+        cells = resolve_cells(cond.get("cells", []), self.cols, self.rows)
+
+        if check == "group":
+            children = [self._compile(item) for item in cond.get("items", [])]
+            return _VecGroup(self, cond.get("logic", "AND").upper(), children)
+        if check == "visit":
+            return _VecVisit(self, cond, cells)
+        if check == "end_at":
+            lut = self.cell_lut(self.cell_index(c) for c in cells)
+            return _VecStatic(lambda: lut[self.pos])
+        if check == "order":
+            return _VecOrder(self, cells)
+        if check == "consecutive":
+            return _VecConsecutive(self, cond, cells)
+        if check == "no_revisit":
+            return _VecNoRevisit(self, resolve_cells(cond.get("except", []), self.cols, self.rows))
+        if check == "total_steps":
+            count = cond.get("count", 0)
+            op_func = OPERATORS.get(cond.get("operator", "=="), OPERATORS["=="])
+            return _VecStatic(lambda: op_func(self.steps, count))
+        if check == "sequence":
+            return _VecSequence(self, cond, self.sequences)
+        if check == "at_steps":
+            return _VecAtSteps(self, cond, cells)
+        return _VecStatic(lambda: np.zeros(self.n_agents, dtype=bool))
+
+    # =========================================================================
+    # СБРОС И ХОДЫ
+    # =========================================================================
+
+    def reset(self, idx=None):
+        """Возвращает агентов idx (по умолчанию всех) на старт уровня."""
+        idx = self._all if idx is None else np.asarray(idx, dtype=np.intp)
+        self.pos[idx] = self.start
+        self.steps[idx] = 0
+        self.runs[idx] = 1
+        self.visits[idx] = 0
+        if self.n_boxes:
+            self.boxes[idx] = self._initial_boxes
+            self.box_pos[idx] = self._initial_box_pos
+        self.sequences.reset(idx)
+        self.visit_sets.reset(idx)
+        for tracker in self.conditions:
+            tracker.reset(idx)
+        self._enter(idx, self.pos[idx])
+
+    def _enter(self, idx, cells, sel=None):
+        """Шаг агентов idx в клетки cells; sel - те же агенты срезом (без копий), если это все."""
+        sel = idx if sel is None else sel
+        flat = self._row_base[sel] + cells
+        counts = self._visits_flat[flat] + 1
+        self._visits_flat[flat] = counts
+        runs = self.runs[sel]
+        self.visit_sets.enter(idx, cells, counts)
+        for tracker in self.conditions:
+            tracker.enter(idx, cells, counts, runs)
+
+    def step(self, actions):
+        """
+        Ход всех агентов.
+
+        Args:
+            actions: коды направлений (barriers.UP, DOWN, LEFT, RIGHT), форма [N]
+        Returns:
+            dict массивов bool[N]:
+                'moved' - агент сменил клетку
+                'died' - агент погиб от яда и уже возвращён на старт
+                'won' - условия уровня выполнены после хода
+        """
+        a = np.asarray(actions, dtype=np.intp)
+        p = self.pos
+        bit = DIR_BITS[a]
+        blocked = self._steps[p]
+        target = self._nbr[p, a]
+
+        # Яд на выходе из клетки и на входе в соседнюю
+        died = (self._exit[p] & bit) != 0
+        inside = target >= 0
+        died |= inside & (((blocked >> 4) & bit) != 0)
+        moved = inside & ~died & ((blocked & bit) == 0)
+
+        if self.n_boxes:
+            agents = np.flatnonzero(moved)
+            occupant = self.boxes[agents, target[agents]]
+            pushing = occupant != EMPTY
+            if pushing.any():
+                agents = agents[pushing]
+                ok = self._push(agents, a[agents], target[agents], occupant[pushing])
+                moved[agents[~ok]] = False
+
+        new = np.where(moved, target, p)
+        if died.any():
+            idx = sel = np.flatnonzero(~died)
+            cells = new[idx]
+        else:
+            # Обычный случай - ходят все: срезы вместо выборки по индексам
+            idx, sel, cells = self._all, slice(None), new
+        self.runs[sel] = np.where(cells == p[sel], self.runs[sel] + 1, 1)
+        self.pos[sel] = cells
+        self.steps[sel] += 1
+        self.sequences.push(sel, a[sel], self.steps[sel])
+        self._enter(idx, cells, sel)
+
+        won = self.won() & ~died
+        if died.any():
+            self.reset(np.flatnonzero(died))
+        if self.auto_reset and won.any():
+            self.reset(np.flatnonzero(won))
+        return {'moved': moved, 'died': died, 'won': won}
+
+    def won(self):
+        """bool[N]: выполнены ли условия уровня (условия верхнего уровня - через AND)."""
+        result = np.ones(self.n_agents, dtype=bool)
+        for tracker in self.conditions:
+            result &= tracker.satisfied()
+        return result
+
+    # =========================================================================
+    # КОРОБКИ
+    # =========================================================================
+
+    def _push(self, agents, a, target, box_ids):
+        """
+        Толкает коробки в клетках target по направлениям a для агентов agents.
+        Returns: bool[len(agents)] - коробки сдвинулись.
+        """
+        # Сторона, с которой толкают, противоположна ходу
+        ok = (self._box_blocked[box_ids] & DIR_BITS[a ^ 1]) == 0
+        group = self._box_group[box_ids]
+        single = ok & (group < 0)
+        if single.any():
+            ok[single] = self._push_chain(agents[single], a[single], target[single],
+                                          box_ids[single])
+        grouped = ok & (group >= 0)
+        if grouped.any():
+            ok[grouped] = self._push_groups(agents[grouped], a[grouped], group[grouped])
+        return ok
+
+    def _push_chain(self, agents, a, start, box_ids):
+        """Цепочки одиночных коробок: обход вперёд по всем агентам сразу, затем сдвиг с конца."""
+        ok = np.ones(len(agents), dtype=bool)
+        push_bits = DIR_BITS[a ^ 1]
+        step_bits = DIR_BITS[a] * np.uint8(0x11)    # стена или яд на пути коробки
+        cur, last = start.copy(), box_ids.copy()
+        walking = np.arange(len(agents))
+        chain = [(walking, start)]                   # по глубине: (номера агентов, клетки)
+
+        while walking.size:
+            cells = cur[walking]
+            nxt = self._nbr[cells, a[walking]]
+            bad = (nxt < 0) | ((self._steps[cells] & step_bits[walking]) != 0)
+            ok[walking[bad]] = False
+            walking, nxt = walking[~bad], nxt[~bad]
+
+            next_id = self.boxes[agents[walking], nxt]
+            more = next_id != EMPTY
+            walking, nxt, next_id = walking[more], nxt[more], next_id[more]
+
+            fail = (self._box_group[next_id] >= 0) | ~self._can_push[last[walking]] \
+                | ~self._can_be_pushed[next_id] | ((self._box_blocked[next_id] & push_bits[walking]) != 0)
+            ok[walking[fail]] = False
+            walking = walking[~fail]
+            cur[walking] = nxt[~fail]
+            last[walking] = next_id[~fail]
+            if walking.size:
+                chain.append((walking, cur[walking]))
+
+        # Сдвиг с конца цепочки: клетка назначения всегда уже пуста
+        for members, cells in reversed(chain):
+            keep = ok[members]
+            members, cells = members[keep], cells[keep]
+            if not members.size:
+                continue
+            rows = agents[members]
+            dest = self._nbr[cells, a[members]]
+            moving = self.boxes[rows, cells]
+            self.boxes[rows, dest] = moving
+            self.boxes[rows, cells] = EMPTY
+            self.box_pos[rows, moving] = dest
+        return ok
+
+    def _push_groups(self, agents, a, groups):
+        """Связанные группы двигаются целиком: проверка всех членов группы разом."""
+        ok = np.zeros(len(agents), dtype=bool)
+        for group_id in np.unique(groups):
+            sel = np.flatnonzero(groups == group_id)
+            members = self._group_members[group_id]
+            rows, d = agents[sel], a[sel]
+            cells = self.box_pos[rows][:, members]
+            dest = self._nbr[cells, d[:, None]]
+            good = (dest >= 0).all(axis=1)
+            good &= ((self._steps[cells] & (DIR_BITS[d] * np.uint8(0x11))[:, None]) == 0).all(axis=1)
+            # Другой объект (не из нашей группы)
+            occupant = self.boxes[rows[:, None], np.maximum(dest, 0)]
+            good &= ((occupant == EMPTY) | (self._box_group[occupant] == group_id)).all(axis=1)
+            ok[sel] = good
+
+            rows, cells, dest = rows[good][:, None], cells[good], dest[good]
+            self.boxes[rows, cells] = EMPTY
+            self.boxes[rows, dest] = members
+            self.box_pos[rows, members] = dest
+        return ok
+
+    # =========================================================================
+    # СОСТОЯНИЕ
+    # =========================================================================
+
+    @property
+    def x(self):
+        return self.pos % self.cols
+
+    @property
+    def y(self):
+        return self.pos // self.cols
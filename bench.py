@@ -0,0 +1,137 @@
+"""
+Замер скорости горячих путей логики: ход движка и толкание коробок.
+
+Сценарии:
+    pack  - случайные ходы step/unstep по каждому уровню пака
+    boxes - случайные ходы apply_move на синтетическом уровне
+            с коробками, группами, стенами и ядом
+    batch, batch-boxes - то же для BatchEnv (нужен NumPy): случайные
+            ходы всех агентов, счёт в агенто-ходах
+
+Использование:
+    python bench.py
+    python bench.py levels.json --moves 200000 --repeat 5 --seed 1
+"""
+
+import argparse
+import contextlib
+import random
+import sys
+import time
+
+from engine import Engine
+from levels import load_levels_from_file, process_level_data
+
+MOVES = "udlr"
+
+
+def box_level(size=40, seed=0):
+    """Синтетический уровень: сетка size x size, коробки, связанные группы, стены и яд."""
+    rng = random.Random(seed)
+    cell = lambda: [rng.randrange(size), rng.randrange(size)]
+    start = [size // 2, size // 2]
+    boxes = [c for c in (cell() for _ in range(size * size // 6)) if c != start]
+    groups = [{"range": [[x, y], [x + 1, y]], "connected": True, "blocked": "u"}
+              for x, y in (cell() for _ in range(size // 4)) if x + 1 < size]
+    return {
+        "name": "bench",
+        "type": "condition",
+        "grid": [size, size],
+        "start": start,
+        "conditions": [{"check": "end_at", "cells": [[0, 0]]}],
+        "walls": [{"cells": [cell() for _ in range(size * 2)], "sides": "ud", "type": "both"}],
+        "poison": [{"cells": [cell() for _ in range(size // 2)], "sides": "l", "type": "inner"}],
+        "movable": [{"cells": boxes, "blocked": "l", "can_push": True}] + groups,
+    }
+
+
+def bench_pack(levels, moves, seed):
+    """Случайное блуждание step/unstep: Returns: (ходов, секунд)."""
+    rng = random.Random(seed)
+    engine = Engine(max_history=1)
+    per_level = max(1, moves // max(1, len(levels)))
+    done = 0
+    started = time.perf_counter()
+    for lvl in levels:
+        engine.load_level(lvl)
+        stack = []
+        for _ in range(per_level):
+            if stack and (len(stack) > 50 or rng.random() < 0.3):
+                engine.unstep(stack.pop())
+            else:
+                record = engine.step(rng.choice(MOVES))
+                if record is not None:
+                    stack.append(record)
+            done += 1
+    return done, time.perf_counter() - started
+
+
+def bench_boxes(moves, seed):
+    """Случайные ходы apply_move с толканием коробок: Returns: (ходов, секунд)."""
+    rng = random.Random(seed)
+    engine = Engine(max_history=1000)
+    with contextlib.redirect_stdout(sys.stderr):
+        engine.load_level(process_level_data([box_level(seed=seed)])[0])
+    sequence = [rng.choice(MOVES) for _ in range(moves)]
+    started = time.perf_counter()
+    for move in sequence:
+        engine.apply_move(move)
+    return moves, time.perf_counter() - started
+
+
+def bench_batch(levels, agents, steps, seed):
+    """Случайные ходы BatchEnv по уровням: Returns: (агенто-ходов, секунд)."""
+    import numpy as np
+    from batchenv import BatchEnv
+
+    rng = np.random.default_rng(seed)
+    done, elapsed = 0, 0.0
+    for lvl in levels:
+        env = BatchEnv(lvl, agents)
+        actions = rng.integers(0, 4, size=(steps, agents))
+        started = time.perf_counter()
+        for row in actions:
+            env.step(row)
+        elapsed += time.perf_counter() - started
+        done += steps * agents
+    return done, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер скорости логики ходов")
+    parser.add_argument("pack", nargs="?", default="levels.json", help="пак уровней для сценария pack")
+    parser.add_argument("--moves", type=int, default=100000, help="ходов на сценарий")
+    parser.add_argument("--agents", type=int, default=4096, help="агентов в сценариях batch")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов, берётся лучший")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(sys.stderr):
+        levels = load_levels_from_file(args.pack, is_internal=False)
+    if not levels:
+        print(f"[ERROR] Не удалось загрузить пак: {args.pack}", file=sys.stderr)
+        return 2
+
+    scenarios = [("pack", bench_pack, (levels, args.moves, args.seed)),
+                 ("boxes", bench_boxes, (args.moves, args.seed))]
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        print("[INFO] NumPy не установлен - сценарии batch пропущены", file=sys.stderr)
+    else:
+        with contextlib.redirect_stdout(sys.stderr):
+            boxes = process_level_data([box_level(seed=args.seed)])
+        batch_steps = max(1, args.moves // args.agents)
+        scenarios += [("batch", bench_batch, (levels, args.agents, batch_steps, args.seed)),
+                      ("batch-boxes", bench_batch, (boxes, args.agents, batch_steps, args.seed))]
+
+    for name, func, func_args in scenarios:
+        # Лучший из повторов - меньше шума от планировщика и прогрева
+        done, elapsed = min((func(*func_args) for _ in range(max(1, args.repeat))),
+                            key=lambda run: run[1])
+        print(f"{name:11} {done / elapsed:>10.0f} ходов/с  {elapsed * 1e6 / done:6.3f} мкс/ход")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
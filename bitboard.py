@@ -0,0 +1,130 @@
+"""
+Битовые доски: множество клеток сетки - одно целое Python, бит y * cols + x.
+
+BitBoard строится по barriers.step_masks уровня и хранит для каждого
+направления маску клеток, из которых ход открыт (не выходит за сетку, нет
+стены и яда). Сдвиг всей доски на клетку - один сдвиг целого, поэтому
+проверка целой группы коробок и заливка достижимых клеток стоят
+O(размер доски / 64) на операцию, а не O(клеток) обращений к словарям.
+"""
+
+from barriers import UP, DOWN, LEFT, RIGHT
+
+
+class BitBoard:
+    """Проходимость уровня в битах и операции над множествами клеток."""
+
+    __slots__ = ("cols", "rows", "full", "open", "_shift")
+
+    def __init__(self, steps, cols, rows):
+        """
+        Args:
+            steps: barriers.step_masks уровня (байт на клетку)
+        """
+        self.cols = cols
+        self.rows = rows
+        self.full = (1 << (cols * rows)) - 1
+        # Сдвиг индекса клетки при ходе по направлению code
+        self._shift = (-cols, cols, -1, 1)
+
+        # Ход закрыт и стеной, и ядом: игрок через яд не проходит (гибнет),
+        # коробка не сдвигается (как box_blocked в Engine)
+        open_bits = [0, 0, 0, 0]
+        for i, mask in enumerate(steps):
+            y, x = divmod(i, cols)
+            bit = 1 << i
+            if y > 0 and not mask & 0x11:
+                open_bits[UP] |= bit
+            if y < rows - 1 and not mask & 0x22:
+                open_bits[DOWN] |= bit
+            if x > 0 and not mask & 0x44:
+                open_bits[LEFT] |= bit
+            if x < cols - 1 and not mask & 0x88:
+                open_bits[RIGHT] |= bit
+        self.open = tuple(open_bits)
+
+    # =========================================================================
+    # КЛЕТКИ
+    # =========================================================================
+
+    def bit(self, x, y):
+        return 1 << (y * self.cols + x)
+
+    def from_cells(self, cells):
+        """Доска из клеток (x, y); клетки вне сетки пропускаются."""
+        cols, rows = self.cols, self.rows
+        bits = 0
+        for x, y in cells:
+            if 0 <= x < cols and 0 <= y < rows:
+                bits |= 1 << (y * cols + x)
+        return bits
+
+    def cells(self, bits):
+        """Клетки (x, y) доски по возрастанию индекса. O(установленных битов)."""
+        cols = self.cols
+        while bits:
+            low = bits & -bits
+            yield divmod(low.bit_length() - 1, cols)[::-1]
+            bits ^= low
+
+    @staticmethod
+    def count(bits):
+        """Число клеток доски."""
+        return bin(bits).count("1")
+
+    def translate(self, bits, dx, dy):
+        """
+        Сдвиг доски на (dx, dy) без проверок. Верен, только если все клетки
+        остаются в сетке (например, позиции группы по сдвигу от начальных).
+        """
+        delta = dy * self.cols + dx
+        return bits << delta if delta >= 0 else bits >> -delta
+
+    # =========================================================================
+    # ХОДЫ
+    # =========================================================================
+
+    def step(self, bits, code):
+        """Клетки, куда попадают клетки доски ходом code (закрытые ходы отбрасываются)."""
+        bits &= self.open[code]
+        delta = self._shift[code]
+        return bits << delta if delta > 0 else bits >> -delta
+
+    def push_group(self, group, code, occupied):
+        """
+        Сдвиг связанной группы на клетку целиком.
+
+        Args:
+            group: доска клеток группы
+            occupied: доска всех объектов уровня (группа включительно)
+        Returns:
+            доска группы после сдвига или None, если хоть одна клетка упирается
+            в край, стену, яд или чужой объект
+        """
+        if group & ~self.open[code]:
+            return None
+        delta = self._shift[code]
+        moved = group << delta if delta > 0 else group >> -delta
+        if moved & occupied & ~group:
+            return None
+        return moved
+
+    def expand(self, bits, blocked=0):
+        """Доска плюс соседи, достижимые одним ходом, кроме клеток blocked."""
+        grown = bits
+        for code in (UP, DOWN, LEFT, RIGHT):
+            grown |= self.step(bits, code)
+        return grown & ~blocked
+
+    def reachable(self, start, blocked=0):
+        """
+        Заливка: все клетки, достижимые из доски start ходами без стен и яда,
+        не заходя в blocked. Односторонние барьеры учитываются. O(диаметр) сдвигов.
+        """
+        reached = start & ~blocked
+        frontier = reached
+        while frontier:
+            grown = self.expand(frontier, blocked)
+            frontier = grown & ~reached
+            reached |= frontier
+        return reached
@@ -0,0 +1,1168 @@
+"""
+Проверка условий победы.
+Полная проверка по всему пути (check_condition) и инкрементальный
+трекер условий (ConditionTracker), обновляемый на каждом ходу.
+"""
+
+from movable import zobrist_key
+
+# Метки zobrist_key для счётчиков посещений: клетка с n посещениями - _VISIT_TAG + n
+# (метки игрока и коробок - от 0 до числа коробок)
+_VISIT_TAG = 1 << 20
+
+# =============================================================================
+# УТИЛИТЫ
+# =============================================================================
+
+def resolve_cells(cells_spec, grid_cols, grid_rows):
+    if isinstance(cells_spec, list):
+        return [tuple(c) for c in cells_spec]
+    if cells_spec == "corners":
+        return [(0, 0), (grid_cols - 1, 0), (0, grid_rows - 1), (grid_cols - 1, grid_rows - 1)]
+    elif cells_spec == "edges":
+        edges = set()
+        for x in range(grid_cols): edges.add((x, 0)); edges.add((x, grid_rows - 1))
+        for y in range(grid_rows): edges.add((0, y)); edges.add((grid_cols - 1, y))
+        return list(edges)
+    elif cells_spec == "center":
+        return [(grid_cols // 2, grid_rows // 2)]
+    return []
+
+# =============================================================================
+# ВЫРАЖЕНИЯ ШАГОВ (step_expr)
+# =============================================================================
+
+class _PrimeSieve:
+    """Решето Эратосфена, которое растёт по мере запроса больших чисел."""
+
+    MAX_SIZE = 1 << 24  # дальше - проверка делением, без памяти под решето
+
+    def __init__(self):
+        self.flags = bytearray()
+        self._build(1024)
+
+    def _build(self, size):
+        flags = bytearray([1]) * size
+        flags[0:2] = b"\x00\x00"
+        i = 2
+        while i * i < size:
+            if flags[i]:
+                flags[i * i::i] = bytes(len(range(i * i, size, i)))
+            i += 1
+        self.flags = flags
+
+    def __contains__(self, n):
+        if n < 2:
+            return False
+        if n >= len(self.flags):
+            if n >= self.MAX_SIZE:
+                return _is_prime_trial(n)
+            self._build(min(self.MAX_SIZE, max(n + 1, len(self.flags) * 2)))
+        return bool(self.flags[n])
+
+
+def _is_prime_trial(n):
+    if n < 2: return False
+    if n == 2: return True
+    if n % 2 == 0: return False
+    for i in range(3, int(n**0.5) + 1, 2):
+        if n % i == 0: return False
+    return True
+
+_primes = _PrimeSieve()
+
+def is_prime(n):
+    return n in _primes
+
+def _compile_atom(expr):
+    if expr == "even": return lambda s: s % 2 == 0
+    elif expr == "odd": return lambda s: s % 2 == 1
+    elif expr == "prime": return is_prime
+    elif expr.startswith("div:"):
+        d = int(expr.split(":")[1])
+        return lambda s: s % d == 0
+    elif expr.startswith("mod:"):
+        parts = expr.split(":")
+        m, r = int(parts[1]), int(parts[2])
+        return lambda s: s % m == r
+    elif expr.startswith("range:"):
+        parts = expr.split(":")
+        lo, hi = int(parts[1]), int(parts[2])
+        return lambda s: lo <= s <= hi
+    elif expr.startswith("gt:"):
+        n = int(expr.split(":")[1])
+        return lambda s: s > n
+    elif expr.startswith("lt:"):
+        n = int(expr.split(":")[1])
+        return lambda s: s < n
+    elif expr.startswith("gte:"):
+        n = int(expr.split(":")[1])
+        return lambda s: s >= n
+    elif expr.startswith("lte:"):
+        n = int(expr.split(":")[1])
+        return lambda s: s <= n
+    return lambda s: False
+
+_step_expr_cache = {}
+
+def compile_step_expr(expr):
+    """
+    Компилирует step_expr в предикат step -> bool.
+    Результат кэшируется по строке выражения: разбор выполняется один раз.
+    Приоритет: "|" ниже "&", "!" - префикс атома.
+    """
+    cached = _step_expr_cache.get(expr)
+    if cached is not None:
+        return cached
+
+    text = expr.strip()
+    if "|" in text:
+        preds = [compile_step_expr(p.strip()) for p in text.split("|")]
+        pred = lambda s: any(p(s) for p in preds)
+    elif "&" in text:
+        preds = [compile_step_expr(p.strip()) for p in text.split("&")]
+        pred = lambda s: all(p(s) for p in preds)
+    elif text.startswith("!"):
+        inner = compile_step_expr(text[1:])
+        pred = lambda s: not inner(s)
+    else:
+        pred = _compile_atom(text)
+
+    _step_expr_cache[expr] = pred
+    return pred
+
+def eval_step_expr(expr, step):
+    return compile_step_expr(expr)(step)
+
+
+class StepSet:
+    """
+    Множество шагов условия at_steps.
+    Явные шаги (step/steps/step_range) хранятся как frozenset, step_expr -
+    как скомпилированный предикат, который проверяется лениво для любого шага.
+    """
+
+    def __init__(self, steps=(), predicate=None):
+        self.steps = frozenset(steps)
+        self.predicate = predicate
+
+    @property
+    def is_finite(self):
+        return self.predicate is None
+
+    def __contains__(self, step):
+        if self.predicate is not None:
+            return self.predicate(step)
+        return step in self.steps
+
+    def __len__(self):
+        if self.predicate is not None:
+            raise TypeError("StepSet со step_expr не имеет конечного размера")
+        return len(self.steps)
+
+    def __iter__(self):
+        if self.predicate is not None:
+            raise TypeError("StepSet со step_expr нельзя перечислить")
+        return iter(self.steps)
+
+    def issubset(self, other):
+        return all(s in other for s in self)
+
+def parse_steps(condition):
+    if "step_expr" in condition:
+        return StepSet(predicate=compile_step_expr(condition["step_expr"]))
+    result = set()
+    if "step" in condition: result.add(condition["step"])
+    if "steps" in condition: result.update(condition["steps"])
+    if "step_range" in condition:
+        start, end = condition["step_range"]
+        result.update(range(start, end + 1))
+    return StepSet(result)
+
+OPERATORS = {
+    "==": lambda a, b: a == b, ">=": lambda a, b: a >= b, "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b, "<": lambda a, b: a < b, "!=": lambda a, b: a != b,
+    "=": lambda a, b: a == b,
+}
+
+# =============================================================================
+# ПРОВЕРКА ПОСЛЕДОВАТЕЛЬНОСТИ ХОДОВ
+# =============================================================================
+
+def normalize_moves(moves_spec):
+    """Нормализует спецификацию ходов в список."""
+    if isinstance(moves_spec, str):
+        mapping = {"up": "u", "down": "d", "left": "l", "right": "r"}
+        result = []
+        for m in moves_spec.lower().split():
+            if m in mapping:
+                result.append(mapping[m])
+            elif m in ["u", "d", "l", "r"]:
+                result.append(m)
+        return result
+    elif isinstance(moves_spec, list):
+        mapping = {"up": "u", "down": "d", "left": "l", "right": "r"}
+        return [mapping.get(m.lower(), m.lower()) for m in moves_spec 
+                if m.lower() in ["u", "d", "l", "r", "up", "down", "left", "right"]]
+    return []
+
+
+def count_sequence_occurrences(history, seq, overlapping=False):
+    """
+    Подсчитывает количество вхождений последовательности.
+    
+    Args:
+        history: список ходов игрока
+        seq: искомая последовательность
+        overlapping: разрешить перекрывающиеся вхождения
+    """
+    if not seq or len(seq) > len(history):
+        return 0
+    
+    count = 0
+    i = 0
+    while i <= len(history) - len(seq):
+        if history[i:i+len(seq)] == seq:
+            count += 1
+            i += 1 if overlapping else len(seq)
+        else:
+            i += 1
+    return count
+
+
+def check_sequence_match(history, seq, mode, min_count=1):
+    """
+    Проверяет соответствие последовательности.
+    
+    Args:
+        history: список ходов игрока
+        seq: искомая последовательность
+        mode: "contains", "exact", "starts_with", "ends_with", "not_contains"
+        min_count: минимальное количество вхождений (для contains)
+    """
+    if not seq:
+        return True
+    
+    if mode == "exact":
+        return history == seq
+    elif mode == "starts_with":
+        return len(history) >= len(seq) and history[:len(seq)] == seq
+    elif mode == "ends_with":
+        return len(history) >= len(seq) and history[-len(seq):] == seq
+    elif mode == "not_contains":
+        return count_sequence_occurrences(history, seq) == 0
+    else:  # contains (default)
+        return count_sequence_occurrences(history, seq) >= min_count
+
+
+# =============================================================================
+# 1. УЛУЧШЕННАЯ ПРОВЕРКА ПОСЛЕДОВАТЕЛЬНОСТИ ХОДОВ (с полными операторами)
+# =============================================================================
+
+def check_sequence_condition(cond, player_history):
+    """
+    Проверяет условие типа sequence с полным набором операторов.
+    
+    Форматы:
+    {
+        "check": "sequence",
+        "moves": "u d l r",              // одна последовательность
+        "mode": "contains",              // contains/exact/starts_with/ends_with/not_contains
+        "count": 1,                      // количество вхождений
+        "operator": ">=",                // ==, >=, <=, >, <, != для count
+        "min": 1, "max": 3,              // диапазон вхождений (альтернатива operator+count)
+        "overlapping": false             // перекрывающиеся вхождения
+    }
+    
+    {
+        "check": "sequence",
+        "any": ["u u", "d d"],           // любая из последовательностей
+        "all": ["u d", "l r"],           // все последовательности
+        "mode": "not_contains"           // требовать ОТСУТСТВИЕ последовательности
+    }
+    """
+    mode = cond.get("mode", "contains")
+    overlapping = cond.get("overlapping", False)
+    
+    # Получаем параметры подсчета
+    count_target = cond.get("count", 1)
+    operator = cond.get("operator", ">=")
+    min_count = cond.get("min", None)
+    max_count = cond.get("max", None)
+    
+    def check_single_sequence(seq_spec):
+        seq = normalize_moves(seq_spec)
+        if not seq:
+            return True
+        
+        actual_count = count_sequence_occurrences(player_history, seq, overlapping)
+        
+        # Режимы без подсчета
+        if mode == "exact":
+            return player_history == seq
+        elif mode == "starts_with":
+            return len(player_history) >= len(seq) and player_history[:len(seq)] == seq
+        elif mode == "ends_with":
+            return len(player_history) >= len(seq) and player_history[-len(seq):] == seq
+        elif mode == "not_contains":
+            # Для not_contains можно указать max=0 или просто требовать 0 вхождений
+            if max_count is not None:
+                return actual_count <= max_count
+            return actual_count == 0
+        else:  # contains
+            # Применяем оператор или диапазон
+            if min_count is not None and max_count is not None:
+                return min_count <= actual_count <= max_count
+            elif min_count is not None:
+                return actual_count >= min_count
+            elif max_count is not None:
+                return actual_count <= max_count
+            else:
+                # Используем operator и count
+                op_func = OPERATORS.get(operator, OPERATORS[">="])
+                return op_func(actual_count, count_target)
+    
+    # Обработка any/all с учетом match (для совместимости)
+    match = cond.get("match", "all")
+    
+    if "any" in cond:
+        return any(check_single_sequence(s) for s in cond["any"])
+    
+    if "all" in cond:
+        return all(check_single_sequence(s) for s in cond["all"])
+    
+    # Одиночная последовательность
+    return check_single_sequence(cond.get("moves", ""))
+
+# =============================================================================
+# ПОТОКОВЫЙ ПОИСК ПОСЛЕДОВАТЕЛЬНОСТЕЙ (Aho-Corasick)
+# =============================================================================
+
+class SequenceMatcher:
+    """
+    Автомат Ахо-Корасик по алфавиту u/d/l/r для всех последовательностей уровня.
+    
+    На каждый ход делает один переход и обновляет счётчики вхождений
+    (перекрывающихся и неперекрывающихся). starts_with/ends_with/exact
+    проверяются за O(1) по текущему состоянию.
+    
+    Использование:
+        matcher = SequenceMatcher()
+        pid = matcher.add(["u", "d"])
+        matcher.build()
+        matcher.push("u"); matcher.count(pid)
+    """
+
+    ALPHABET = {"u": 0, "d": 1, "l": 2, "r": 3}
+
+    def __init__(self):
+        self.patterns = []
+        self._ids = {}
+        self._trie = [{}]
+        self._terminal = [None]
+        self._depth = [0]
+        self.goto = []
+        self.outputs = [()]
+        self.count_cap = 1
+        self.needs_prefix = False
+        self.reset()
+
+    def add(self, seq):
+        """Добавляет последовательность и возвращает её id (None для пустой)."""
+        seq = tuple(seq)
+        if not seq:
+            return None
+        if seq in self._ids:
+            return self._ids[seq]
+
+        state = 0
+        for move in seq:
+            nxt = self._trie[state].get(move)
+            if nxt is None:
+                nxt = len(self._trie)
+                self._trie[state][move] = nxt
+                self._trie.append({})
+                self._terminal.append(None)
+                self._depth.append(self._depth[state] + 1)
+            state = nxt
+
+        pid = len(self.patterns)
+        self.patterns.append(seq)
+        self._ids[seq] = pid
+        self._terminal[state] = pid
+        return pid
+
+    def build(self):
+        """Строит таблицу переходов и выходы состояний (по суффиксным ссылкам)."""
+        n = len(self._trie)
+        self.goto = [[0] * len(self.ALPHABET) for _ in range(n)]
+        self.outputs = [()] * n
+        fail = [0] * n
+
+        queue = []
+        for move, c in self.ALPHABET.items():
+            nxt = self._trie[0].get(move)
+            if nxt is not None:
+                self.goto[0][c] = nxt
+                queue.append(nxt)
+
+        for state in queue:
+            own = self._terminal[state]
+            self.outputs[state] = ((own,) if own is not None else ()) + self.outputs[fail[state]]
+            for move, c in self.ALPHABET.items():
+                nxt = self._trie[state].get(move)
+                if nxt is None:
+                    self.goto[state][c] = self.goto[fail[state]][c]
+                else:
+                    fail[nxt] = self.goto[fail[state]][c]
+                    self.goto[state][c] = nxt
+                    queue.append(nxt)
+
+        self.reset()
+
+    def reset(self):
+        self.length = 0
+        self.states = [0]
+        self.overlapping = [0] * len(self.patterns)
+        self.non_overlapping = [0] * len(self.patterns)
+        self.last_end = [-1] * len(self.patterns)
+        self.started = set()
+        self._counted = []  # на каждый ход: [(pid, прежний last_end)]
+
+    @property
+    def state(self):
+        return self.states[-1]
+
+    def push(self, move):
+        """Продвигает автомат на один ход."""
+        state = self.goto[self.states[-1]][self.ALPHABET[move]] if self.goto else 0
+        end = self.length
+        self.length += 1
+        self.states.append(state)
+
+        counted = None
+        for pid in self.outputs[state]:
+            size = len(self.patterns[pid])
+            self.overlapping[pid] += 1
+            if end - size >= self.last_end[pid]:
+                if counted is None:
+                    counted = []
+                counted.append((pid, self.last_end[pid]))
+                self.non_overlapping[pid] += 1
+                self.last_end[pid] = end
+            if size == self.length:
+                self.started.add(pid)
+        self._counted.append(counted)
+
+    def pop(self):
+        """Отменяет последний ход."""
+        if self.length == 0:
+            return
+        state = self.states.pop()
+        for pid in self.outputs[state]:
+            self.overlapping[pid] -= 1
+            if len(self.patterns[pid]) == self.length:
+                self.started.discard(pid)
+        counted = self._counted.pop()
+        if counted:
+            for pid, prev_end in counted:
+                self.non_overlapping[pid] -= 1
+                self.last_end[pid] = prev_end
+        self.length -= 1
+
+    def count(self, pid, overlapping=False):
+        if overlapping:
+            return self.overlapping[pid]
+        return self.non_overlapping[pid]
+
+    def ends_with(self, pid):
+        return pid in self.outputs[self.states[-1]]
+
+    def starts_with(self, pid):
+        return pid in self.started
+
+    def matched(self):
+        """Длина самого длинного суффикса истории, совпадающего с началом какой-то последовательности."""
+        return self._depth[self.states[-1]]
+
+    def exact(self, pid):
+        return self.length == len(self.patterns[pid]) and self.ends_with(pid)
+
+    def key(self):
+        """Часть состояния, влияющая на будущие проверки (счётчики ограничены count_cap)."""
+        if not self.patterns:
+            return ()
+        cap = self.count_cap
+        # Длина истории и начала важны только для exact/starts_with
+        prefix = ()
+        if self.needs_prefix:
+            max_len = max(len(p) for p in self.patterns)
+            prefix = (min(self.length, max_len + 1), frozenset(self.started))
+        # Расстояние до конца прошлого вхождения нужно, пока счётчик не упёрся в cap
+        gaps = tuple(min(self.length - end, len(p)) if n < cap else -1
+                     for p, end, n in zip(self.patterns, self.last_end, self.non_overlapping))
+        return (
+            self.states[-1],
+            tuple(min(c, cap) for c in self.overlapping),
+            tuple(min(c, cap) for c in self.non_overlapping),
+            gaps,
+            prefix,
+        )
+
+
+# =============================================================================
+# ПРОВЕРКА УСЛОВИЙ
+# =============================================================================
+
+def check_condition(cond, path, player_pos, cols, rows, player_history=None):
+    """Проверяет одно условие. player_history нужен для check=sequence."""
+    check = cond.get("check", "")
+    cells = resolve_cells(cond.get("cells", []), cols, rows)
+    match = cond.get("match", "all")
+    
+    if check == "group":
+        logic = cond.get("logic", "AND").upper()
+        items = cond.get("items", [])
+        results = [check_condition(item, path, player_pos, cols, rows, player_history) 
+                   for item in items]
+        if logic == "AND": return all(results)
+        elif logic == "OR": return any(results)
+        elif logic == "NOT": return not results[0] if results else True
+        elif logic == "XOR": return sum(results) == 1
+        return False
+    
+    # НОВОЕ: проверка последовательности ходов
+    if check == "sequence":
+        if player_history is None:
+            return False
+        return check_sequence_condition(cond, player_history)
+    
+    if check == "visit":
+        visit_counts = {}
+        for pos in path:
+            visit_counts[pos] = visit_counts.get(pos, 0) + 1
+        
+        if "min" in cond or "max" in cond:
+            min_c, max_c = cond.get("min", 0), cond.get("max", 999999)
+            if match == "any":
+                return any(min_c <= visit_counts.get(c, 0) <= max_c for c in cells)
+            return all(min_c <= visit_counts.get(c, 0) <= max_c for c in cells)
+        
+        count = cond.get("count", 1)
+        
+        # === ИСПРАВЛЕНИЕ: для count=0 используем == по умолчанию ===
+        if count == 0:
+            default_op = "=="
+        else:
+            default_op = ">="
+        op_func = OPERATORS.get(cond.get("operator", default_op), OPERATORS[default_op])
+        # === КОНЕЦ ИСПРАВЛЕНИЯ ===
+        
+        if match == "any":
+            return any(op_func(visit_counts.get(c, 0), count) for c in cells)
+        return all(op_func(visit_counts.get(c, 0), count) for c in cells)
+    
+    if check == "at_steps":
+        mode = cond.get("mode", "require")
+        cells_set = set(cells)
+        
+        if "step_expr" in cond:
+            step_pred = compile_step_expr(cond["step_expr"])
+            if mode == "avoid":
+                for i, pos in enumerate(path):
+                    if pos in cells_set and step_pred(i):
+                        return False
+                return True
+            else:
+                cell_valid = {c: False for c in cells}
+                for i, pos in enumerate(path):
+                    if pos in cells_set and step_pred(i):
+                        cell_valid[pos] = True
+                return any(cell_valid.values()) if match == "any" else all(cell_valid.get(c, False) for c in cells)
+        
+        target_steps = parse_steps(cond)
+        cell_steps = {}
+        for i, pos in enumerate(path):
+            if pos not in cell_steps: cell_steps[pos] = set()
+            cell_steps[pos].add(i)
+        
+        if mode == "avoid":
+            for i, pos in enumerate(path):
+                if pos in cells_set and i in target_steps:
+                    return False
+            return True
+        else:
+            if match == "any":
+                return any(c in cell_steps and target_steps.issubset(cell_steps[c]) for c in cells)
+            return all(c in cell_steps and target_steps.issubset(cell_steps[c]) for c in cells)
+    
+    if check == "end_at":
+        return tuple(player_pos) in cells
+    
+    if check == "order":
+        first_visits = {}
+        for i, pos in enumerate(path):
+            if pos not in first_visits: first_visits[pos] = i
+        prev = -1
+        for c in cells:
+            if c not in first_visits or first_visits[c] <= prev:
+                return False
+            prev = first_visits[c]
+        return True
+    
+    if check == "consecutive":
+        count = cond.get("count", 2)
+        def max_consecutive(cell):
+            max_c = current = 0
+            for pos in path:
+                if pos == cell:
+                    current += 1
+                    max_c = max(max_c, current)
+                else:
+                    current = 0
+            return max_c
+        if match == "any":
+            return any(max_consecutive(c) >= count for c in cells)
+        return all(max_consecutive(c) >= count for c in cells)
+    
+    if check == "no_revisit":
+        exceptions = set(resolve_cells(cond.get("except", []), cols, rows))
+        visit_counts = {}
+        for pos in path:
+            visit_counts[pos] = visit_counts.get(pos, 0) + 1
+        for pos, cnt in visit_counts.items():
+            if cnt > 1 and pos not in exceptions:
+                return False
+        return True
+    
+    if check == "total_steps":
+        count = cond.get("count", 0)
+        op_func = OPERATORS.get(cond.get("operator", "=="), OPERATORS["=="])
+        return op_func(len(path) - 1, count)
+    
+    return False
+
+
+def check_all_conditions(conditions, path, player_pos, cols, rows, player_history=None):
+    return all(check_condition(c, path, player_pos, cols, rows, player_history) 
+               for c in conditions)
+
+
+# =============================================================================
+# ИНКРЕМЕНТАЛЬНЫЙ ТРЕКЕР УСЛОВИЙ
+# =============================================================================
+#
+# ConditionTracker получает ходы по одному (push) и откатывает их (pop),
+# поддерживая счётчики посещений, курсоры порядка, серии и попадания по шагам.
+# Проверка победы стоит O(условий) вместо O(путь × условия).
+#
+# Каждое условие компилируется в маленький трекер с методами:
+#   reset()                               - начальное состояние
+#   push(step, pos, count, run)           - шаг добавлен
+#   pop(step, pos, count, run)            - шаг отменён
+#   satisfied(state)                      - выполнено ли условие
+# count - число посещений pos с учётом этого шага, run - длина серии
+# стояния в pos на этом шаге. Трекер получает только шаги по своим клеткам
+# (watch) или все шаги, если watch is None.
+#
+# Для поиска решений (solver.py) трекер также сообщает, какая часть истории
+# влияет на будущее (progress_key):
+#   visit_cap - посещения клетки сверх этого числа неразличимы для условия
+#   run_cap   - то же для длины серии стояния в клетке
+#   step_cap  - номер шага сверх этого неважен (None - важен всегда)
+#   key()     - компактное внутреннее состояние трекера (нет у трекеров,
+#               состояние которых выводится из посещений и шага)
+
+
+def _visit_predicate(cond):
+    """Предикат для счётчика посещений одной клетки (check=visit)."""
+    if "min" in cond or "max" in cond:
+        min_c, max_c = cond.get("min", 0), cond.get("max", 999999)
+        return lambda c: min_c <= c <= max_c
+
+    count = cond.get("count", 1)
+    default_op = "==" if count == 0 else ">="
+    op_func = OPERATORS.get(cond.get("operator", default_op), OPERATORS[default_op])
+    return lambda c: op_func(c, count)
+
+
+class _CellSetTracker:
+    """Базовый трекер: считает клетки набора, удовлетворяющие условию."""
+
+    visit_cap = 0
+    run_cap = 0
+    step_cap = 0
+
+    def __init__(self, cells, match):
+        self.cells = list(dict.fromkeys(cells))
+        self.watch = set(self.cells)
+        self.match = match
+        self.ok = 0
+
+    def satisfied(self, state):
+        if self.match == "any":
+            return self.ok > 0
+        return self.ok == len(self.cells)
+
+
+class _VisitTracker(_CellSetTracker):
+    def __init__(self, cond, cells):
+        super().__init__(cells, cond.get("match", "all"))
+        self.pred = _visit_predicate(cond)
+        limits = [cond.get(k) for k in ("min", "max", "count") if isinstance(cond.get(k), int)]
+        self.visit_cap = max(limits + [1]) + 1
+        self.reset()
+
+    def reset(self):
+        self.ok = len(self.cells) if self.pred(0) else 0
+
+    def push(self, step, pos, count, run):
+        self.ok += self.pred(count) - self.pred(count - 1)
+
+    def pop(self, step, pos, count, run):
+        self.ok += self.pred(count - 1) - self.pred(count)
+
+
+class _AtStepsTracker(_CellSetTracker):
+    def __init__(self, cond, cells):
+        super().__init__(cells, cond.get("match", "all"))
+        self.avoid = cond.get("mode", "require") == "avoid"
+
+        target_steps = parse_steps(cond)
+        self.step_pred = target_steps.__contains__
+        self.visit_cap = 1
+        if target_steps.is_finite:
+            # Клетка должна быть посещена и занята на всех целевых шагах
+            self.required_hits = len(target_steps)
+            self.step_cap = max(target_steps, default=-1) + 1
+        else:
+            # Для step_expr достаточно одного попадания в клетку
+            self.required_hits = None
+            self.step_cap = None
+        self.reset()
+
+    def reset(self):
+        self.ok = 0
+        self.violations = 0
+        self.hits = {c: 0 for c in self.cells}
+
+    def _cell_ok(self, count, hits):
+        if self.required_hits is None:
+            return hits > 0
+        return count > 0 and hits == self.required_hits
+
+    def push(self, step, pos, count, run):
+        hit = self.step_pred(step)
+        if self.avoid:
+            self.violations += hit
+            return
+        hits = self.hits[pos]
+        before = self._cell_ok(count - 1, hits)
+        if hit:
+            hits += 1
+            self.hits[pos] = hits
+        self.ok += self._cell_ok(count, hits) - before
+
+    def pop(self, step, pos, count, run):
+        hit = self.step_pred(step)
+        if self.avoid:
+            self.violations -= hit
+            return
+        hits = self.hits[pos]
+        before = self._cell_ok(count, hits)
+        if hit:
+            hits -= 1
+            self.hits[pos] = hits
+        self.ok += self._cell_ok(count - 1, hits) - before
+
+    def satisfied(self, state):
+        if self.avoid:
+            return self.violations == 0
+        return super().satisfied(state)
+
+    def key(self):
+        if self.avoid:
+            return self.violations > 0
+        cap = self.required_hits or 1
+        return tuple(min(self.hits[c], cap) for c in self.cells)
+
+
+class _ConsecutiveTracker(_CellSetTracker):
+    def __init__(self, cond, cells):
+        super().__init__(cells, cond.get("match", "all"))
+        self.count = cond.get("count", 2)
+        self.run_cap = max(self.count, 0)
+        self.reset()
+
+    def reset(self):
+        # Серия длиной 0 есть у любой клетки
+        self.ok = len(self.cells) if self.count <= 0 else 0
+        self.runs_reached = {c: 0 for c in self.cells}
+
+    def push(self, step, pos, count, run):
+        if run == self.count:
+            self.runs_reached[pos] += 1
+            if self.runs_reached[pos] == 1:
+                self.ok += 1
+
+    def pop(self, step, pos, count, run):
+        if run == self.count:
+            self.runs_reached[pos] -= 1
+            if self.runs_reached[pos] == 0:
+                self.ok -= 1
+
+    def key(self):
+        return tuple(self.runs_reached[c] > 0 for c in self.cells)
+
+
+class _OrderTracker:
+    visit_cap = 1
+    run_cap = 0
+    step_cap = 0
+
+    def __init__(self, cond, cells):
+        self.cells = cells
+        self.watch = set(cells)
+        self.reset()
+
+    def reset(self):
+        self.cursor = 0
+        self.broken_step = None
+
+    def push(self, step, pos, count, run):
+        if count != 1 or self.broken_step is not None:
+            return
+        # Первое посещение: либо следующая клетка порядка, либо порядок нарушен
+        if self.cursor < len(self.cells) and self.cells[self.cursor] == pos:
+            self.cursor += 1
+        else:
+            self.broken_step = step
+
+    def pop(self, step, pos, count, run):
+        if count != 1:
+            return
+        if self.broken_step is not None:
+            if self.broken_step == step:
+                self.broken_step = None
+        else:
+            self.cursor -= 1
+
+    def satisfied(self, state):
+        return self.broken_step is None and self.cursor == len(self.cells)
+
+    def key(self):
+        return (self.cursor, self.broken_step is not None)
+
+
+class _NoRevisitTracker:
+    watch = None
+    visit_cap = 2
+    run_cap = 0
+    step_cap = 0
+
+    def __init__(self, cond, exceptions):
+        self.exceptions = set(exceptions)
+        self.reset()
+
+    def reset(self):
+        self.violations = 0
+
+    def push(self, step, pos, count, run):
+        if count == 2 and pos not in self.exceptions:
+            self.violations += 1
+
+    def pop(self, step, pos, count, run):
+        if count == 2 and pos not in self.exceptions:
+            self.violations -= 1
+
+    def satisfied(self, state):
+        return self.violations == 0
+
+    def key(self):
+        return self.violations > 0
+
+
+class _StaticTracker:
+    """Условие, которое вычисляется по текущему состоянию без счётчиков."""
+    watch = ()
+    visit_cap = 0
+    run_cap = 0
+
+    def __init__(self, check_func, step_cap=0):
+        self.check_func = check_func
+        self.step_cap = step_cap
+
+    def reset(self):
+        pass
+
+    def satisfied(self, state):
+        return self.check_func(state)
+
+
+class _SequenceTracker(_StaticTracker):
+    """Условие sequence поверх общего SequenceMatcher уровня."""
+
+    def __init__(self, cond, matcher):
+        self.matcher = matcher
+        self.mode = cond.get("mode", "contains")
+        self.overlapping = cond.get("overlapping", False)
+        self.count_target = cond.get("count", 1)
+        self.op_func = OPERATORS.get(cond.get("operator", ">="), OPERATORS[">="])
+        self.min_count = cond.get("min", None)
+        self.max_count = cond.get("max", None)
+        self.step_cap = 0
+        limits = [v for v in (self.count_target, self.min_count, self.max_count)
+                  if isinstance(v, int)]
+        matcher.count_cap = max([matcher.count_cap] + [v + 1 for v in limits])
+        if self.mode in ("exact", "starts_with"):
+            matcher.needs_prefix = True
+
+        if "any" in cond:
+            self.logic, specs = any, cond["any"]
+        elif "all" in cond:
+            self.logic, specs = all, cond["all"]
+        else:
+            self.logic, specs = all, [cond.get("moves", "")]
+        self.pids = [matcher.add(normalize_moves(s)) for s in specs]
+
+    def _check_single(self, pid):
+        if pid is None:
+            return True
+        m = self.matcher
+        if self.mode == "exact":
+            return m.exact(pid)
+        elif self.mode == "starts_with":
+            return m.starts_with(pid)
+        elif self.mode == "ends_with":
+            return m.ends_with(pid)
+
+        actual_count = m.count(pid, self.overlapping)
+        if self.mode == "not_contains":
+            if self.max_count is not None:
+                return actual_count <= self.max_count
+            return actual_count == 0
+        if self.min_count is not None and self.max_count is not None:
+            return self.min_count <= actual_count <= self.max_count
+        elif self.min_count is not None:
+            return actual_count >= self.min_count
+        elif self.max_count is not None:
+            return actual_count <= self.max_count
+        return self.op_func(actual_count, self.count_target)
+
+    def satisfied(self, state):
+        return self.logic(self._check_single(pid) for pid in self.pids)
+
+
+class _GroupTracker(_StaticTracker):
+    def __init__(self, logic, children):
+        self.logic = logic
+        self.children = children
+        self.step_cap = 0
+
+    def satisfied(self, state):
+        results = [c.satisfied(state) for c in self.children]
+        if self.logic == "AND": return all(results)
+        elif self.logic == "OR": return any(results)
+        elif self.logic == "NOT": return not results[0] if results else True
+        elif self.logic == "XOR": return sum(results) == 1
+        return False
+
+
+def _visit_key(pos, count):
+    """Ключ «в клетке pos count посещений» для ConditionTracker.visit_hash (0 - не посещена)."""
+    return zobrist_key(pos[0], pos[1], _VISIT_TAG + count) if count else 0
+
+
+class ConditionTracker:
+    """
+    Инкрементальная проверка условий уровня.
+    
+    Использование:
+        tracker = ConditionTracker(conditions, cols, rows, start_pos)
+        tracker.push(pos, move)   # после каждого хода
+        tracker.pop()             # отмена последнего хода
+        tracker.is_satisfied()    # проверка победы за O(условий)
+    """
+
+    def __init__(self, conditions, cols, rows, start_pos=None):
+        self.cols = cols
+        self.rows = rows
+        self._by_cell = {}      # pos -> [трекеры, следящие за клеткой]
+        self._every_step = []   # трекеры, получающие все шаги
+        self._all = []
+        self.sequences = SequenceMatcher()
+        self.items = [self._compile(c) for c in conditions]
+        self.sequences.build()
+        self._build_caps()
+
+        self.path = []
+        self.history = []
+        self.visit_counts = {}
+        self.visited = 0        # доска пройденных клеток: бит y * cols + x
+        self.visit_hash = 0     # XOR ключей (клетка, посещения до её visit_cap) - для progress_key
+        self.runs = []
+        if start_pos is not None:
+            self.reset(start_pos)
+
+    def _register(self, tracker):
+        self._all.append(tracker)
+        if tracker.watch is None:
+            self._every_step.append(tracker)
+        else:
+            for cell in tracker.watch:
+                self._by_cell.setdefault(cell, []).append(tracker)
+        return tracker
+
+    def _compile(self, cond):
+        check = cond.get("check", "")
+        cells = resolve_cells(cond.get("cells", []), self.cols, self.rows)
+
+        if check == "group":
+            children = [self._compile(item) for item in cond.get("items", [])]
+            return self._register(_GroupTracker(cond.get("logic", "AND").upper(), children))
+        if check == "sequence":
+            return self._register(_SequenceTracker(cond, self.sequences))
+        if check == "visit":
+            return self._register(_VisitTracker(cond, cells))
+        if check == "at_steps":
+            return self._register(_AtStepsTracker(cond, cells))
+        if check == "end_at":
+            cells_set = set(cells)
+            return self._register(_StaticTracker(lambda state: state.pos in cells_set))
+        if check == "order":
+            return self._register(_OrderTracker(cond, cells))
+        if check == "consecutive":
+            return self._register(_ConsecutiveTracker(cond, cells))
+        if check == "no_revisit":
+            exceptions = resolve_cells(cond.get("except", []), self.cols, self.rows)
+            return self._register(_NoRevisitTracker(cond, exceptions))
+        if check == "total_steps":
+            count = cond.get("count", 0)
+            op_func = OPERATORS.get(cond.get("operator", "=="), OPERATORS["=="])
+            return self._register(_StaticTracker(lambda state: op_func(state.steps, count),
+                                                 step_cap=count + 1))
+        return self._register(_StaticTracker(lambda state: False))
+
+    def _build_caps(self):
+        self._visit_caps = {}
+        self._default_cap = 0   # для трекеров, следящих за всеми клетками
+        self._run_caps = {}
+        self._keyed = [t for t in self._all if hasattr(t, "key")]
+        self.step_cap = 0
+        for tracker in self._all:
+            if tracker.watch is None:
+                self._default_cap = max(self._default_cap, tracker.visit_cap)
+            else:
+                for cell in tracker.watch:
+                    if tracker.visit_cap:
+                        self._visit_caps[cell] = max(self._visit_caps.get(cell, 0), tracker.visit_cap)
+                    if tracker.run_cap:
+                        self._run_caps[cell] = max(self._run_caps.get(cell, 0), tracker.run_cap)
+            if self.step_cap is not None:
+                self.step_cap = None if tracker.step_cap is None else max(self.step_cap, tracker.step_cap)
+        # Итоговый cap клетки: свой или общий, если он больше
+        self._count_caps = {c: max(cap, self._default_cap) for c, cap in self._visit_caps.items()}
+
+    def progress_key(self):
+        """
+        Хэшируемое состояние прогресса условий без позиции игрока.
+        Два пути с одинаковым ключом одинаково выполняют условия при любом продолжении.
+        Посещения входят хешем visit_hash (обновляется в push/pop за O(1)).
+        """
+        step = self.steps if self.step_cap is None else min(self.steps, self.step_cap)
+        run = min(self.runs[-1], self._run_caps.get(self.path[-1], 0))
+        return (step, self.visit_hash, run, tuple(t.key() for t in self._keyed),
+                self.sequences.key())
+
+    @property
+    def pos(self):
+        return self.path[-1] if self.path else None
+
+    @property
+    def steps(self):
+        return len(self.path) - 1
+
+    def reset(self, start_pos):
+        """Сбрасывает трекер к пути из одной стартовой клетки."""
+        self.path = []
+        self.history = []
+        self.visit_counts = {}
+        self.visited = 0
+        self.visit_hash = 0
+        self.runs = []
+        self.sequences.reset()
+        for tracker in self._all:
+            tracker.reset()
+        self.push(start_pos)
+
+    def push(self, pos, move=None):
+        """Добавляет шаг пути. move - ход игрока (None только для старта)."""
+        pos = tuple(pos)
+        step = len(self.path)
+        count = self.visit_counts.get(pos, 0) + 1
+        self.visit_counts[pos] = count
+        if count == 1:
+            self.visited |= 1 << (pos[1] * self.cols + pos[0])
+        if count <= self._count_caps.get(pos, self._default_cap):
+            self.visit_hash ^= _visit_key(pos, count - 1) ^ _visit_key(pos, count)
+        run = self.runs[-1] + 1 if self.path and self.path[-1] == pos else 1
+
+        self.path.append(pos)
+        self.runs.append(run)
+        if move is not None:
+            self.history.append(move)
+            self.sequences.push(move)
+
+        for tracker in self._by_cell.get(pos, ()):
+            tracker.push(step, pos, count, run)
+        for tracker in self._every_step:
+            tracker.push(step, pos, count, run)
+
+    def pop(self):
+        """Отменяет последний шаг. Стартовую клетку не трогает."""
+        if len(self.path) <= 1:
+            return False
+
+        step = len(self.path) - 1
+        pos = self.path[-1]
+        count = self.visit_counts[pos]
+        run = self.runs[-1]
+
+        for tracker in self._by_cell.get(pos, ()):
+            tracker.pop(step, pos, count, run)
+        for tracker in self._every_step:
+            tracker.pop(step, pos, count, run)
+
+        self.visit_counts[pos] = count - 1
+        if count == 1:
+            self.visited ^= 1 << (pos[1] * self.cols + pos[0])
+        if count <= self._count_caps.get(pos, self._default_cap):
+            self.visit_hash ^= _visit_key(pos, count - 1) ^ _visit_key(pos, count)
+        self.path.pop()
+        self.runs.pop()
+        if self.history:
+            self.history.pop()
+            self.sequences.pop()
+        return True
+
+    def rebuild(self, path, history):
+        """Полностью пересчитывает состояние по пути и истории ходов."""
+        self.reset(path[0])
+        for pos, move in zip(path[1:], history):
+            self.push(pos, move)
+
+    def rewind(self, path, history):
+        """
+        Приводит трекер к состоянию (path, history) после undo/загрузки.
+        Если это префикс текущего пути - откатывает шаги, иначе пересчитывает.
+        """
+        n = len(path)
+        if (0 < n <= len(self.path) and self.path[:n] == list(path)
+                and self.history[:n - 1] == list(history)):
+            while len(self.path) > n:
+                self.pop()
+        else:
+            self.rebuild(path, history)
+
+    def is_satisfied(self):
+        return all(tracker.satisfied(self) for tracker in self.items)
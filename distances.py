@@ -0,0 +1,114 @@
+"""
+Карта кратчайших расстояний между клетками уровня.
+
+Расстояние - число ходов игрока по сетке: стены и яд на ходе из клетки берутся
+из barriers.step_masks, поэтому inner/outer (односторонние) барьеры
+учитываются, а расстояние A -> B может отличаться от B -> A. Коробки не
+учитываются: их можно сдвинуть, так что расстояние - нижняя оценка пути.
+
+По строке на клетку-источник: array('H') длины cols * rows, UNREACHABLE -
+клетка недостижима. Строки считает фоновый поток (start), а запрос строки,
+до которой он ещё не дошёл, считает её сразу - ответ всегда точный.
+"""
+
+import threading
+import time
+from array import array
+
+from barriers import DIR_DELTA
+
+UNREACHABLE = 0xFFFF
+
+# Больше клеток - строки только по запросу: все пары заняли бы cells^2 * 2 байт
+# (32x32 - 2 МБ и доли секунды BFS, 64x64 было бы уже 32 МБ и секунды под GIL)
+FILL_LIMIT = 32 * 32
+
+
+class DistanceMap:
+    """Расстояния от каждой клетки до каждой: BFS по проходимости уровня."""
+
+    def __init__(self, steps, cols, rows):
+        """
+        Args:
+            steps: barriers.step_masks уровня (байт на клетку)
+        """
+        self.cols = cols
+        self.rows = rows
+        # Соседи, куда ход из клетки открыт (без стены и яда)
+        neighbors = []
+        for i, mask in enumerate(steps):
+            y, x = divmod(i, cols)
+            cell = []
+            for code, (dx, dy) in enumerate(DIR_DELTA):
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < cols and 0 <= ny < rows and not mask & (0x11 << code):
+                    cell.append(ny * cols + nx)
+            neighbors.append(cell)
+        self._neighbors = neighbors
+        self._rows = [None] * (cols * rows)
+        self._stop = threading.Event()
+        self._thread = None
+        self._done = False
+
+    def start(self):
+        """Запускает фоновый подсчёт всех строк (для уровней до FILL_LIMIT клеток)."""
+        if self._thread is None and len(self._rows) <= FILL_LIMIT:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        rows = self._rows
+        for i in range(len(rows)):
+            if self._stop.is_set():
+                return
+            if rows[i] is None:
+                self._bfs(i)
+                # Отдаём GIL после каждой строки: игровой цикл не ждёт всю карту
+                time.sleep(0)
+        self._done = True
+
+    @property
+    def ready(self):
+        """Все строки посчитаны фоновым потоком. O(1)."""
+        return self._done
+
+    def _bfs(self, source):
+        neighbors = self._neighbors
+        row = array('H', [UNREACHABLE]) * len(neighbors)
+        row[source] = 0
+        frontier = [source]
+        d = 0
+        while frontier:
+            d += 1
+            layer = []
+            for cell in frontier:
+                for other in neighbors[cell]:
+                    if row[other] == UNREACHABLE:
+                        row[other] = d
+                        layer.append(other)
+            frontier = layer
+        # Строку публикуем готовой целиком: читатели в других потоках не увидят половину
+        self._rows[source] = row
+        return row
+
+    def row(self, pos):
+        """Расстояния из клетки pos до всех клеток (индекс y * cols + x)."""
+        i = pos[1] * self.cols + pos[0]
+        return self._rows[i] or self._bfs(i)
+
+    def distance(self, src, dst):
+        """Ходов из src до dst без учёта коробок или None, если не дойти. O(1)."""
+        cols, rows = self.cols, self.rows
+        if not (0 <= src[0] < cols and 0 <= src[1] < rows
+                and 0 <= dst[0] < cols and 0 <= dst[1] < rows):
+            return None
+        i = src[1] * cols + src[0]
+        d = (self._rows[i] or self._bfs(i))[dst[1] * cols + dst[0]]
+        return None if d == UNREACHABLE else d
+
+    def reachable(self, src, dst):
+        return self.distance(src, dst) is not None
@@ -1,7 +1,8 @@
 # editor.py
+import hashlib
 import json
 import os
-import pygame
+import threading
 
 EDIT_FILE = "edit_user_level.json"
 
@@ -95,8 +96,11 @@ def create_template(filename=EDIT_FILE):
     except Exception as e:
         print(f"[EDITOR] Ошибка создания шаблона: {e}")
 
-def validate_level(level_data):
-    """Базовая валидация уровня."""
+def check_level(level_data):
+    """
+    Базовая валидация уровня без вывода.
+    Returns: (errors, warnings) - списки сообщений.
+    """
     errors = []
     warnings = []
     
@@ -136,6 +140,13 @@ def validate_level(level_data):
             if not has_pos:
                 errors.append(f"movable[{i}] не имеет координат (cell/cells/range/ranges)")
 
+    return errors, warnings
+
+
+def validate_level(level_data):
+    """Базовая валидация уровня с выводом в консоль."""
+    errors, warnings = check_level(level_data)
+
     # Вывод результатов
     if errors:
         print("[EDITOR] ❌ ОШИБКИ:")
@@ -156,7 +167,7 @@ def validate_level(level_data):
 def reload_edit_level(process_func):
     """
     Перезагружает уровень из файла и обрабатывает его.
-    process_func - функция process_level_data из game.py
+    process_func - функция process_level_data из levels.py
     """
     print("\n" + "=" * 40)
     print("[EDITOR] Перезагрузка уровня...")
@@ -189,6 +200,169 @@ def reload_edit_level(process_func):
         return None
 
 
+class EditFileWatcher:
+    """
+    Фоновая перезагрузка файла редактирования.
+
+    Поток опрашивает stat файла и при изменении перечитывает его, сравнивает
+    уровни по хэшу содержимого и валидирует/обрабатывает только изменившиеся.
+    Готовый список уровней публикуется целиком одной ссылкой, основной цикл
+    забирает его через poll() - отрисовка не ждёт разбора файла.
+    """
+
+    SERVICE_FIELDS = ("_comment", "_examples", "_note")
+
+    def __init__(self, process_func, filename=EDIT_FILE, interval=0.5, on_change=None):
+        """
+        Args:
+            process_func: функция process_level_data
+            interval: период опроса stat, секунд
+            on_change: вызывается из потока наблюдателя, когда готов новый список уровней
+        """
+        self.process_func = process_func
+        self.filename = filename
+        self.interval = interval
+        self.on_change = on_change
+        self._stat = self._read_stat()
+        self._file_hash = None
+        self._processed = {}    # хэш уровня -> обработанный уровень
+        self._hashes = []       # хэши уровней текущего списка
+        self._pending = None
+        self._lock = threading.Lock()           # _pending
+        self._state_lock = threading.Lock()     # _stat, _file_hash, _processed, _hashes: seed() и check() из разных потоков
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read_stat(self):
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read(self):
+        """Returns: (байты файла, уровни) или None, если файл не читается или не JSON."""
+        try:
+            with open(self.filename, "rb") as f:
+                raw = f.read()
+            data = json.loads(raw.decode("utf-8"))
+        except (OSError, ValueError):
+            return None
+        return raw, [data] if isinstance(data, dict) else data
+
+    def seed(self, levels):
+        """Запоминает уже загруженные уровни (из reload_edit_level), чтобы не обрабатывать их повторно."""
+        read = self._read()
+        if read is None or len(read[1]) != len(levels):
+            return
+        file_hash = hashlib.sha256(read[0]).hexdigest()
+        hashes = [self.level_hash(level) for level in read[1]]
+        with self._state_lock:
+            self._file_hash = file_hash
+            self._hashes = hashes
+            self._processed = dict(zip(hashes, levels))
+
+    @classmethod
+    def level_hash(cls, level):
+        clean = {k: v for k, v in level.items() if k not in cls.SERVICE_FIELDS}
+        text = json.dumps(clean, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[EDITOR] ❌ Ошибка наблюдения за файлом: {e}")
+
+    def check(self):
+        """
+        Проверяет файл и готовит новый список уровней, если он изменился.
+        Returns: True, если опубликован новый список.
+        """
+        # Обработка уровней может идти долго, поэтому отдельный замок: poll() его не ждёт
+        with self._state_lock:
+            return self._check()
+
+    def _check(self):
+        stat = self._read_stat()
+        if stat is None or stat == self._stat:
+            return False
+        try:
+            with open(self.filename, "rb") as f:
+                raw = f.read()
+        except OSError:
+            return False
+        # Файл ещё пишется - дождёмся следующего опроса
+        if self._read_stat() != stat:
+            return False
+        self._stat = stat
+
+        file_hash = hashlib.sha256(raw).hexdigest()
+        if file_hash == self._file_hash:
+            return False
+        self._file_hash = file_hash
+
+        try:
+            data = json.loads(raw.decode("utf-8"))
+        except ValueError as e:
+            print(f"[EDITOR] ❌ Ошибка JSON: {e} (жду следующего сохранения)")
+            return False
+        if isinstance(data, dict):
+            data = [data]
+
+        hashes = [self.level_hash(level) for level in data]
+        changed = [i for i, h in enumerate(hashes) if h not in self._processed]
+
+        for i in changed:
+            level = data[i]
+            for field in self.SERVICE_FIELDS:
+                level.pop(field, None)
+            errors, warnings = check_level(level)
+            if errors:
+                print(f"\n[EDITOR] ❌ Уровень {i + 1} ({level.get('name', 'Без имени')}) содержит ошибки:")
+                for e in errors:
+                    print(f"  - {e}")
+                return False
+            try:
+                self._processed[hashes[i]] = self.process_func([level])[0]
+            except Exception as e:
+                print(f"[EDITOR] ❌ Ошибка обработки уровня {i + 1}: {e}")
+                return False
+
+        # Старые версии уровней больше не нужны
+        self._processed = {h: self._processed[h] for h in hashes}
+        levels = [self._processed[h] for h in hashes]
+        changed_idx = {i for i, h in enumerate(hashes)
+                       if i >= len(self._hashes) or self._hashes[i] != h}
+        self._hashes = hashes
+
+        with self._lock:
+            self._pending = (levels, changed_idx)
+        print(f"[EDITOR] Файл изменён, обработано уровней: {len(changed)} из {len(levels)}")
+        if self.on_change:
+            self.on_change()
+        return True
+
+    def poll(self):
+        """
+        Забирает готовое обновление (вызывается из основного цикла).
+        Returns: None или (уровни, номера изменившихся уровней).
+        """
+        if self._pending is None:
+            return None
+        with self._lock:
+            pending, self._pending = self._pending, None
+        return pending
+
+
 def print_editor_help():
     """Выводит справку по режиму редактирования."""
     help_text = """
@@ -0,0 +1,451 @@
+"""
+Игровая логика без pygame: ходы, смерть от яда, отмена, сброс и победа.
+run_game использует Engine для всей логики и занимается только вводом и отрисовкой,
+а пакетные проверки могут проигрывать ходы без окна и очереди событий.
+"""
+
+import heapq
+
+import savestates
+import movable
+from movable import NO_MOVES, ZOBRIST_PLAYER, zobrist_key
+import barriers
+from bitboard import BitBoard
+from distances import DistanceMap
+from barriers import DIR_CODES, DIR_DELTA
+from levels import calculate_target_pos
+from conditions import ConditionTracker
+
+CODE_MOVES = "udlr"  # код направления -> ход
+MOVE_CODES = {move: DIR_CODES[move] for move in CODE_MOVES}
+
+
+class Engine:
+    """Состояние одного уровня: игрок, коробки, путь, условия и журнал отмены."""
+
+    def __init__(self, max_history=100000, bitboard=False, distances=False):
+        """
+        bitboard=True - битовые доски: занятость клеток, сдвиг групп масками, заливки.
+        distances=True - карта расстояний уровня (self.distances), считается в фоне.
+        """
+        self.level = None
+        self.cols, self.rows = 16, 12
+        self.player_pos = [0, 0]
+        self.path_positions = []
+        self.path_dirty = 0     # первый шаг пути, изменённый после take_path_changes
+        self.player_history = []
+        self.dev_recording = []
+        self.poison_index = None
+        self.walls_index = None
+        self.step_masks = None  # barriers.step_masks уровня: стены и яд на ходах из клеток
+        self._box_blocked = None
+        self.use_bitboard = bitboard
+        self.board = None       # bitboard.BitBoard уровня при bitboard=True
+        self.use_distances = distances
+        self.distances = None   # distances.DistanceMap уровня при distances=True
+        self.conditions = []
+        self.target_pos = None
+        self.tracker = None
+        self.movable_manager = movable.MovableManager()
+        self.state_manager = savestates.StateManager(max_history=max_history)
+
+    # =========================================================================
+    # ЗАГРУЗКА И СБРОС
+    # =========================================================================
+
+    def load_level(self, lvl, clear_history=True):
+        """
+        Загружает обработанный уровень (результат process_level_data).
+        clear_history=False - мягкий сброс: журнал отмены сохраняется.
+        """
+        changed = lvl is not self.level or self.step_masks is None
+        self.level = lvl
+        self.cols, self.rows = lvl.get("grid", (16, 12))
+
+        self.player_pos = list(lvl["start"])
+        self.player_history = []
+        self.dev_recording.clear()
+        self.path_positions = [tuple(self.player_pos)]
+        self.path_dirty = 0
+
+        if clear_history:
+            self.state_manager.reset()
+
+        self.poison_index = lvl["poison_index"]
+        self.walls_index = lvl["walls_index"]
+        if changed:
+            # Рестарт и мягкий сброс перезагружают тот же уровень - маски не пересчитываем
+            self.step_masks = barriers.step_masks(self.walls_index, self.poison_index,
+                                                  self.cols, self.rows)
+            steps, cols = self.step_masks, self.cols
+            self._box_blocked = lambda x, y, code: steps[y * cols + x] & (0x11 << code)
+            if self.use_bitboard:
+                self.board = BitBoard(steps, cols, self.rows)
+            if self.use_distances:
+                # Карта переживает рестарт и мягкий сброс: тот же уровень - те же расстояния
+                if self.distances is not None:
+                    self.distances.stop()
+                self.distances = DistanceMap(steps, cols, self.rows).start()
+
+        if "movable" in lvl:
+            self.movable_manager = movable.parse_movable_data(lvl.get("movable", []))
+        else:
+            self.movable_manager.clear()
+        if self.board is not None:
+            self.movable_manager.attach_board(self.board)
+
+        self.conditions = lvl.get("conditions", [])
+
+        # Обратная совместимость со старым type="sequence"
+        if lvl.get("type") == "sequence" and "ans" in lvl:
+            ans_moves = lvl.get("ans", "")
+            self.target_pos = calculate_target_pos(lvl["start"], ans_moves, self.cols, self.rows)
+            if not any(c.get("check") == "sequence" for c in self.conditions):
+                self.conditions.append({
+                    "check": "sequence",
+                    "moves": ans_moves,
+                    "mode": "exact"
+                })
+            if not any(c.get("check") == "end_at" for c in self.conditions):
+                self.conditions.append({
+                    "check": "end_at",
+                    "cells": [list(self.target_pos)]
+                })
+        else:
+            self.target_pos = None
+
+        self.tracker = ConditionTracker(self.conditions, self.cols, self.rows, self.player_pos)
+
+    def restart(self):
+        """Возвращает уровень к старту, не трогая журнал отмены."""
+        self.load_level(self.level, clear_history=False)
+
+    def reset(self, full=False):
+        """
+        Сброс уровня (клавиша R).
+        Мягкий сброс записывает связанный снимок: Z после него возвращает
+        к состоянию до последнего хода.
+        """
+        if not full and self.state_manager.history:
+            self._push_snapshot(chained=True)
+        self.load_level(self.level, clear_history=full)
+
+    def _push_snapshot(self, chained=False):
+        self.state_manager.push(self.player_pos, self.path_positions, self.player_history,
+                                self.dev_recording, self.movable_manager.copy_state(),
+                                chained=chained)
+
+    # =========================================================================
+    # ХОДЫ
+    # =========================================================================
+
+    def _resolve(self, move):
+        """
+        Проверяет стены и яд и толкает коробки для хода move.
+        Returns: (причина смерти или None, новая позиция игрока или None, moves_made).
+        При смерти коробки остаются на месте.
+        """
+        code = MOVE_CODES.get(move)
+        if code is None:
+            raise ValueError(f"Неизвестный ход: {move!r}")
+
+        x, y = self.player_pos
+        cols = self.cols
+        bit = 1 << code
+        # Яд на выходе из текущей клетки
+        if self.poison_index.masks[y * cols + x] & bit:
+            return 'exit', None, NO_MOVES
+
+        dx, dy = DIR_DELTA[code]
+        tx, ty = x + dx, y + dy
+        if not (0 <= tx < cols and 0 <= ty < self.rows):
+            return None, None, NO_MOVES
+
+        blocked = self.step_masks[y * cols + x]
+        # Яд на входе в соседнюю клетку - как hit_poison в try_push, причина 'push'
+        if blocked & (bit << 4):
+            return 'push', None, NO_MOVES
+        if blocked & bit:
+            return None, None, NO_MOVES
+
+        moves = self.movable_manager.push_boxes(tx, ty, code, cols, self.rows, self._box_blocked)
+        if moves is None:
+            return None, None, NO_MOVES
+        return None, [tx, ty], moves
+
+    def _advance(self, move, target):
+        if target is not None:
+            self.player_pos = target
+
+        # Заблокированный ход тоже считается шагом пути
+        self.player_history.append(move)
+        self.dev_recording.append(move)
+        self.path_positions.append(tuple(self.player_pos))
+        self._touch_path(len(self.path_positions) - 1)
+        self.tracker.push(self.player_pos, move)
+
+    def apply_move(self, move):
+        """
+        Выполняет ход игрока ('u', 'd', 'l', 'r').
+
+        Returns:
+            dict:
+                'moved' - игрок сменил клетку
+                'died' - None или причина смерти: 'exit' (яд на выходе из клетки)
+                         или 'push' (яд на входе в соседнюю клетку);
+                         после смерти уровень уже сброшен к старту
+                'moves_made' - сдвинутые коробки
+                'won' - условия уровня выполнены
+        """
+        died, target, moves_made = self._resolve(move)
+        if died:
+            self._push_snapshot()
+            self.restart()
+            return {'moved': False, 'died': died, 'moves_made': NO_MOVES, 'won': False}
+
+        if target is not None:
+            self.state_manager.push_move(self.player_pos, self.path_positions,
+                                         self.dev_recording, moves_made)
+        self._advance(move, target)
+
+        return {
+            'moved': target is not None,
+            'died': None,
+            'moves_made': moves_made,
+            'won': self.tracker.is_satisfied()
+        }
+
+    def step(self, move):
+        """
+        Ход без журнала отмены и без сброса при смерти - для перебора в solver.
+        Returns: запись для unstep или None, если ход смертелен (состояние не меняется).
+        """
+        died, target, moves_made = self._resolve(move)
+        if died:
+            return None
+        record = (self.player_pos, moves_made)
+        self._advance(move, target)
+        return record
+
+    def unstep(self, record):
+        """Отменяет ход, сделанный через step."""
+        pos, moves_made = record
+        self.tracker.pop()
+        self.path_positions.pop()
+        self._touch_path(len(self.path_positions))
+        self.player_history.pop()
+        self.dev_recording.pop()
+        self.movable_manager.undo_moves(moves_made)
+        self.player_pos = pos
+
+    def replay(self, moves):
+        """
+        Проигрывает последовательность ходов (строка 'udlr' или формат ans).
+        Returns: True, если после какого-то хода уровень пройден.
+        """
+        if isinstance(moves, str) and " " in moves.strip():
+            moves = [m[0] for m in moves.lower().split()]
+        for move in moves:
+            if self.apply_move(move)['won']:
+                return True
+        return False
+
+    # =========================================================================
+    # МАРШРУТЫ
+    # =========================================================================
+
+    def find_path(self, goal):
+        """
+        Кратчайший безопасный маршрут игрока до клетки goal: A* по маскам
+        барьеров, без стен и яда, в обход коробок (ничего не толкает).
+        Returns: строка ходов 'udlr' ('' - игрок уже там) или None, если не дойти.
+        """
+        cols, rows = self.cols, self.rows
+        gx, gy = goal
+        if not (0 <= gx < cols and 0 <= gy < rows):
+            return None
+        layout = self.movable_manager.layout
+        if (gx, gy) in layout:
+            return None
+        dist = self.distances
+        # Недостижимую даже сквозь коробки клетку не ищем - ответ по карте за O(1)
+        if dist is not None and dist.distance(self.player_pos, goal) is None:
+            return None
+
+        start = self.player_pos[1] * cols + self.player_pos[0]
+        target = gy * cols + gx
+        if dist is not None and dist.ready:
+            # Карта посчитана: расстояние без коробок - точная допустимая оценка
+            h = lambda cell: dist.distance(divmod(cell, cols)[::-1], goal)
+        else:
+            h = lambda cell: abs(cell % cols - gx) + abs(cell // cols - gy)
+
+        steps = self.step_masks
+        best = {start: 0}
+        came = {}   # клетка -> (предыдущая клетка, код хода)
+        # (f, -g, клетка): при равных f раскрываются более глубокие
+        heap = [(h(start), 0, start)]
+        while heap:
+            _, neg_g, cell = heapq.heappop(heap)
+            if cell == target:
+                break
+            g = -neg_g
+            if g > best[cell]:
+                continue
+            y, x = divmod(cell, cols)
+            mask = steps[cell]
+            for code, (dx, dy) in enumerate(DIR_DELTA):
+                nx, ny = x + dx, y + dy
+                if mask & (0x11 << code) or not (0 <= nx < cols and 0 <= ny < rows) \
+                        or (nx, ny) in layout:
+                    continue
+                other = ny * cols + nx
+                if g + 1 < best.get(other, g + 2):
+                    estimate = h(other)
+                    if estimate is None:
+                        continue    # из клетки до цели не дойти
+                    best[other] = g + 1
+                    came[other] = (cell, code)
+                    heapq.heappush(heap, (g + 1 + estimate, -(g + 1), other))
+        else:
+            return None
+
+        moves = []
+        cell = target
+        while cell != start:
+            cell, code = came[cell]
+            moves.append(CODE_MOVES[code])
+        return "".join(reversed(moves))
+
+    def walk(self, moves):
+        """
+        Проходит маршрут (find_path) одним действием: одна запись журнала
+        отмены на весь путь, Z откатывает его целиком. Останавливается перед
+        ходом в барьер, коробку или яд и после победы.
+
+        Returns:
+            dict как у apply_move и 'steps' - сколько ходов сделано
+        """
+        cols, rows = self.cols, self.rows
+        steps = self.step_masks
+        layout = self.movable_manager.layout
+        done = 0
+        won = False
+        for move in moves:
+            code = MOVE_CODES[move]
+            x, y = self.player_pos
+            dx, dy = DIR_DELTA[code]
+            tx, ty = x + dx, y + dy
+            if steps[y * cols + x] & (0x11 << code) or not (0 <= tx < cols and 0 <= ty < rows) \
+                    or (tx, ty) in layout:
+                break
+            if not done:
+                self.state_manager.push_move(self.player_pos, self.path_positions,
+                                             self.dev_recording)
+            self._advance(move, [tx, ty])
+            done += 1
+            if self.tracker.is_satisfied():
+                won = True
+                break
+
+        return {'moved': done > 0, 'died': None, 'moves_made': NO_MOVES, 'won': won,
+                'steps': done}
+
+    # =========================================================================
+    # ОТМЕНА И СОХРАНЕНИЯ
+    # =========================================================================
+
+    def undo(self):
+        """
+        Откатывает последнюю запись журнала (клавиша Z).
+        Returns: False, если история пуста.
+        """
+        data = self.state_manager.pop(self.path_positions, self.player_history,
+                                      self.dev_recording, self.movable_manager)
+        if not data:
+            return False
+
+        self.player_pos = data['pos']
+        if data['popped'] is None:
+            self.path_dirty = 0
+            self.tracker.rebuild(self.path_positions, self.player_history)
+        else:
+            self._touch_path(len(self.path_positions))
+            for _ in range(data['popped']):
+                self.tracker.pop()
+        return True
+
+    def save_manual(self):
+        self.state_manager.save_manual(self.player_pos, self.path_positions, self.player_history,
+                                       self.dev_recording, self.movable_manager.copy_state())
+
+    def load_manual(self):
+        """Загружает ручное сохранение (клавиша L). Returns: False, если слота нет."""
+        data = self.state_manager.load_manual()
+        if not data:
+            return False
+
+        if self.state_manager.history:
+            self._push_snapshot(chained=True)
+        self.restore(data)
+        return True
+
+    def snapshot(self):
+        """Полный снимок состояния (для restore)."""
+        return self.state_manager._snapshot(self.player_pos, self.path_positions,
+                                            self.player_history, self.dev_recording,
+                                            self.movable_manager.copy_state())
+
+    def restore(self, state):
+        """Восстанавливает снимок, не записывая его в журнал."""
+        self.player_pos = list(state['pos'])
+        self.path_positions = list(state['path'])
+        self.path_dirty = 0
+        self.player_history = list(state['hist'])
+        self.dev_recording = list(state['dev'])
+        if state.get('movable') is not None:
+            self.movable_manager.restore_state(state['movable'])
+        self.tracker.rewind(self.path_positions, self.player_history)
+
+    # =========================================================================
+    # СОСТОЯНИЕ
+    # =========================================================================
+
+    def _touch_path(self, index):
+        if index < self.path_dirty:
+            self.path_dirty = index
+
+    def take_path_changes(self):
+        """
+        Returns: номер первого шага пути, изменённого с прошлого вызова
+        (len(path_positions) - изменений нет). Для инкрементальной отрисовки пути.
+        """
+        changed = self.path_dirty
+        self.path_dirty = len(self.path_positions)
+        return changed
+
+    @property
+    def state_hash(self):
+        """
+        Zobrist-хеш позиции: игрок + все объекты, O(1).
+        Для таблиц транспозиций и поиска повторов вместо сравнения раскладок.
+        Прогресс условий (посещения, порядок) в хеш не входит.
+        """
+        x, y = self.player_pos
+        return self.movable_manager.layout.zobrist ^ zobrist_key(x, y, ZOBRIST_PLAYER)
+
+    def reachable(self):
+        """
+        Доска клеток, куда игрок дойдёт из текущей, не сдвигая объекты
+        (нужен bitboard=True). Пройденные клетки - self.tracker.visited.
+        """
+        x, y = self.player_pos
+        board = self.board
+        return board.reachable(board.bit(x, y), self.movable_manager.occupied)
+
+    @property
+    def steps(self):
+        return len(self.path_positions) - 1
+
+    def is_won(self):
+        return self.tracker is not None and self.tracker.is_satisfied()
@@ -1,12 +1,15 @@
 import pygame
 import sys
 import threading
-import json
 import os
+from collections import OrderedDict
 # из проекта
-import savestates
 import editor
 import movable
+import engine
+from barriers import KIND_SHIFT, FWD, BACK
+from levels import process_level_data, open_level_pack
+from conditions import resolve_cells, normalize_moves
 
 # --- ЦВЕТА ---
 COLOR_BG = (0, 0, 0)
@@ -37,6 +40,15 @@ dev_disable_victory = False
 editor_mode = False
 
 SIDE_PANEL_WIDTH = 250 
+
+# Перерисовка по событиям: в простое цикл спит в pygame.event.wait
+IDLE_WAIT_MS = 500
+REDRAW_EVENT = pygame.USEREVENT + 1   # запрос перерисовки из консоли
+REDRAW_EVENT_TYPES = {pygame.KEYDOWN, pygame.VIDEOEXPOSE, pygame.VIDEORESIZE,
+                      pygame.ACTIVEEVENT, REDRAW_EVENT}
+
+# Камера: клетки не мельче MIN_CELL_SIZE, большие уровни прокручиваются за игроком
+MIN_CELL_SIZE = 24
 WINDOW_WIDTH = 800
 WINDOW_HEIGHT = 600
 CELL_SIZE = 50
@@ -44,300 +56,6 @@ GRID_COLS = 16
 GRID_ROWS = 12
 LEVELS = []
 
-# =============================================================================
-# РАБОТА С ФАЙЛАМИ
-# =============================================================================
-
-def resource_path(relative_path):
-    try:
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
-    return os.path.join(base_path, relative_path)
-
-# =============================================================================
-# НОВАЯ СИСТЕМА ПАРСИНГА БАРЬЕРОВ
-# =============================================================================
-
-class BarrierParser:
-    """Парсер барьеров с поддержкой нового консистентного формата."""
-    
-    SIDE_MAP = {
-        'u': 'up', 'd': 'down', 'l': 'left', 'r': 'right',
-        'up': 'up', 'down': 'down', 'left': 'left', 'right': 'right'
-    }
-    ALL_SIDES = ['up', 'down', 'left', 'right']
-    
-    @classmethod
-    def parse_sides(cls, sides_str):
-        if not sides_str or sides_str in ["all", "box", "square", "lrud", "udlr"]:
-            return cls.ALL_SIDES[:]
-        
-        result = []
-        for c in sides_str.lower():
-            if c in cls.SIDE_MAP:
-                side = cls.SIDE_MAP[c]
-                if side not in result:
-                    result.append(side)
-        return result if result else cls.ALL_SIDES[:]
-    
-    @classmethod
-    def generate_rect_cells(cls, start, end):
-        x1, y1 = int(start[0]), int(start[1])
-        x2, y2 = int(end[0]), int(end[1])
-        return [
-            (x, y)
-            for x in range(min(x1, x2), max(x1, x2) + 1)
-            for y in range(min(y1, y2), max(y1, y2) + 1)
-        ]
-    
-    @classmethod
-    def generate_perimeter(cls, start, end, sides):
-        x1 = min(int(start[0]), int(end[0]))
-        y1 = min(int(start[1]), int(end[1]))
-        x2 = max(int(start[0]), int(end[0]))
-        y2 = max(int(start[1]), int(end[1]))
-        
-        result = []
-        if 'left' in sides:
-            result.extend(((x1, y), 'left') for y in range(y1, y2 + 1))
-        if 'right' in sides:
-            result.extend(((x2, y), 'right') for y in range(y1, y2 + 1))
-        if 'up' in sides:
-            result.extend(((x, y1), 'up') for x in range(x1, x2 + 1))
-        if 'down' in sides:
-            result.extend(((x, y2), 'down') for x in range(x1, x2 + 1))
-        return result
-    
-    @classmethod
-    def is_new_format(cls, item):
-        return isinstance(item, dict) and any(
-            key in item for key in ["cell", "cells", "range", "ranges", "type", "sides", "mode"]
-        )
-    
-    @classmethod
-    def is_coord(cls, item):
-        return (isinstance(item, list) and len(item) == 2 and
-                isinstance(item[0], (int, float)) and isinstance(item[1], (int, float)))
-    
-    @classmethod
-    def parse_item(cls, item, default_type="both"):
-        if not isinstance(item, dict):
-            return []
-        
-        walls = []
-        b_type = item.get("type", default_type)
-        mode = item.get("mode", "fill")
-        sides_str = item.get("sides", "all")
-        sides = cls.parse_sides(sides_str)
-        
-        targets = []
-        
-        if "cell" in item:
-            c = item["cell"]
-            targets.append(("cell", (int(c[0]), int(c[1]))))
-        
-        if "cells" in item:
-            for c in item["cells"]:
-                targets.append(("cell", (int(c[0]), int(c[1]))))
-        
-        if "range" in item:
-            r = item["range"]
-            targets.append(("range", 
-                           (int(r[0][0]), int(r[0][1])),
-                           (int(r[1][0]), int(r[1][1]))))
-        
-        if "ranges" in item:
-            for r in item["ranges"]:
-                targets.append(("range",
-                               (int(r[0][0]), int(r[0][1])),
-                               (int(r[1][0]), int(r[1][1]))))
-        
-        except_set = set()
-        if "except" in item:
-            for exc in item["except"]:
-                if isinstance(exc, dict):
-                    for coords, side, _ in cls.parse_item(exc, b_type):
-                        except_set.add((coords, side))
-        
-        for target in targets:
-            if target[0] == "cell":
-                cell = target[1]
-                for side in sides:
-                    if (cell, side) not in except_set:
-                        walls.append((cell, side, b_type))
-            
-            elif target[0] == "range":
-                start, end = target[1], target[2]
-                
-                if mode == "perimeter":
-                    for coords, side in cls.generate_perimeter(start, end, sides):
-                        if (coords, side) not in except_set:
-                            walls.append((coords, side, b_type))
-                else:
-                    for cell in cls.generate_rect_cells(start, end):
-                        for side in sides:
-                            if (cell, side) not in except_set:
-                                walls.append((cell, side, b_type))
-        
-        return walls
-    
-    @classmethod
-    def parse_legacy_item(cls, item):
-        if not isinstance(item, list) or len(item) != 2:
-            return []
-        
-        raw_target, sides_dict = item[0], item[1]
-        if not isinstance(sides_dict, dict):
-            return []
-        
-        walls = []
-        modes = sides_dict.get("modes", [])
-        except_spec = sides_dict.get("except", [])
-        
-        is_perimeter = "perimeter" in modes or "box" in modes
-        
-        perimeter_sides_override = None
-        if is_perimeter:
-            for m in modes:
-                if m not in ["perimeter", "box", "fill", "standart", "standard"]:
-                    if m and all(c.lower() in "lrud" for c in m):
-                        perimeter_sides_override = cls.parse_sides(m)
-                        break
-        
-        except_set = set()
-        for exc in except_spec:
-            if cls.is_new_format(exc):
-                for coords, side, _ in cls.parse_item(exc):
-                    except_set.add((coords, side))
-            elif isinstance(exc, list):
-                if cls.is_coord(exc):
-                    cell = (int(exc[0]), int(exc[1]))
-                    for side in cls.ALL_SIDES:
-                        except_set.add((cell, side))
-                elif len(exc) == 2 and cls.is_coord(exc[0]) and cls.is_coord(exc[1]):
-                    for cell in cls.generate_rect_cells(exc[0], exc[1]):
-                        for side in cls.ALL_SIDES:
-                            except_set.add((cell, side))
-        
-        def is_range(r):
-            return (isinstance(r, list) and len(r) == 2 and
-                    cls.is_coord(r[0]) and cls.is_coord(r[1]))
-        
-        def is_multi_range(r):
-            return isinstance(r, list) and all(is_range(x) for x in r)
-        
-        ranges = []
-        if is_multi_range(raw_target):
-            for r in raw_target:
-                ranges.append((tuple(r[0]), tuple(r[1])))
-        elif is_range(raw_target):
-            ranges.append((tuple(raw_target[0]), tuple(raw_target[1])))
-        else:
-            if cls.is_coord(raw_target):
-                ranges.append((tuple(raw_target), tuple(raw_target)))
-            elif isinstance(raw_target, list):
-                for c in raw_target:
-                    if cls.is_coord(c):
-                        ranges.append((tuple(c), tuple(c)))
-        
-        for sides_key, b_type in sides_dict.items():
-            if sides_key in ["modes", "except"]:
-                continue
-            if b_type not in ["inner", "outer", "both"]:
-                continue
-            
-            sides = cls.parse_sides(sides_key) if sides_key else cls.ALL_SIDES
-            
-            if is_perimeter and perimeter_sides_override is not None:
-                sides = perimeter_sides_override
-            
-            for start, end in ranges:
-                if is_perimeter:
-                    for coords, side in cls.generate_perimeter(start, end, sides):
-                        if (coords, side) not in except_set:
-                            walls.append((coords, side, b_type))
-                else:
-                    for cell in cls.generate_rect_cells(start, end):
-                        for side in sides:
-                            if (cell, side) not in except_set:
-                                walls.append((cell, side, b_type))
-        
-        return walls
-
-
-def process_level_data(data):
-    """Обрабатывает данные уровней с поддержкой нового и старого форматов."""
-    
-    for lvl in data:
-        if "grid" in lvl:
-            lvl["grid"] = tuple(lvl["grid"])
-        if "start" in lvl:
-            lvl["start"] = tuple(lvl["start"])
-        
-        if "conditions" in lvl:
-            cols, rows = lvl.get("grid", (16, 12))
-            for cond in lvl["conditions"]:
-                
-                # === НАЧАЛО ВСТАВКИ: Поддержка range в условиях ===
-                if "range" in cond:
-                    start, end = cond["range"]
-                    # Генерируем клетки прямоугольника
-                    generated_cells = BarrierParser.generate_rect_cells(start, end)
-                    
-                    # Если списка cells нет, создаем его
-                    if "cells" not in cond:
-                        cond["cells"] = []
-                    
-                    # Добавляем сгенерированные клетки в общий список
-                    cond["cells"].extend(generated_cells)
-                # === КОНЕЦ ВСТАВКИ ===
-
-                if "cells" in cond:
-                    c = cond["cells"]
-                    if isinstance(c, list) and len(c) > 0:
-                        if isinstance(c[0], (int, float)):
-                            cond["cells"] = [tuple(c)]
-                        else:
-                            cond["cells"] = [tuple(item) for item in c]
-        
-        for key in ["poison", "walls"]:
-            if key not in lvl:
-                continue
-            
-            processed = []
-            for item in lvl[key]:
-                if BarrierParser.is_new_format(item):
-                    processed.extend(BarrierParser.parse_item(item))
-                else:
-                    processed.extend(BarrierParser.parse_legacy_item(item))
-            
-            lvl[key] = processed
-    
-    return data
-
-
-def load_levels_from_file(filename, is_internal=True):
-    if is_internal:
-        path = resource_path(filename)
-    else:
-        path = os.path.abspath(filename)
-
-    if not os.path.exists(path):
-        print(f"[ERROR] Файл не найден: {path}")
-        return None
-
-    try:
-        print(f"[LOAD] {path}")
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return process_level_data(data)
-    except Exception as e:
-        print(f"[ERROR] JSON: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
-
 # =============================================================================
 # РАБОТА СО ШРИФТАМИ
 # =============================================================================
@@ -360,6 +78,30 @@ def get_font(size, bold=False):
         _font_cache[key] = font
     return _font_cache[key]
 
+# Кэш отрисованного текста: (текст, размер, жирный, цвет) -> Surface.
+# Номера шагов, подписи условий и координаты повторяются каждый кадр,
+# поэтому каждая уникальная подпись растеризуется один раз.
+TEXT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+_text_cache = OrderedDict()
+_text_cache_bytes = 0
+
+def render_text(text, size, bold=False, color=(255, 255, 255)):
+    """Surface с текстом из LRU-кэша. Давно не использованные подписи вытесняются по лимиту памяти."""
+    global _text_cache_bytes
+    key = (text, size, bold, tuple(color))
+    ts = _text_cache.get(key)
+    if ts is not None:
+        _text_cache.move_to_end(key)
+        return ts
+
+    ts = get_font(size, bold).render(text, True, color)
+    _text_cache[key] = ts
+    _text_cache_bytes += ts.get_width() * ts.get_height() * ts.get_bytesize()
+    while _text_cache_bytes > TEXT_CACHE_MAX_BYTES and len(_text_cache) > 1:
+        _, old = _text_cache.popitem(last=False)
+        _text_cache_bytes -= old.get_width() * old.get_height() * old.get_bytesize()
+    return ts
+
 # =============================================================================
 # УТИЛИТЫ
 # =============================================================================
@@ -374,67 +116,6 @@ def dim_color(color, factor=0.4):
     )
 
 
-def resolve_cells(cells_spec, grid_cols, grid_rows):
-    if isinstance(cells_spec, list):
-        return [tuple(c) for c in cells_spec]
-    if cells_spec == "corners":
-        return [(0, 0), (grid_cols - 1, 0), (0, grid_rows - 1), (grid_cols - 1, grid_rows - 1)]
-    elif cells_spec == "edges":
-        edges = set()
-        for x in range(grid_cols): edges.add((x, 0)); edges.add((x, grid_rows - 1))
-        for y in range(grid_rows): edges.add((0, y)); edges.add((grid_cols - 1, y))
-        return list(edges)
-    elif cells_spec == "center":
-        return [(grid_cols // 2, grid_rows // 2)]
-    return []
-
-def is_prime(n):
-    if n < 2: return False
-    if n == 2: return True
-    if n % 2 == 0: return False
-    for i in range(3, int(n**0.5) + 1, 2):
-        if n % i == 0: return False
-    return True
-
-def eval_step_expr(expr, step):
-    expr = expr.strip()
-    if "|" in expr:
-        return any(eval_step_expr(p.strip(), step) for p in expr.split("|"))
-    if "&" in expr:
-        return all(eval_step_expr(p.strip(), step) for p in expr.split("&"))
-    if expr.startswith("!"):
-        return not eval_step_expr(expr[1:], step)
-    
-    if expr == "even": return step % 2 == 0
-    elif expr == "odd": return step % 2 == 1
-    elif expr == "prime": return is_prime(step)
-    elif expr.startswith("div:"): return step % int(expr.split(":")[1]) == 0
-    elif expr.startswith("mod:"):
-        parts = expr.split(":")
-        return step % int(parts[1]) == int(parts[2])
-    elif expr.startswith("range:"):
-        parts = expr.split(":")
-        return int(parts[1]) <= step <= int(parts[2])
-    elif expr.startswith("gt:"): return step > int(expr.split(":")[1])
-    elif expr.startswith("lt:"): return step < int(expr.split(":")[1])
-    elif expr.startswith("gte:"): return step >= int(expr.split(":")[1])
-    elif expr.startswith("lte:"): return step <= int(expr.split(":")[1])
-    return False
-
-def parse_steps(condition, max_steps=500):
-    result = set()
-    if "step_expr" in condition:
-        for s in range(max_steps):
-            if eval_step_expr(condition["step_expr"], s):
-                result.add(s)
-        return result
-    if "step" in condition: result.add(condition["step"])
-    if "steps" in condition: result.update(condition["steps"])
-    if "step_range" in condition:
-        start, end = condition["step_range"]
-        result.update(range(start, end + 1))
-    return result
-
 def format_steps(condition):
     if "step_expr" in condition:
         expr = condition["step_expr"]
@@ -452,163 +133,12 @@ def format_steps(condition):
         parts.append(f"{s}-{e}")
     return ",".join(parts) if parts else "?"
 
-OPERATORS = {
-    "==": lambda a, b: a == b, ">=": lambda a, b: a >= b, "<=": lambda a, b: a <= b,
-    ">": lambda a, b: a > b, "<": lambda a, b: a < b, "!=": lambda a, b: a != b,
-    "=": lambda a, b: a == b,
-}
 OP_SYMBOLS = {"==": "=", ">=": "≥", "<=": "≤", ">": ">", "<": "<", "!=": "≠"}
 
 # =============================================================================
-# ПРОВЕРКА ПОСЛЕДОВАТЕЛЬНОСТИ ХОДОВ
+# 1. ОТОБРАЖЕНИЕ ПОСЛЕДОВАТЕЛЬНОСТИ ХОДОВ
 # =============================================================================
 
-def normalize_moves(moves_spec):
-    """Нормализует спецификацию ходов в список."""
-    if isinstance(moves_spec, str):
-        mapping = {"up": "u", "down": "d", "left": "l", "right": "r"}
-        result = []
-        for m in moves_spec.lower().split():
-            if m in mapping:
-                result.append(mapping[m])
-            elif m in ["u", "d", "l", "r"]:
-                result.append(m)
-        return result
-    elif isinstance(moves_spec, list):
-        mapping = {"up": "u", "down": "d", "left": "l", "right": "r"}
-        return [mapping.get(m.lower(), m.lower()) for m in moves_spec 
-                if m.lower() in ["u", "d", "l", "r", "up", "down", "left", "right"]]
-    return []
-
-
-def count_sequence_occurrences(history, seq, overlapping=False):
-    """
-    Подсчитывает количество вхождений последовательности.
-    
-    Args:
-        history: список ходов игрока
-        seq: искомая последовательность
-        overlapping: разрешить перекрывающиеся вхождения
-    """
-    if not seq or len(seq) > len(history):
-        return 0
-    
-    count = 0
-    i = 0
-    while i <= len(history) - len(seq):
-        if history[i:i+len(seq)] == seq:
-            count += 1
-            i += 1 if overlapping else len(seq)
-        else:
-            i += 1
-    return count
-
-
-def check_sequence_match(history, seq, mode, min_count=1):
-    """
-    Проверяет соответствие последовательности.
-    
-    Args:
-        history: список ходов игрока
-        seq: искомая последовательность
-        mode: "contains", "exact", "starts_with", "ends_with", "not_contains"
-        min_count: минимальное количество вхождений (для contains)
-    """
-    if not seq:
-        return True
-    
-    if mode == "exact":
-        return history == seq
-    elif mode == "starts_with":
-        return len(history) >= len(seq) and history[:len(seq)] == seq
-    elif mode == "ends_with":
-        return len(history) >= len(seq) and history[-len(seq):] == seq
-    elif mode == "not_contains":
-        return count_sequence_occurrences(history, seq) == 0
-    else:  # contains (default)
-        return count_sequence_occurrences(history, seq) >= min_count
-
-
-# =============================================================================
-# 1. УЛУЧШЕННАЯ ПРОВЕРКА ПОСЛЕДОВАТЕЛЬНОСТИ ХОДОВ (с полными операторами)
-# =============================================================================
-
-def check_sequence_condition(cond, player_history):
-    """
-    Проверяет условие типа sequence с полным набором операторов.
-    
-    Форматы:
-    {
-        "check": "sequence",
-        "moves": "u d l r",              // одна последовательность
-        "mode": "contains",              // contains/exact/starts_with/ends_with/not_contains
-        "count": 1,                      // количество вхождений
-        "operator": ">=",                // ==, >=, <=, >, <, != для count
-        "min": 1, "max": 3,              // диапазон вхождений (альтернатива operator+count)
-        "overlapping": false             // перекрывающиеся вхождения
-    }
-    
-    {
-        "check": "sequence",
-        "any": ["u u", "d d"],           // любая из последовательностей
-        "all": ["u d", "l r"],           // все последовательности
-        "mode": "not_contains"           // требовать ОТСУТСТВИЕ последовательности
-    }
-    """
-    mode = cond.get("mode", "contains")
-    overlapping = cond.get("overlapping", False)
-    
-    # Получаем параметры подсчета
-    count_target = cond.get("count", 1)
-    operator = cond.get("operator", ">=")
-    min_count = cond.get("min", None)
-    max_count = cond.get("max", None)
-    
-    def check_single_sequence(seq_spec):
-        seq = normalize_moves(seq_spec)
-        if not seq:
-            return True
-        
-        actual_count = count_sequence_occurrences(player_history, seq, overlapping)
-        
-        # Режимы без подсчета
-        if mode == "exact":
-            return player_history == seq
-        elif mode == "starts_with":
-            return len(player_history) >= len(seq) and player_history[:len(seq)] == seq
-        elif mode == "ends_with":
-            return len(player_history) >= len(seq) and player_history[-len(seq):] == seq
-        elif mode == "not_contains":
-            # Для not_contains можно указать max=0 или просто требовать 0 вхождений
-            if max_count is not None:
-                return actual_count <= max_count
-            return actual_count == 0
-        else:  # contains
-            # Применяем оператор или диапазон
-            if min_count is not None and max_count is not None:
-                return min_count <= actual_count <= max_count
-            elif min_count is not None:
-                return actual_count >= min_count
-            elif max_count is not None:
-                return actual_count <= max_count
-            else:
-                # Используем operator и count
-                op_func = OPERATORS.get(operator, OPERATORS[">="])
-                return op_func(actual_count, count_target)
-    
-    # Обработка any/all с учетом match (для совместимости)
-    match = cond.get("match", "all")
-    
-    if "any" in cond:
-        return any(check_single_sequence(s) for s in cond["any"])
-    
-    if "all" in cond:
-        return all(check_single_sequence(s) for s in cond["all"])
-    
-    # Одиночная последовательность
-    return check_single_sequence(cond.get("moves", ""))
-
-
 def format_sequence_requirement(cond):
     """Форматирует требование sequence для отображения с полными операторами."""
     mode = cond.get("mode", "contains")
@@ -660,48 +190,7 @@ def format_sequence_requirement(cond):
         return f"{symbol}{seq}{suffix}"
     
 # =============================================================================
-# 2. ПРОВЕРКА ЯДА НА ГРАНИЦАХ УРОВНЯ
-# =============================================================================
-
-def check_poison_on_exit(current_pos, move_dir, poison_data):
-    """
-    Проверяет, есть ли яд при попытке выйти из клетки (inner barrier).
-    Вызывается ПЕРЕД проверкой валидности целевой позиции.
-    """
-    if not poison_data:
-        return False
-    
-    for b_pos, b_side, b_type in poison_data:
-        if tuple(current_pos) == b_pos and b_side == move_dir and b_type in ["inner", "both"]:
-            return True
-    return False
-
-
-def check_poison_on_entry(next_pos, move_dir, poison_data, grid_cols, grid_rows):
-    """
-    Проверяет, есть ли яд при попытке войти в клетку (outer barrier).
-    Также проверяет границы уровня.
-    """
-    if not poison_data:
-        return False
-    
-    opposite = {"right": "left", "left": "right", "down": "up", "up": "down"}
-    entry_side = opposite.get(move_dir, move_dir)
-    
-    nx, ny = next_pos
-    
-    # Проверка выхода за границы - если есть outer яд на текущей клетке
-    if not (0 <= nx < grid_cols and 0 <= ny < grid_rows):
-        return False  # За границей нет яда по entry, только по exit
-    
-    for b_pos, b_side, b_type in poison_data:
-        if tuple(next_pos) == b_pos and b_side == entry_side and b_type in ["outer", "both"]:
-            return True
-    
-    return False
-
-# =============================================================================
-# 3. ПЕРЕНОС ТЕКСТА ГЛОБАЛЬНЫХ ТРЕБОВАНИЙ
+# 2. ПЕРЕНОС ТЕКСТА ГЛОБАЛЬНЫХ ТРЕБОВАНИЙ
 # =============================================================================
 
 def wrap_text(text, font, max_width):
@@ -745,148 +234,10 @@ def wrap_text(text, font, max_width):
     
     return lines if lines else [text]
 
-
-
-
-
 # =============================================================================
-# ПРОВЕРКА УСЛОВИЙ
+# КЛЕТКИ УСЛОВИЙ
 # =============================================================================
 
-def check_condition(cond, path, player_pos, cols, rows, player_history=None):
-    """Проверяет одно условие. player_history нужен для check=sequence."""
-    check = cond.get("check", "")
-    cells = resolve_cells(cond.get("cells", []), cols, rows)
-    match = cond.get("match", "all")
-    
-    if check == "group":
-        logic = cond.get("logic", "AND").upper()
-        items = cond.get("items", [])
-        results = [check_condition(item, path, player_pos, cols, rows, player_history) 
-                   for item in items]
-        if logic == "AND": return all(results)
-        elif logic == "OR": return any(results)
-        elif logic == "NOT": return not results[0] if results else True
-        elif logic == "XOR": return sum(results) == 1
-        return False
-    
-    # НОВОЕ: проверка последовательности ходов
-    if check == "sequence":
-        if player_history is None:
-            return False
-        return check_sequence_condition(cond, player_history)
-    
-    if check == "visit":
-        visit_counts = {}
-        for pos in path:
-            visit_counts[pos] = visit_counts.get(pos, 0) + 1
-        
-        if "min" in cond or "max" in cond:
-            min_c, max_c = cond.get("min", 0), cond.get("max", 999999)
-            if match == "any":
-                return any(min_c <= visit_counts.get(c, 0) <= max_c for c in cells)
-            return all(min_c <= visit_counts.get(c, 0) <= max_c for c in cells)
-        
-        count = cond.get("count", 1)
-        
-        # === ИСПРАВЛЕНИЕ: для count=0 используем == по умолчанию ===
-        if count == 0:
-            default_op = "=="
-        else:
-            default_op = ">="
-        op_func = OPERATORS.get(cond.get("operator", default_op), OPERATORS[default_op])
-        # === КОНЕЦ ИСПРАВЛЕНИЯ ===
-        
-        if match == "any":
-            return any(op_func(visit_counts.get(c, 0), count) for c in cells)
-        return all(op_func(visit_counts.get(c, 0), count) for c in cells)
-    
-    if check == "at_steps":
-        mode = cond.get("mode", "require")
-        cells_set = set(cells)
-        
-        if "step_expr" in cond:
-            expr = cond["step_expr"]
-            if mode == "avoid":
-                for i, pos in enumerate(path):
-                    if pos in cells_set and eval_step_expr(expr, i):
-                        return False
-                return True
-            else:
-                cell_valid = {c: False for c in cells}
-                for i, pos in enumerate(path):
-                    if pos in cells_set and eval_step_expr(expr, i):
-                        cell_valid[pos] = True
-                return any(cell_valid.values()) if match == "any" else all(cell_valid.get(c, False) for c in cells)
-        
-        target_steps = parse_steps(cond)
-        cell_steps = {}
-        for i, pos in enumerate(path):
-            if pos not in cell_steps: cell_steps[pos] = set()
-            cell_steps[pos].add(i)
-        
-        if mode == "avoid":
-            for i, pos in enumerate(path):
-                if pos in cells_set and i in target_steps:
-                    return False
-            return True
-        else:
-            if match == "any":
-                return any(c in cell_steps and target_steps.issubset(cell_steps[c]) for c in cells)
-            return all(c in cell_steps and target_steps.issubset(cell_steps[c]) for c in cells)
-    
-    if check == "end_at":
-        return tuple(player_pos) in cells
-    
-    if check == "order":
-        first_visits = {}
-        for i, pos in enumerate(path):
-            if pos not in first_visits: first_visits[pos] = i
-        prev = -1
-        for c in cells:
-            if c not in first_visits or first_visits[c] <= prev:
-                return False
-            prev = first_visits[c]
-        return True
-    
-    if check == "consecutive":
-        count = cond.get("count", 2)
-        def max_consecutive(cell):
-            max_c = current = 0
-            for pos in path:
-                if pos == cell:
-                    current += 1
-                    max_c = max(max_c, current)
-                else:
-                    current = 0
-            return max_c
-        if match == "any":
-            return any(max_consecutive(c) >= count for c in cells)
-        return all(max_consecutive(c) >= count for c in cells)
-    
-    if check == "no_revisit":
-        exceptions = set(resolve_cells(cond.get("except", []), cols, rows))
-        visit_counts = {}
-        for pos in path:
-            visit_counts[pos] = visit_counts.get(pos, 0) + 1
-        for pos, cnt in visit_counts.items():
-            if cnt > 1 and pos not in exceptions:
-                return False
-        return True
-    
-    if check == "total_steps":
-        count = cond.get("count", 0)
-        op_func = OPERATORS.get(cond.get("operator", "=="), OPERATORS["=="])
-        return op_func(len(path) - 1, count)
-    
-    return False
-
-
-def check_all_conditions(conditions, path, player_pos, cols, rows, player_history=None):
-    return all(check_condition(c, path, player_pos, cols, rows, player_history) 
-               for c in conditions)
-
-
 def get_condition_cells(level_data, cols, rows):
     cells = set()
     def extract(cond):
@@ -897,7 +248,7 @@ def get_condition_cells(level_data, cols, rows):
                 extract(item)
     for cond in level_data.get("conditions", []):
         extract(cond)
-    return list(cells)
+    return cells
 
 # =============================================================================
 # СИСТЕМА ТРЕБОВАНИЙ
@@ -974,32 +325,60 @@ def get_condition_requirements(level_data, cols, rows):
     return requirements, global_reqs
 
 # =============================================================================
-# БАРЬЕРЫ
+# КАМЕРА
 # =============================================================================
 
-def is_path_clear(current_pos, next_pos, barriers_data):
-    if not barriers_data:
-        return True
-
-    cx, cy = current_pos
-    nx, ny = next_pos
-    
-    if nx > cx: move_dir = "right"
-    elif nx < cx: move_dir = "left"
-    elif ny > cy: move_dir = "down"
-    elif ny < cy: move_dir = "up"
-    else: return True
-    
-    opposite = {"right": "left", "left": "right", "down": "up", "up": "down"}
-    entry_side = opposite[move_dir]
-
-    for b_pos, b_side, b_type in barriers_data:
-        if tuple(current_pos) == b_pos and b_side == move_dir and b_type in ["inner", "both"]:
-            return False
-        if tuple(next_pos) == b_pos and b_side == entry_side and b_type in ["outer", "both"]:
-            return False
-    return True
+class Viewport:
+    """
+    Видимая часть сетки: прямоугольник клеток [x0, x1) x [y0, y1).
+    Если уровень целиком помещается на экран, камера не двигается.
+    """
 
+    def __init__(self, grid_cols, grid_rows, cols, rows):
+        self.grid_cols, self.grid_rows = grid_cols, grid_rows
+        self.cols, self.rows = min(cols, grid_cols), min(rows, grid_rows)
+        self.x0 = self.y0 = 0
+
+    @property
+    def rect(self):
+        return (self.x0, self.y0, self.x0 + self.cols, self.y0 + self.rows)
+
+    @staticmethod
+    def _follow_axis(start, p, size, total):
+        margin = size // 4
+        if p < start + margin:
+            start = p - margin
+        elif p >= start + size - margin:
+            start = p - size + margin + 1
+        return max(0, min(start, total - size))
+
+    def cell_at(self, px, py, cell_size):
+        """Клетка сетки под точкой (px, py) поля (от его левого верхнего угла) или None."""
+        if px < 0 or py < 0:
+            return None
+        cx, cy = int(px // cell_size), int(py // cell_size)
+        if cx >= self.cols or cy >= self.rows:
+            return None
+        return (self.x0 + cx, self.y0 + cy)
+
+    def follow(self, pos):
+        """Держит игрока не ближе четверти экрана к краю. Returns: True, если камера сдвинулась."""
+        x0 = self._follow_axis(self.x0, pos[0], self.cols, self.grid_cols)
+        y0 = self._follow_axis(self.y0, pos[1], self.rows, self.grid_rows)
+        moved = (x0, y0) != (self.x0, self.y0)
+        self.x0, self.y0 = x0, y0
+        return moved
+
+
+def cells_in_view(cells, view):
+    """
+    Клетки из cells (set/dict по клеткам), попавшие в view.
+    Перебирает меньшее из двух: сами клетки или видимый прямоугольник.
+    """
+    x0, y0, x1, y1 = view
+    if len(cells) <= (x1 - x0) * (y1 - y0):
+        return [c for c in cells if x0 <= c[0] < x1 and y0 <= c[1] < y1]
+    return [(x, y) for y in range(y0, y1) for x in range(x0, x1) if (x, y) in cells]
 
 # =============================================================================
 # ОТРИСОВКА
@@ -1017,10 +396,11 @@ def dim_color(color, factor=0.4):
         max(0, int(b * factor))
     )
 
-def draw_player(surface, player_pos, cell_size, dim=False):
+def draw_player(surface, player_pos, cell_size, dim=False, view=None):
     """Отрисовывает игрока. Если dim=True, цвет затемняется."""
-    px = player_pos[0] * cell_size + cell_size // 2
-    py = player_pos[1] * cell_size + cell_size // 2
+    ox, oy = view[:2] if view else (0, 0)
+    px = (player_pos[0] - ox) * cell_size + cell_size // 2
+    py = (player_pos[1] - oy) * cell_size + cell_size // 2
     radius = int(cell_size * 0.4)
     
     # Затемняем цвет при необходимости
@@ -1032,51 +412,142 @@ def draw_player(surface, player_pos, cell_size, dim=False):
     if dim:
         pygame.draw.circle(surface, (80, 80, 80), (px, py), radius, 1)
 
-def draw_grid(surface, width, height, cell_size):
+def draw_grid(surface, width, height, cell_size, color=COLOR_GRID):
     for x in range(0, width + 1, cell_size):
-        pygame.draw.line(surface, COLOR_GRID, (x, 0), (x, height))
+        pygame.draw.line(surface, color, (x, 0), (x, height))
     for y in range(0, height + 1, cell_size):
-        pygame.draw.line(surface, COLOR_GRID, (0, y), (width, y))
+        pygame.draw.line(surface, color, (0, y), (width, y))
 
-def draw_barriers(surface, barriers_data, color, cell_size):
-    if not barriers_data:
+def draw_barriers(surface, edges, kind, color, cell_size, view=None):
+    """
+    Рисует барьеры вида kind ('walls' / 'poison') из BarrierEdges.
+    Ребро, закрытое в обе стороны, - толстая линия; в одну сторону - тонкая
+    со стрелкой к клетке, из которой нельзя пройти.
+    """
+    if not edges:
         return
-    for b_pos, side, b_type in barriers_data:
-        px, py = b_pos
-        x, y = px * cell_size, py * cell_size
-        
-        if side == "up": start, end = (x, y), (x + cell_size, y)
-        elif side == "down": start, end = (x, y + cell_size), (x + cell_size, y + cell_size)
-        elif side == "left": start, end = (x, y), (x, y + cell_size)
-        elif side == "right": start, end = (x + cell_size, y), (x + cell_size, y + cell_size)
-        else: continue
-        
-        pygame.draw.line(surface, color, start, end, 5 if b_type == "both" else 3)
-        
-        if b_type != "both":
+    shift = KIND_SHIFT[kind]
+    x0, y0, x1, y1 = view if view else (0, 0, edges.cols, edges.rows)
+    for ex, ey, o, flags in edges.in_rect(x0, y0, x1, y1):
+        flags = (flags >> shift) & 15
+        if not flags:
+            continue
+        x, y = (ex - x0) * cell_size, (ey - y0) * cell_size
+        if o == 0: start, end = (x, y), (x, y + cell_size)
+        else: start, end = (x, y), (x + cell_size, y)
+        
+        both = flags & FWD and flags & BACK
+        pygame.draw.line(surface, color, start, end, 5 if both else 3)
+        
+        if not both:
             mid_x, mid_y = (start[0] + end[0]) / 2, (start[1] + end[1]) / 2
-            offset = 6
-            if side == "up":
-                dy = -offset if b_type == "outer" else offset
-                pts = [(mid_x, mid_y + dy), (mid_x - 4, mid_y), (mid_x + 4, mid_y)]
-            elif side == "down":
-                dy = offset if b_type == "outer" else -offset
-                pts = [(mid_x, mid_y + dy), (mid_x - 4, mid_y), (mid_x + 4, mid_y)]
-            elif side == "left":
-                dx = -offset if b_type == "outer" else offset
-                pts = [(mid_x + dx, mid_y), (mid_x, mid_y - 4), (mid_x, mid_y + 4)]
-            elif side == "right":
-                dx = offset if b_type == "outer" else -offset
-                pts = [(mid_x + dx, mid_y), (mid_x, mid_y - 4), (mid_x, mid_y + 4)]
+            offset = -6 if flags & FWD else 6
+            if o == 0:
+                pts = [(mid_x + offset, mid_y), (mid_x, mid_y - 4), (mid_x, mid_y + 4)]
+            else:
+                pts = [(mid_x, mid_y + offset), (mid_x - 4, mid_y), (mid_x + 4, mid_y)]
             pygame.draw.polygon(surface, color, pts)
 
-def draw_requirements(surface, requirements, cell_size):
+def render_static_layer(size, cell_size, view, condition_cells, target_pos,
+                        barrier_edges, dim=False):
+    """
+    Статический слой видимой части уровня: подложка условий, цель, сетка и барьеры.
+    Меняется только при загрузке уровня и сдвиге камеры, поэтому рисуется один раз,
+    а каждый кадр просто копируется. dim=True - затемнённый вариант для просмотра условий.
+    """
+    shade = (lambda c: dim_color(c, 0.4)) if dim else (lambda c: c)
+    ox, oy = view[:2]
+    layer = pygame.Surface(size)
+    layer.fill(COLOR_BG)
+
+    # Подложка: клетки условий
+    for cell in cells_in_view(condition_cells, view):
+        pygame.draw.rect(layer, shade(COLOR_CONDITION_HINT),
+            ((cell[0] - ox) * cell_size, (cell[1] - oy) * cell_size, cell_size, cell_size))
+
+    # Цель (для старых уровней)
+    if target_pos:
+        pygame.draw.rect(layer, shade(COLOR_TARGET),
+            ((target_pos[0] - ox) * cell_size, (target_pos[1] - oy) * cell_size, cell_size, cell_size))
+
+    # Сетка и барьеры поверх подложки
+    draw_grid(layer, (view[2] - ox) * cell_size, (view[3] - oy) * cell_size, cell_size, shade(COLOR_GRID))
+    draw_barriers(layer, barrier_edges, "walls", shade(COLOR_WALL), cell_size, view)
+    draw_barriers(layer, barrier_edges, "poison", shade(COLOR_POISON), cell_size, view)
+    return layer
+
+class StepOverlay:
+    """
+    Слой номеров шагов (до 9 первых шагов на клетку).
+    Обновляется по изменённому хвосту пути и перерисовывает только затронутые клетки,
+    поэтому стоимость кадра не зависит от длины пути.
+    """
+
+    def __init__(self, size, cell_size, view):
+        self.cell_size = cell_size
+        self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        self.view = view
+        self.positions = []     # копия пути на момент последнего update
+        self.cells = {}         # клетка -> номера шагов (не больше 9)
+
+    def set_view(self, view):
+        """Сдвиг камеры: слой перерисовывается по видимым клеткам."""
+        self.view = view
+        self.surface.fill((0, 0, 0, 0))
+        for pos in cells_in_view(self.cells, view):
+            self._repaint(pos)
+
+    def update(self, path_positions, changed_from):
+        """changed_from - первый изменённый шаг пути (Engine.take_path_changes)."""
+        changed_from = min(changed_from, len(self.positions))
+        touched = set()
+
+        # Снимаем отменённые шаги: в клетке остаются только более ранние
+        for pos in self.positions[changed_from:]:
+            if pos not in touched:
+                touched.add(pos)
+                steps = [s for s in self.cells[pos] if s < changed_from]
+                if steps:
+                    self.cells[pos] = steps
+                else:
+                    del self.cells[pos]
+        del self.positions[changed_from:]
+
+        for step in range(changed_from, len(path_positions)):
+            pos = path_positions[step]
+            self.positions.append(pos)
+            steps = self.cells.setdefault(pos, [])
+            if len(steps) < 9:
+                steps.append(step)
+                touched.add(pos)
+
+        for pos in touched:
+            self._repaint(pos)
+
+    def _repaint(self, pos):
+        x0, y0, x1, y1 = self.view
+        if not (x0 <= pos[0] < x1 and y0 <= pos[1] < y1):
+            return
+        cs = self.cell_size
+        rect = pygame.Rect((pos[0] - x0) * cs, (pos[1] - y0) * cs, cs, cs)
+        self.surface.fill((0, 0, 0, 0), rect)
+        self.surface.set_clip(rect)
+        for i, val in enumerate(self.cells.get(pos, ())):
+            size = max(8, cs // 7) if val >= 100 else max(10, cs // 5)
+            ts = render_text(str(val), size, False, COLOR_TEXT)
+            self.surface.blit(ts, (rect.x + 2 + (i % 3) * (cs // 3),
+                                   rect.y + 2 + (i // 3) * (cs // 3)))
+        self.surface.set_clip(None)
+
+def draw_requirements(surface, requirements, cell_size, view=None):
     mini = cell_size // 3
     font_size_base = int(mini * 0.65)
+    ox, oy = view[:2] if view else (0, 0)
     
-    for pos, reqs in requirements.items():
+    for pos in (cells_in_view(requirements, view) if view else requirements):
+        reqs = requirements[pos]
         x, y = pos
-        base_x, base_y = x * cell_size, y * cell_size
+        base_x, base_y = (x - ox) * cell_size, (y - oy) * cell_size
         
         # --- ИСПРАВЛЕНИЕ: УБРАЛИ ЧЕРНЫЙ ОВЕРЛЕЙ ---
         # overlay = pygame.Surface((cell_size, cell_size), pygame.SRCALPHA)
@@ -1111,8 +582,7 @@ def draw_requirements(surface, requirements, cell_size):
             elif req_type == "consecutive":
                 arc_rect = pygame.Rect(cx - r, cy - r, r * 2, r * 2)
                 pygame.draw.arc(surface, color, arc_rect, 0.5, 5.8, 2)
-                f = get_font(int(mini * 0.6), bold=True)
-                ts = f.render(text.replace("⟳", ""), True, color)
+                ts = render_text(text.replace("⟳", ""), int(mini * 0.6), True, color)
                 surface.blit(ts, ts.get_rect(center=(cx, cy)))
             else:
                 display_text = text
@@ -1131,13 +601,13 @@ def draw_requirements(surface, requirements, cell_size):
                 if len(display_text) > 2: 
                     current_font_size = int(mini * 0.45)
                 
-                font = get_font(current_font_size, bold=True)
-                ts = font.render(display_text, True, color)
+                ts = render_text(display_text, current_font_size, True, color)
                 surface.blit(ts, ts.get_rect(center=(cx, cy)))
 
 
-def draw_global_requirements(surface, global_reqs, font, panel_x_start):
+def draw_global_requirements(surface, global_reqs, font_size, panel_x_start):
     """Отрисовывает глобальные требования с переносом текста."""
+    font = get_font(font_size, bold=True)
     y = 10
     max_width = SIDE_PANEL_WIDTH - 30  # Отступы по бокам
     line_spacing = 4
@@ -1171,7 +641,7 @@ def draw_global_requirements(surface, global_reqs, font, panel_x_start):
         # Рисуем каждую строку
         line_y = y
         for line in lines:
-            ts = font.render(line, True, color)
+            ts = render_text(line, font_size, True, color)
             surface.blit(ts, (panel_x_start + 10, line_y))
             line_y += font.get_height() + line_spacing
         
@@ -1180,15 +650,8 @@ def draw_global_requirements(surface, global_reqs, font, panel_x_start):
 
 
 def draw_editor_indicator(surface, panel_x_start, panel_height):
-    try:
-        font = pygame.font.SysFont("arial", 14, bold=True)
-        hint_font = pygame.font.SysFont("arial", 11)
-    except:
-        font = pygame.font.Font(None, 16)
-        hint_font = pygame.font.Font(None, 13)
-    
     text = "EDITOR MODE"
-    ts = font.render(text, True, COLOR_EDITOR_MODE)
+    ts = render_text(text, 14, True, COLOR_EDITOR_MODE)
     
     x = panel_x_start + 10
     y = panel_height - 60
@@ -1199,20 +662,10 @@ def draw_editor_indicator(surface, panel_x_start, panel_height):
     
     surface.blit(ts, (x, y))
     
-    hint = hint_font.render("Enter - reload level", True, (180, 100, 180))
+    hint = render_text("Enter - reload level", 11, False, (180, 100, 180))
     surface.blit(hint, (x, y + 22))
 
 
-def calculate_target_pos(start, ans_str, cols, rows):
-    x, y = start
-    mapping = {"u": (0, -1), "d": (0, 1), "l": (-1, 0), "r": (1, 0)}
-    for move in ans_str.lower().split():
-        if move[0] in mapping:
-            dx, dy = mapping[move[0]]
-            if 0 <= x + dx < cols and 0 <= y + dy < rows:
-                x, y = x + dx, y + dy
-    return (x, y)
-
 
 def normalize_ans(ans_str):
     mapping = {"up": "u", "u": "u", "down": "d", "d": "d", "left": "l", "l": "l", "right": "r", "r": "r"}
@@ -1222,6 +675,11 @@ def normalize_ans(ans_str):
 # КОНСОЛЬ РАЗРАБОТЧИКА
 # =============================================================================
 
+def request_redraw():
+    """Просит основной цикл перерисовать кадр. Можно вызывать из потока консоли."""
+    if pygame.display.get_init():
+        pygame.event.post(pygame.event.Event(REDRAW_EVENT))
+
 def console_listener():
     print("\n[DEV] Консоль. F9+F11 для активации.")
     while game_running:
@@ -1237,6 +695,7 @@ def console_listener():
             elif cmd == '3':
                 global dev_show_coords
                 dev_show_coords = not dev_show_coords
+                request_redraw()
                 print(f"[OK] Координаты: {'ВКЛ' if dev_show_coords else 'ВЫКЛ'}\n")
             elif cmd == '4':
                 cell_map = {}
@@ -1260,7 +719,7 @@ def console_listener():
 # =============================================================================
 
 def run_game(selected_idx, hints_enabled, edit_mode_enabled=False):
-    global game_running, dev_recording, dev_access_granted, path_positions, dev_disable_victory
+    global game_running, dev_access_granted, dev_disable_victory
     global WINDOW_WIDTH, WINDOW_HEIGHT, CELL_SIZE, GRID_COLS, GRID_ROWS
     global editor_mode, LEVELS
 
@@ -1281,33 +740,39 @@ def run_game(selected_idx, hints_enabled, edit_mode_enabled=False):
     GRID_OFFSET_X = GRID_OFFSET_Y = 0
     clock = pygame.time.Clock()
 
-    player_pos = [0, 0]
-    player_history = []
-    path_positions = []
-    target_grid_pos = None
-    level_conditions = []
+    # Вся игровая логика - в Engine, здесь только ввод и отрисовка
+    game_engine = engine.Engine(max_history=100000, distances=True)
     condition_cells = []
-    poison_data = []
-    walls_data = []
+    barrier_edges = None
+    static_layers = {}
+    step_overlay = None
+    viewport = None
     show_requirements = True
     level_requirements = {}
     global_requirements = []
-    
-    # Менеджер movable объектов
-    movable_manager = movable.MovableManager()
-    
-    state_manager = savestates.StateManager(max_history=200)
 
     console_thread = threading.Thread(target=console_listener, daemon=True)
     console_thread.start()
 
-    def load_level(idx, clear_history=True):
-        nonlocal player_pos, player_history, target_grid_pos
-        nonlocal level_conditions, condition_cells, poison_data, walls_data
+    # Редактор: файл уровня перечитывается в фоне при каждом сохранении
+    edit_watcher = None
+    if editor_mode:
+        edit_watcher = editor.EditFileWatcher(process_level_data, on_change=request_redraw)
+        edit_watcher.seed(LEVELS)
+        edit_watcher.start()
+
+    def sync_console():
+        # Консоль разработчика читает глобальные списки
+        global dev_recording, path_positions
+        dev_recording = game_engine.dev_recording
+        path_positions = game_engine.path_positions
+
+    def load_level(idx, clear_history=True, engine_ready=False):
+        """engine_ready=True - Engine уже сброшен (смерть, R), нужно обновить только экран."""
+        nonlocal condition_cells, barrier_edges, static_layers, step_overlay
+        nonlocal viewport
         nonlocal screen, game_surface, GRID_OFFSET_X, GRID_OFFSET_Y
         nonlocal show_requirements, level_requirements, global_requirements
-        nonlocal movable_manager
-        global dev_recording, path_positions
         global WINDOW_WIDTH, WINDOW_HEIGHT, CELL_SIZE, GRID_COLS, GRID_ROWS
 
         lvl = LEVELS[idx]
@@ -1318,7 +783,13 @@ def run_game(selected_idx, hints_enabled, edit_mode_enabled=False):
         
         CELL_SIZE = int(min(available_w // GRID_COLS, max_h // GRID_ROWS))
         
-        grid_w, grid_h = CELL_SIZE * GRID_COLS, CELL_SIZE * GRID_ROWS
+        # Большой уровень: клетки не мельче MIN_CELL_SIZE, на экране только его часть
+        if CELL_SIZE < MIN_CELL_SIZE:
+            CELL_SIZE = MIN_CELL_SIZE
+        viewport = Viewport(GRID_COLS, GRID_ROWS,
+                            max(1, int(available_w // CELL_SIZE)), max(1, int(max_h // CELL_SIZE)))
+        
+        grid_w, grid_h = CELL_SIZE * viewport.cols, CELL_SIZE * viewport.rows
         GRID_OFFSET_X = int(grid_w * 0.05)
         GRID_OFFSET_Y = int(grid_h * 0.05)
         
@@ -1328,61 +799,25 @@ def run_game(selected_idx, hints_enabled, edit_mode_enabled=False):
         screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
         game_surface = pygame.Surface((grid_w + 1, grid_h + 1), pygame.SRCALPHA)
         
-        player_pos = list(lvl["start"])
-        player_history = []
-        dev_recording.clear()
-        path_positions = [tuple(player_pos)]
+        if not engine_ready:
+            game_engine.load_level(lvl, clear_history=clear_history)
+        sync_console()
         
         if clear_history:
-            state_manager.reset()
             print("[RESET] Полный сброс (история очищена)")
         else:
-            print(f"[RESET] Мягкий сброс (Z/L доступны, история: {len(state_manager.history)})")
-        
-        poison_data = lvl.get("poison", [])[:]
-        walls_data = lvl.get("walls", [])[:]
+            print(f"[RESET] Мягкий сброс (Z/L доступны, история: {len(game_engine.state_manager.history)})")
         
-        # Загружаем movable объекты
-        if "movable" in lvl:
-            movable_manager = movable.parse_movable_data(lvl.get("movable", []))
-        else:
-            movable_manager.clear()
-
-        if lvl.get("wall_is_poison"):
-            flag = lvl["wall_is_poison"]
-            exceptions = [tuple(c) for c in flag.get("except", [])] if isinstance(flag, dict) else []
-            new_walls = []
-            for w in walls_data:
-                if w[0] not in exceptions: poison_data.append(w)
-                else: new_walls.append(w)
-            walls_data = new_walls
+        barrier_edges = lvl["barriers"]
 
         show_requirements = True
         level_requirements, global_requirements = get_condition_requirements(lvl, GRID_COLS, GRID_ROWS)
-        
-        # Все уровни теперь используют conditions
-        level_conditions = lvl.get("conditions", [])
         condition_cells = get_condition_cells(lvl, GRID_COLS, GRID_ROWS)
-        
-        # Обратная совместимость со старым type="sequence"
-        if lvl.get("type") == "sequence" and "ans" in lvl:
-            # Преобразуем в условие sequence
-            ans_moves = lvl.get("ans", "")
-            target_grid_pos = calculate_target_pos(lvl["start"], ans_moves, GRID_COLS, GRID_ROWS)
-            # Добавляем условия для обратной совместимости
-            if not any(c.get("check") == "sequence" for c in level_conditions):
-                level_conditions.append({
-                    "check": "sequence",
-                    "moves": ans_moves,
-                    "mode": "exact"
-                })
-            if not any(c.get("check") == "end_at" for c in level_conditions):
-                level_conditions.append({
-                    "check": "end_at",
-                    "cells": [list(target_grid_pos)]
-                })
-        else:
-            target_grid_pos = None
+
+        # Статический слой (обычный и затемнённый) строится при первой отрисовке
+        viewport.follow(game_engine.player_pos)
+        static_layers = {}
+        step_overlay = StepOverlay(game_surface.get_size(), CELL_SIZE, viewport.rect)
         
         name = lvl.get("name", f"Уровень {idx + 1}")
         mode_prefix = "[EDIT] " if editor_mode else ""
@@ -1403,11 +838,45 @@ def run_game(selected_idx, hints_enabled, edit_mode_enabled=False):
     font_steps = font_small = font_coords = font_req = None
     reload_fonts()
 
+    death_messages = {
+        'exit': "☠ ПОГИБ от яда на выходе! (Z = откат, L = загрузка)",
+        'push': "☠ ПОГИБ! (Z = откат, L = загрузка)",
+    }
+
+    needs_redraw = True
     while game_running:
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        if not events and not needs_redraw:
+            # Ничего не изменилось - спим до события вместо отрисовки 60 кадров в секунду
+            event = pygame.event.wait(IDLE_WAIT_MS)
+            events = [event] + pygame.event.get() if event.type != pygame.NOEVENT else []
+
+        for event in events:
+            if event.type in REDRAW_EVENT_TYPES:
+                needs_redraw = True
+
             if event.type == pygame.QUIT:
                 game_running = False
             
+            result = None
+
+            # Клик по клетке: кратчайший безопасный путь туда, одним действием
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                cell = viewport.cell_at(event.pos[0] - GRID_OFFSET_X, event.pos[1] - GRID_OFFSET_Y,
+                                        CELL_SIZE)
+                route = game_engine.find_path(cell) if cell is not None else None
+                if route is None:
+                    if cell is not None:
+                        print(f"[PATH] Нет безопасного пути до {cell[0]},{cell[1]}")
+                    continue
+                if not route:
+                    continue
+                if show_requirements and len(game_engine.path_positions) == 1:
+                    show_requirements = False
+                result = game_engine.walk(route)
+                needs_redraw = True
+                print(f"[PATH] Пройдено ходов: {result['steps']}")
+
             if event.type == pygame.KEYDOWN:
                 keys = pygame.key.get_pressed()
                 
@@ -1417,7 +886,8 @@ def run_game(selected_idx, hints_enabled, edit_mode_enabled=False):
 
                 if event.key == pygame.K_r:
                     full_reset = keys[pygame.K_LSHIFT] or keys[pygame.K_RSHIFT]
-                    load_level(current_idx, clear_history=full_reset)
+                    game_engine.reset(full=full_reset)
+                    load_level(current_idx, clear_history=full_reset, engine_ready=True)
                     reload_fonts()
                     continue
                 
@@ -1429,183 +899,130 @@ def run_game(selected_idx, hints_enabled, edit_mode_enabled=False):
                     new_levels = editor.reload_edit_level(process_level_data)
                     if new_levels:
                         LEVELS = new_levels
+                        edit_watcher.seed(LEVELS)
                         current_idx = 0
                         load_level(current_idx, clear_history=True)
                         reload_fonts()
                     continue
                 
                 if event.key == pygame.K_s:
-                    # Сохраняем состояние movable вместе с остальным
-                    movable_state = movable_manager.copy_state()
-                    state_manager.save_manual(player_pos, path_positions, player_history, 
-                                              dev_recording, movable_state)
+                    game_engine.save_manual()
                     continue
 
                 if event.key == pygame.K_l:
-                    data = state_manager.load_manual()
-                    if data:
-                        player_pos = data['pos']
-                        path_positions = data['path']
-                        player_history = data['hist']
-                        dev_recording = data['dev']
-                        if 'movable' in data:
-                            movable_manager.restore_state(data['movable'])
-                        if len(path_positions) > 1:
+                    if game_engine.load_manual():
+                        sync_console()
+                        if len(game_engine.path_positions) > 1:
                             show_requirements = False
                     continue
 
                 if event.key == pygame.K_z:
-                    data = state_manager.pop()
-                    if data:
-                        player_pos = data['pos']
-                        path_positions = data['path']
-                        player_history = data['hist']
-                        dev_recording = data['dev']
-                        if 'movable' in data:
-                            movable_manager.restore_state(data['movable'])
-                        if len(path_positions) > 1:
+                    if game_engine.undo():
+                        if len(game_engine.path_positions) > 1:
                             show_requirements = False
                     else:
                         print("[UNDO] История пуста")
                     continue
 
-                dx, dy, move = 0, 0, None
-                if event.key == pygame.K_UP:    dx, dy, move = 0, -1, "u"
-                elif event.key == pygame.K_DOWN:  dx, dy, move = 0, 1, "d"
-                elif event.key == pygame.K_LEFT:  dx, dy, move = -1, 0, "l"
-                elif event.key == pygame.K_RIGHT: dx, dy, move = 1, 0, "r"
+                move = {pygame.K_UP: "u", pygame.K_DOWN: "d",
+                        pygame.K_LEFT: "l", pygame.K_RIGHT: "r"}.get(event.key)
 
                 if move:
-                    if show_requirements and len(path_positions) == 1:
+                    if show_requirements and len(game_engine.path_positions) == 1:
                         show_requirements = False
                     
-                    # Направление движения
-                    move_dir = {"u": "up", "d": "down", "l": "left", "r": "right"}[move]
-                    
-                    # === Проверка яда на выходе из текущей клетки (включая границы) ===
-                    if check_poison_on_exit(player_pos, move_dir, poison_data):
-                        movable_state_before = movable_manager.copy_state()
-                        state_manager.push(player_pos, path_positions, player_history, 
-                                          dev_recording, movable_state_before)
-                        print("☠ ПОГИБ от яда на выходе! (Z = откат, L = загрузка)")
-                        load_level(current_idx, clear_history=False)
-                        continue
-                    
-                    # Сохраняем состояние movable ДО попытки хода
-                    movable_state_before = movable_manager.copy_state()
-                    
-                    # Используем movable_manager для обработки движения
-                    result = movable_manager.try_push(
-                        player_pos, move, GRID_COLS, GRID_ROWS,
-                        walls_data, poison_data, is_path_clear
-                    )
-                    
-                    # Проверка яда от толкания коробок
-                    if result['hit_poison']:
-                        state_manager.push(player_pos, path_positions, player_history, 
-                                          dev_recording, movable_state_before)
-                        print("☠ ПОГИБ! (Z = откат, L = загрузка)")
-                        load_level(current_idx, clear_history=False)
-                        continue
+                    result = game_engine.apply_move(move)
+
+            if result is None:
+                continue
+
+            if result['died']:
+                print(death_messages[result['died']])
+                load_level(current_idx, clear_history=False, engine_ready=True)
+                continue
+            
+            if result['moves_made']:
+                print(f"[BOX] Сдвинуто: {len(result['moves_made'])} объектов")
+
+            # Проверка победы
+            if result['won']:
+                if dev_disable_victory:
+                    print("[DEV] Победа OFF")
+                else:
+                    print(f"✓ Уровень {current_idx + 1} пройден!")
                     
-                    # Проверка яда на входе в целевую клетку
-                    if result['can_move']:
-                        target = result['target_pos']
-                        if check_poison_on_entry(target, move_dir, poison_data, GRID_COLS, GRID_ROWS):
-                            state_manager.push(player_pos, path_positions, player_history, 
-                                              dev_recording, movable_state_before)
-                            print("☠ ПОГИБ от яда на входе! (Z = откат, L = загрузка)")
-                            load_level(current_idx, clear_history=False)
-                            continue
-                        
-                        # Сохраняем состояние для undo
-                        state_manager.push(player_pos, path_positions, player_history, 
-                                          dev_recording, movable_state_before)
-                        
-                        # Перемещаем игрока
-                        player_pos = list(result['target_pos'])
-                        
-                        if result['moves_made']:
-                            print(f"[BOX] Сдвинуто: {len(result['moves_made'])} объектов")
-
-                    player_history.append(move)
-                    dev_recording.append(move)
-                    path_positions.append(tuple(player_pos))
-
-                    # Проверка победы
-                    if check_all_conditions(level_conditions, path_positions, 
-                                           player_pos, GRID_COLS, GRID_ROWS, player_history):
-                        if dev_disable_victory:
-                            print("[DEV] Победа OFF")
+                    if editor_mode:
+                        print("[EDITOR] Пройдено! R = сброс, Enter = перезагрузка файла")
+                    else:
+                        current_idx += 1
+                        if current_idx < len(LEVELS):
+                            load_level(current_idx, clear_history=True)
+                            reload_fonts()
                         else:
-                            print(f"✓ Уровень {current_idx + 1} пройден!")
-                            
-                            if editor_mode:
-                                print("[EDITOR] Пройдено! R = сброс, Enter = перезагрузка файла")
-                            else:
-                                current_idx += 1
-                                if current_idx < len(LEVELS):
-                                    load_level(current_idx, clear_history=True)
-                                    reload_fonts()
-                                else:
-                                    print("\n🎉 ИГРА ПРОЙДЕНА! 🎉")
-                                    game_running = False
+                            print("\n🎉 ИГРА ПРОЙДЕНА! 🎉")
+                            game_running = False
+
+        # Горячая перезагрузка файла редактора: уровни уже обработаны в фоне
+        update = edit_watcher.poll() if edit_watcher else None
+        if update and update[0]:
+            LEVELS, changed = update
+            if current_idx >= len(LEVELS) or current_idx in changed:
+                current_idx = min(current_idx, len(LEVELS) - 1)
+                load_level(current_idx, clear_history=True)
+                reload_fonts()
+            needs_redraw = True
+
+        if not needs_redraw:
+            continue
+        needs_redraw = False
 
         # === ОТРИСОВКА (RENDER LOOP) ===
         screen.fill(COLOR_BG)
-        game_surface.fill(COLOR_BG)
         
         # Определяем режим просмотра условий (для затемнения)
         is_preview = show_requirements and (level_requirements or global_requirements)
 
-        # 1. ПОДЛОЖКА: Зеленые клетки условий (Самый нижний слой)
-        for cell in condition_cells:
-            pygame.draw.rect(game_surface, COLOR_CONDITION_HINT,
-                (cell[0] * CELL_SIZE, cell[1] * CELL_SIZE, CELL_SIZE, CELL_SIZE))
-
-        # Цель (для старых уровней)
-        if target_grid_pos:
-            pygame.draw.rect(game_surface, COLOR_TARGET,
-                (target_grid_pos[0] * CELL_SIZE, target_grid_pos[1] * CELL_SIZE, CELL_SIZE, CELL_SIZE))
+        # Камера следует за игроком; при сдвиге статические слои строятся заново
+        if viewport.follow(game_engine.player_pos):
+            static_layers = {}
+            step_overlay.set_view(viewport.rect)
+        view = viewport.rect
 
-        # 2. ОКРУЖЕНИЕ: Сетка и барьеры (Поверх подложки)
-        draw_grid(game_surface, GRID_COLS * CELL_SIZE, GRID_ROWS * CELL_SIZE, CELL_SIZE)
-        draw_barriers(game_surface, walls_data, COLOR_WALL, CELL_SIZE)
-        draw_barriers(game_surface, poison_data, COLOR_POISON, CELL_SIZE)
+        # 1-2. ПОДЛОЖКА И ОКРУЖЕНИЕ: готовый статический слой видимой части уровня
+        dim = bool(is_preview)
+        if dim not in static_layers:
+            static_layers[dim] = render_static_layer(
+                game_surface.get_size(), CELL_SIZE, view, condition_cells,
+                game_engine.target_pos, barrier_edges, dim=dim)
+        game_surface.blit(static_layers[dim], (0, 0))
 
         # 3. ДИНАМИЧЕСКИЕ ОБЪЕКТЫ (Игрок и коробки)
         
         # Номера шагов (рисуем только если не в режиме просмотра)
         if not is_preview:
-            cell_data = {}
-            for step, pos in enumerate(path_positions):
-                if pos not in cell_data: cell_data[pos] = []
-                if len(cell_data[pos]) < 9: cell_data[pos].append(step)
-            for pos, steps in cell_data.items():
-                for i, val in enumerate(steps):
-                    f = get_font(max(8, CELL_SIZE // 7)) if val >= 100 else get_font(max(10, CELL_SIZE // 5))
-                    ts = f.render(str(val), True, COLOR_TEXT)
-                    game_surface.blit(ts, (pos[0] * CELL_SIZE + 2 + (i % 3) * (CELL_SIZE // 3),
-                                           pos[1] * CELL_SIZE + 2 + (i // 3) * (CELL_SIZE // 3)))
+            step_overlay.update(game_engine.path_positions, game_engine.take_path_changes())
+            game_surface.blit(step_overlay.surface, (0, 0))
 
         # Коробки: передаем dim=True если просмотр условий
-        movable.draw_movable_objects(game_surface, movable_manager, CELL_SIZE, dim=is_preview)
+        movable.draw_movable_objects(game_surface, game_engine.movable_manager, CELL_SIZE,
+                                     dim=is_preview, view=view)
 
         # Игрок: передаем dim=True если просмотр условий
-        draw_player(game_surface, player_pos, CELL_SIZE, dim=is_preview)
+        draw_player(game_surface, game_engine.player_pos, CELL_SIZE, dim=is_preview, view=view)
 
         # 4. ИНТЕРФЕЙС (Самый верхний слой)
         if show_requirements and level_requirements:
-            draw_requirements(game_surface, level_requirements, CELL_SIZE)
+            draw_requirements(game_surface, level_requirements, CELL_SIZE, view)
 
         # Dev-координаты
         if dev_show_coords:
-            f_coords = get_font(max(12, CELL_SIZE // 3), bold=True)
-            for gy in range(GRID_ROWS):
-                for gx in range(GRID_COLS):
-                    ts = f_coords.render(f"{gx},{gy}", True, COLOR_DEV_COORDS)
-                    game_surface.blit(ts, ((gx + 1) * CELL_SIZE - ts.get_width() - 3,
-                                           (gy + 1) * CELL_SIZE - ts.get_height() - 3))
+            coords_size = max(12, CELL_SIZE // 3)
+            x0, y0, x1, y1 = view
+            for gy in range(y0, y1):
+                for gx in range(x0, x1):
+                    ts = render_text(f"{gx},{gy}", coords_size, True, COLOR_DEV_COORDS)
+                    game_surface.blit(ts, ((gx - x0 + 1) * CELL_SIZE - ts.get_width() - 3,
+                                           (gy - y0 + 1) * CELL_SIZE - ts.get_height() - 3))
 
         screen.blit(game_surface, (GRID_OFFSET_X, GRID_OFFSET_Y))
 
@@ -1613,7 +1030,7 @@ def run_game(selected_idx, hints_enabled, edit_mode_enabled=False):
         if show_requirements and global_requirements:
             panel_x = WINDOW_WIDTH - SIDE_PANEL_WIDTH
             draw_global_requirements(screen, global_requirements, 
-                                     get_font(max(12, CELL_SIZE // 4), bold=True), 
+                                     max(12, CELL_SIZE // 4),
                                      panel_x)
 
         # Индикатор режима редактирования
@@ -1624,6 +1041,8 @@ def run_game(selected_idx, hints_enabled, edit_mode_enabled=False):
         pygame.display.flip()
         clock.tick(60)
 
+    if edit_watcher:
+        edit_watcher.stop()
     pygame.quit()
     sys.exit()
 
@@ -1664,13 +1083,13 @@ if __name__ == "__main__":
     
     elif mode == "2":
         if os.path.exists("user_levels.json"):
-            LEVELS = load_levels_from_file("user_levels.json", is_internal=False)
+            LEVELS = open_level_pack("user_levels.json", is_internal=False)
         if not LEVELS:
             print("[ERROR] user_levels.json не найден или пуст. Загружаю levels.json...")
-            LEVELS = load_levels_from_file("levels.json", is_internal=True)
+            LEVELS = open_level_pack("levels.json", is_internal=True)
     
     else:
-        LEVELS = load_levels_from_file("levels.json", is_internal=True)
+        LEVELS = open_level_pack("levels.json", is_internal=True)
 
     if not edit_mode:
         if not LEVELS:
@@ -1680,8 +1099,9 @@ if __name__ == "__main__":
         hints = input("Подсказки? (y): ").strip().lower() in ("да", "yes", "y")
         
         print(f"\nУровней: {len(LEVELS)}")
-        for i, lvl in enumerate(LEVELS):
-            print(f"  {i+1}. {lvl.get('name', f'Уровень {i+1}')}")
+        # Меню берёт имена из индекса пака - уровни не обрабатываются
+        for i, name in enumerate(LEVELS.names):
+            print(f"  {i+1}. {name if name is not None else f'Уровень {i+1}'}")
         
         try:
             choice = input(f"\nВыбор (1-{len(LEVELS)}): ").strip()
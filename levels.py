@@ -0,0 +1,653 @@
+"""
+Загрузка и обработка уровней (без зависимости от pygame).
+Разбор барьеров, условий с range и компиляция индексов барьеров.
+"""
+
+import sys
+import json
+import os
+import gc
+import hashlib
+import marshal
+import re
+from array import array
+from collections import OrderedDict
+
+from barriers import BarrierEdges, BarrierIndex
+
+# =============================================================================
+# РАБОТА С ФАЙЛАМИ
+# =============================================================================
+
+def resource_path(relative_path):
+    try:
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+# =============================================================================
+# НОВАЯ СИСТЕМА ПАРСИНГА БАРЬЕРОВ
+# =============================================================================
+
+class BarrierParser:
+    """Парсер барьеров с поддержкой нового консистентного формата."""
+    
+    SIDE_MAP = {
+        'u': 'up', 'd': 'down', 'l': 'left', 'r': 'right',
+        'up': 'up', 'down': 'down', 'left': 'left', 'right': 'right'
+    }
+    ALL_SIDES = ['up', 'down', 'left', 'right']
+    
+    @classmethod
+    def parse_sides(cls, sides_str):
+        if not sides_str or sides_str in ["all", "box", "square", "lrud", "udlr"]:
+            return cls.ALL_SIDES[:]
+        
+        result = []
+        for c in sides_str.lower():
+            if c in cls.SIDE_MAP:
+                side = cls.SIDE_MAP[c]
+                if side not in result:
+                    result.append(side)
+        return result if result else cls.ALL_SIDES[:]
+    
+    @classmethod
+    def generate_rect_cells(cls, start, end):
+        x1, y1 = int(start[0]), int(start[1])
+        x2, y2 = int(end[0]), int(end[1])
+        return [
+            (x, y)
+            for x in range(min(x1, x2), max(x1, x2) + 1)
+            for y in range(min(y1, y2), max(y1, y2) + 1)
+        ]
+    
+    @classmethod
+    def generate_perimeter(cls, start, end, sides):
+        x1 = min(int(start[0]), int(end[0]))
+        y1 = min(int(start[1]), int(end[1]))
+        x2 = max(int(start[0]), int(end[0]))
+        y2 = max(int(start[1]), int(end[1]))
+        
+        result = []
+        if 'left' in sides:
+            result.extend(((x1, y), 'left') for y in range(y1, y2 + 1))
+        if 'right' in sides:
+            result.extend(((x2, y), 'right') for y in range(y1, y2 + 1))
+        if 'up' in sides:
+            result.extend(((x, y1), 'up') for x in range(x1, x2 + 1))
+        if 'down' in sides:
+            result.extend(((x, y2), 'down') for x in range(x1, x2 + 1))
+        return result
+    
+    @classmethod
+    def is_new_format(cls, item):
+        return isinstance(item, dict) and any(
+            key in item for key in ["cell", "cells", "range", "ranges", "type", "sides", "mode"]
+        )
+    
+    @classmethod
+    def is_coord(cls, item):
+        return (isinstance(item, list) and len(item) == 2 and
+                isinstance(item[0], (int, float)) and isinstance(item[1], (int, float)))
+    
+    @classmethod
+    def parse_item(cls, item, default_type="both"):
+        if not isinstance(item, dict):
+            return []
+        
+        walls = []
+        b_type = item.get("type", default_type)
+        mode = item.get("mode", "fill")
+        sides_str = item.get("sides", "all")
+        sides = cls.parse_sides(sides_str)
+        
+        targets = []
+        
+        if "cell" in item:
+            c = item["cell"]
+            targets.append(("cell", (int(c[0]), int(c[1]))))
+        
+        if "cells" in item:
+            for c in item["cells"]:
+                targets.append(("cell", (int(c[0]), int(c[1]))))
+        
+        if "range" in item:
+            r = item["range"]
+            targets.append(("range", 
+                           (int(r[0][0]), int(r[0][1])),
+                           (int(r[1][0]), int(r[1][1]))))
+        
+        if "ranges" in item:
+            for r in item["ranges"]:
+                targets.append(("range",
+                               (int(r[0][0]), int(r[0][1])),
+                               (int(r[1][0]), int(r[1][1]))))
+        
+        except_set = set()
+        if "except" in item:
+            for exc in item["except"]:
+                if isinstance(exc, dict):
+                    for coords, side, _ in cls.parse_item(exc, b_type):
+                        except_set.add((coords, side))
+        
+        for target in targets:
+            if target[0] == "cell":
+                cell = target[1]
+                for side in sides:
+                    if (cell, side) not in except_set:
+                        walls.append((cell, side, b_type))
+            
+            elif target[0] == "range":
+                start, end = target[1], target[2]
+                
+                if mode == "perimeter":
+                    for coords, side in cls.generate_perimeter(start, end, sides):
+                        if (coords, side) not in except_set:
+                            walls.append((coords, side, b_type))
+                else:
+                    for cell in cls.generate_rect_cells(start, end):
+                        for side in sides:
+                            if (cell, side) not in except_set:
+                                walls.append((cell, side, b_type))
+        
+        return walls
+    
+    @classmethod
+    def parse_legacy_item(cls, item):
+        if not isinstance(item, list) or len(item) != 2:
+            return []
+        
+        raw_target, sides_dict = item[0], item[1]
+        if not isinstance(sides_dict, dict):
+            return []
+        
+        walls = []
+        modes = sides_dict.get("modes", [])
+        except_spec = sides_dict.get("except", [])
+        
+        is_perimeter = "perimeter" in modes or "box" in modes
+        
+        perimeter_sides_override = None
+        if is_perimeter:
+            for m in modes:
+                if m not in ["perimeter", "box", "fill", "standart", "standard"]:
+                    if m and all(c.lower() in "lrud" for c in m):
+                        perimeter_sides_override = cls.parse_sides(m)
+                        break
+        
+        except_set = set()
+        for exc in except_spec:
+            if cls.is_new_format(exc):
+                for coords, side, _ in cls.parse_item(exc):
+                    except_set.add((coords, side))
+            elif isinstance(exc, list):
+                if cls.is_coord(exc):
+                    cell = (int(exc[0]), int(exc[1]))
+                    for side in cls.ALL_SIDES:
+                        except_set.add((cell, side))
+                elif len(exc) == 2 and cls.is_coord(exc[0]) and cls.is_coord(exc[1]):
+                    for cell in cls.generate_rect_cells(exc[0], exc[1]):
+                        for side in cls.ALL_SIDES:
+                            except_set.add((cell, side))
+        
+        def is_range(r):
+            return (isinstance(r, list) and len(r) == 2 and
+                    cls.is_coord(r[0]) and cls.is_coord(r[1]))
+        
+        def is_multi_range(r):
+            return isinstance(r, list) and all(is_range(x) for x in r)
+        
+        ranges = []
+        if is_multi_range(raw_target):
+            for r in raw_target:
+                ranges.append((tuple(r[0]), tuple(r[1])))
+        elif is_range(raw_target):
+            ranges.append((tuple(raw_target[0]), tuple(raw_target[1])))
+        else:
+            if cls.is_coord(raw_target):
+                ranges.append((tuple(raw_target), tuple(raw_target)))
+            elif isinstance(raw_target, list):
+                for c in raw_target:
+                    if cls.is_coord(c):
+                        ranges.append((tuple(c), tuple(c)))
+        
+        for sides_key, b_type in sides_dict.items():
+            if sides_key in ["modes", "except"]:
+                continue
+            if b_type not in ["inner", "outer", "both"]:
+                continue
+            
+            sides = cls.parse_sides(sides_key) if sides_key else cls.ALL_SIDES
+            
+            if is_perimeter and perimeter_sides_override is not None:
+                sides = perimeter_sides_override
+            
+            for start, end in ranges:
+                if is_perimeter:
+                    for coords, side in cls.generate_perimeter(start, end, sides):
+                        if (coords, side) not in except_set:
+                            walls.append((coords, side, b_type))
+                else:
+                    for cell in cls.generate_rect_cells(start, end):
+                        for side in sides:
+                            if (cell, side) not in except_set:
+                                walls.append((cell, side, b_type))
+        
+        return walls
+
+
+def process_level_data(data):
+    """Обрабатывает данные уровней с поддержкой нового и старого форматов."""
+    
+    for lvl in data:
+        if "grid" in lvl:
+            lvl["grid"] = tuple(lvl["grid"])
+        if "start" in lvl:
+            lvl["start"] = tuple(lvl["start"])
+        
+        if "conditions" in lvl:
+            cols, rows = lvl.get("grid", (16, 12))
+            for cond in lvl["conditions"]:
+                
+                # === НАЧАЛО ВСТАВКИ: Поддержка range в условиях ===
+                if "range" in cond:
+                    start, end = cond["range"]
+                    # Генерируем клетки прямоугольника
+                    generated_cells = BarrierParser.generate_rect_cells(start, end)
+                    
+                    # Если списка cells нет, создаем его
+                    if "cells" not in cond:
+                        cond["cells"] = []
+                    
+                    # Добавляем сгенерированные клетки в общий список
+                    cond["cells"].extend(generated_cells)
+                # === КОНЕЦ ВСТАВКИ ===
+
+                if "cells" in cond:
+                    c = cond["cells"]
+                    if isinstance(c, list) and len(c) > 0:
+                        if isinstance(c[0], (int, float)):
+                            cond["cells"] = [tuple(c)]
+                        else:
+                            cond["cells"] = [tuple(item) for item in c]
+        
+        # Барьеры сразу сводятся в канонический набор рёбер: общие стороны
+        # соседних клеток и повторы из разных описаний хранятся один раз
+        cols, rows = lvl.get("grid", (16, 12))
+        lvl["barriers"] = BarrierEdges.build(_iter_barriers(lvl), cols, rows)
+        lvl.pop("walls", None)
+        lvl.pop("poison", None)
+        
+        # Скомпилированные индексы для O(1) проверки барьеров
+        lvl["walls_index"] = BarrierIndex.from_edges(lvl["barriers"], "walls")
+        lvl["poison_index"] = BarrierIndex.from_edges(lvl["barriers"], "poison")
+    
+    return data
+
+
+def _iter_barriers(lvl):
+    """(kind, cell, side, type) по описаниям poison и walls уровня."""
+    # Стены, которые на самом деле яд (кроме исключений)
+    flag = lvl.get("wall_is_poison")
+    exceptions = set()
+    if isinstance(flag, dict):
+        exceptions = {tuple(c) for c in flag.get("except", [])}
+    
+    for key in ("poison", "walls"):
+        for item in lvl.get(key, ()):
+            if BarrierParser.is_new_format(item):
+                parsed = BarrierParser.parse_item(item)
+            else:
+                parsed = BarrierParser.parse_legacy_item(item)
+            for cell, side, b_type in parsed:
+                kind = key
+                if key == "walls" and flag and cell not in exceptions:
+                    kind = "poison"
+                yield kind, cell, side, b_type
+
+
+# =============================================================================
+# КЭШ ОБРАБОТАННЫХ УРОВНЕЙ
+# =============================================================================
+#
+# Рядом с паком лежит <файл>.cache в формате marshal (только встроенные типы,
+# без исполнения кода при загрузке): заголовок с индексом пака
+# ('levels' - границы уровней в исходнике, имена и сетки) и, если пак
+# загружался целиком, блоки обработанных уровней ('blobs' - смещение и длина
+# блока каждого уровня). Индексы барьеров хранятся байтами масок, рёбра
+# барьеров - байтами массивов id и флагов. Кэш действителен, пока
+# совпадают путь, размер и mtime исходника; если они сменились, а содержимое
+# нет (копирование, touch) - кэш подходит по хэшу и заголовок обновляется.
+
+CACHE_VERSION = 3
+CACHE_SUFFIX = ".cache"
+
+
+def _cache_stamp(path):
+    st = os.stat(path)
+    return {'path': path, 'size': st.st_size, 'mtime': st.st_mtime_ns}
+
+
+def _cache_header(path, digest):
+    header = _cache_stamp(path)
+    header.update(version=CACHE_VERSION, python=tuple(sys.version_info[:2]), sha256=digest)
+    return header
+
+
+def _pack_level(lvl):
+    lvl = dict(lvl)
+    for key in ("walls_index", "poison_index"):
+        index = lvl[key]
+        lvl[key] = (index.masks.tobytes(), index.cols, index.rows, index.count)
+    edges = lvl["barriers"]
+    lvl["barriers"] = (edges.cols, edges.rows, edges.ids.tobytes(), edges.flags.tobytes())
+    return lvl
+
+
+def _unpack_level(lvl):
+    for key in ("walls_index", "poison_index"):
+        lvl[key] = BarrierIndex.from_masks(*lvl[key])
+    cols, rows, ids, flags = lvl["barriers"]
+    lvl["barriers"] = BarrierEdges(cols, rows, array('I', ids), array('B', flags))
+    return lvl
+
+
+def read_cache_header(path, digest=None):
+    """
+    Заголовок кэша или None, если кэша нет или он устарел.
+    digest - sha256 содержимого исходника: если stat не совпал, а хэш совпал,
+    заголовок переписывается с новым stat.
+    Returns: (заголовок, смещение блоков уровней в файле кэша)
+    """
+    cache_path = path + CACHE_SUFFIX
+    try:
+        with open(cache_path, "rb") as f:
+            header = marshal.load(f)
+            offset = f.tell()
+            if header.get('version') != CACHE_VERSION or \
+                    header.get('python') != tuple(sys.version_info[:2]):
+                return None
+            stamp = _cache_stamp(path)
+            if all(header.get(k) == v for k, v in stamp.items()):
+                return header, offset
+            if digest is None or header.get('sha256') != digest:
+                return None
+            data = f.read()
+    except (OSError, EOFError, ValueError, TypeError, AttributeError):
+        return None
+
+    header.update(stamp)
+    return header, _write_cache(path, header, data)
+
+
+def _write_cache(path, header, data):
+    """Атомарная запись кэша; ошибки записи (пак только для чтения) не мешают игре."""
+    cache_path = path + CACHE_SUFFIX
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            marshal.dump(header, f)
+            offset = f.tell()
+            f.write(data)
+        os.replace(tmp_path, cache_path)
+        return offset
+    except (OSError, ValueError) as e:
+        print(f"[CACHE] Не удалось записать кэш: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return None
+
+
+def write_level_cache(path, digest, spans, levels=None):
+    """
+    Записывает кэш пака: индекс уровней (spans из scan_pack) и,
+    если переданы levels, их обработанный вид.
+    Returns: (заголовок, смещение блоков уровней)
+    """
+    header = _cache_header(path, digest)
+    header['levels'] = spans
+    header['blobs'] = None
+    data = b""
+    if levels is not None:
+        blobs = [marshal.dumps(_pack_level(lvl)) for lvl in levels]
+        header['blobs'], pos = [], 0
+        for blob in blobs:
+            header['blobs'].append((pos, len(blob)))
+            pos += len(blob)
+        data = b"".join(blobs)
+    return header, _write_cache(path, header, data)
+
+
+def read_cached_levels(path, offset, blobs):
+    """Обработанные уровни из блоков кэша (blobs - список (смещение, длина))."""
+    # Сборщик мусора на время загрузки: тысячи новых кортежей клеток
+    # запускают его постоянно, хотя циклов среди них нет
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(path + CACHE_SUFFIX, "rb") as f:
+            if len(blobs) == 1:
+                f.seek(offset + blobs[0][0])
+                data, base = f.read(blobs[0][1]), blobs[0][0]
+            else:
+                f.seek(offset)
+                data, base = f.read(), 0
+        return [_unpack_level(marshal.loads(data[pos - base:pos - base + size]))
+                for pos, size in blobs]
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+# =============================================================================
+# ИНДЕКС ПАКА
+# =============================================================================
+
+_TOKEN_RE = re.compile(rb'"(?:[^"\\]|\\.)*"|[\[\]{}]')
+_KEY_VALUE_RE = re.compile(rb'\s*:\s*("(?:[^"\\]|\\.)*"|\[[^\[\]{}"]*\]|-?[0-9][0-9.eE+-]*)')
+
+
+def scan_pack(raw):
+    """
+    Находит уровни в тексте пака без разбора JSON целиком.
+    Returns: список (начало, конец, имя, сетка) - байтовые границы объекта уровня,
+             значения "name" и "grid" верхнего уровня объекта (None, если нет).
+    """
+    spans = []
+    depth = 0
+    start = name = grid = None
+    for m in _TOKEN_RE.finditer(raw):
+        token = m.group()
+        char = token[:1]
+        if char == b'"':
+            # Ключ верхнего уровня объекта: строка, за которой идёт двоеточие
+            if depth == 2 and token in (b'"name"', b'"grid"'):
+                kv = _KEY_VALUE_RE.match(raw, m.end())
+                if kv:
+                    try:
+                        value = json.loads(kv.group(1))
+                    except ValueError:
+                        continue
+                    if token == b'"name"':
+                        name = value
+                    else:
+                        grid = tuple(value)
+            continue
+        if char in b"[{":
+            if depth == 0 and char != b"[":
+                raise ValueError("пак должен быть JSON-массивом уровней")
+            if depth == 1 and char != b"{":
+                raise ValueError(f"элемент пака не объект (байт {m.start()})")
+            depth += 1
+            if depth == 2:
+                start, name, grid = m.start(), None, None
+        else:
+            depth -= 1
+            if depth < 0:
+                raise ValueError(f"лишняя закрывающая скобка (байт {m.start()})")
+            if depth == 1:
+                spans.append((start, m.end(), name, grid))
+    if depth != 0:
+        raise ValueError("незакрытые скобки в паке")
+    return spans
+
+
+class LevelPack:
+    """
+    Пак уровней с ленивой обработкой.
+
+    При открытии читается только индекс (границы уровней в файле, имена и
+    размеры сетки) - из кэша или одним проходом по файлу. Барьеры и условия
+    уровня разбираются при первом обращении, последние обработанные уровни
+    держатся в LRU. Поддерживает len(), pack[i] и итерацию, как список уровней.
+    """
+
+    def __init__(self, path, cache_size=8, use_cache=True):
+        self.path = path
+        self.cache_size = cache_size
+        self._processed = OrderedDict()
+        self._blobs = None
+        self._blobs_offset = None
+
+        cached = read_cache_header(path) if use_cache else None
+        if cached is None:
+            with open(path, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha256(raw).hexdigest()
+            cached = read_cache_header(path, digest) if use_cache else None
+            if cached is None:
+                spans = scan_pack(raw)
+                cached = write_level_cache(path, digest, spans) if use_cache else ({'levels': spans}, None)
+
+        header, offset = cached
+        self.entries = header['levels']
+        if header.get('blobs') is not None and offset is not None:
+            self._blobs, self._blobs_offset = header['blobs'], offset
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        for idx in range(len(self.entries)):
+            yield self[idx]
+
+    @property
+    def names(self):
+        """Имена уровней без их обработки (None, если имя не задано)."""
+        return [entry[2] for entry in self.entries]
+
+    def grid(self, idx):
+        return self.entries[idx][3] or (16, 12)
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self.entries)
+        if not 0 <= idx < len(self.entries):
+            raise IndexError("номер уровня вне пака")
+
+        lvl = self._processed.get(idx)
+        if lvl is not None:
+            self._processed.move_to_end(idx)
+            return lvl
+
+        lvl = self._load(idx)
+        self._processed[idx] = lvl
+        if len(self._processed) > self.cache_size:
+            self._processed.popitem(last=False)
+        return lvl
+
+    def _load(self, idx):
+        if self._blobs is not None:
+            try:
+                return read_cached_levels(self.path, self._blobs_offset, [self._blobs[idx]])[0]
+            except (OSError, EOFError, ValueError, TypeError, KeyError, IndexError):
+                pass  # кэш перезаписан или повреждён - разбираем исходник
+
+        start, end = self.entries[idx][:2]
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            raw = f.read(end - start)
+        try:
+            return process_level_data([json.loads(raw)])[0]
+        except ValueError as e:
+            raise ValueError(f"Уровень {idx + 1} в {self.path}: {e}") from e
+
+
+# =============================================================================
+# ЗАГРУЗКА ПАКА
+# =============================================================================
+
+def _pack_path(filename, is_internal):
+    if is_internal:
+        return resource_path(filename)
+    return os.path.abspath(filename)
+
+
+def open_level_pack(filename, is_internal=True, use_cache=True):
+    """Открывает пак для ленивой загрузки уровней. Returns: LevelPack или None."""
+    path = _pack_path(filename, is_internal)
+    if not os.path.exists(path):
+        print(f"[ERROR] Файл не найден: {path}")
+        return None
+
+    try:
+        print(f"[LOAD] {path}")
+        return LevelPack(path, use_cache=use_cache)
+    except Exception as e:
+        print(f"[ERROR] Пак уровней: {e}")
+        return None
+
+
+def load_levels_from_file(filename, is_internal=True, use_cache=True):
+    """Загружает и обрабатывает все уровни пака сразу (список уровней)."""
+    path = _pack_path(filename, is_internal)
+
+    if not os.path.exists(path):
+        print(f"[ERROR] Файл не найден: {path}")
+        return None
+
+    try:
+        print(f"[LOAD] {path}")
+        cached = read_cache_header(path) if use_cache else None
+        if cached is None or cached[0]['blobs'] is None:
+            with open(path, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha256(raw).hexdigest()
+            cached = read_cache_header(path, digest) if use_cache else None
+
+            if cached is None or cached[0]['blobs'] is None or cached[1] is None:
+                levels = process_level_data(json.loads(raw.decode("utf-8")))
+                if use_cache:
+                    try:
+                        spans = scan_pack(raw)
+                    except ValueError:
+                        spans = None
+                    if spans is not None and len(spans) == len(levels):
+                        write_level_cache(path, digest, spans, levels)
+                return levels
+
+        header, offset = cached
+        return read_cached_levels(path, offset, header['blobs'])
+    except Exception as e:
+        print(f"[ERROR] JSON: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+# =============================================================================
+# УСТАРЕВШИЕ УРОВНИ (type="sequence")
+# =============================================================================
+
+def calculate_target_pos(start, ans_str, cols, rows):
+    x, y = start
+    mapping = {"u": (0, -1), "d": (0, 1), "l": (-1, 0), "r": (1, 0)}
+    for move in ans_str.lower().split():
+        if move[0] in mapping:
+            dx, dy = mapping[move[0]]
+            if 0 <= x + dx < cols and 0 <= y + dy < rows:
+                x, y = x + dx, y + dy
+    return (x, y)
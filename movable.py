@@ -3,7 +3,7 @@
 Поддержка связанных групп через "connected": true.
 """
 
-import pygame
+from barriers import DIR_CODES, DIR_DELTA, DIR_NAMES, UP, DOWN, LEFT, RIGHT
 
 COLOR_MOVABLE = (255, 165, 0)  # Оранжевый
 COLOR_MOVABLE_BORDER = (200, 130, 0)
@@ -11,104 +11,345 @@ COLOR_BLOCKED_MARK = (255, 50, 50)
 COLOR_GROUP_LINK = (180, 120, 40)  # Цвет связей между объектами группы
 
 
+# =============================================================================
+# ZOBRIST-ХЕШ
+# =============================================================================
+
+ZOBRIST_PLAYER = 0  # метка игрока; объект box_id имеет метку box_id + 1
+_MASK64 = (1 << 64) - 1
+_zobrist_cache = {}
+
+
+def zobrist_key(x, y, tag):
+    """
+    64-битный ключ «метка tag стоит в клетке (x, y)».
+    Ключи детерминированы (splitmix64 от координат и метки), поэтому хеш
+    одного состояния одинаков в любом процессе и при любом порядке ходов.
+    """
+    key = (x, y, tag)
+    value = _zobrist_cache.get(key)
+    if value is None:
+        z = ((tag << 42) ^ ((y & 0x1FFFFF) << 21) ^ (x & 0x1FFFFF)) + 0x9E3779B97F4A7C15
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+        value = _zobrist_cache[key] = z ^ (z >> 31)
+    return value
+
+
 class MovableObject:
-    """Представляет один двигаемый объект."""
+    """
+    Статические свойства одного двигаемого объекта.
+    Хранится один раз на объект (box_id); текущая позиция живёт в BoxLayout,
+    поэтому атрибута pos нет - только начальная клетка start.
+    """
     
-    def __init__(self, pos, blocked=None, can_push=True, can_be_pushed_by=True, group_id=None):
+    __slots__ = ("start", "blocked_mask", "can_push", "can_be_pushed_by", "group_id", "box_id")
+    
+    def __init__(self, start, blocked=None, can_push=True, can_be_pushed_by=True, group_id=None,
+                 box_id=None):
         """
         Args:
-            pos: позиция (x, y)
-            blocked: стороны, с которых нельзя толкать ("u", "d", "l", "r")
+            start: начальная позиция (x, y)
+            blocked: стороны, с которых нельзя толкать - битовая маска 1 << code
+                     или имена сторон ("u", "down", ...)
             can_push: может ли этот объект толкать другие
             can_be_pushed_by: может ли быть сдвинут другим объектом (не игроком!)
             group_id: ID группы для connected объектов (None = не в группе)
+            box_id: индекс объекта в MovableManager.boxes
         """
-        self.pos = tuple(pos)
-        self.blocked = set(blocked) if blocked else set()
+        self.start = tuple(start)
+        self.blocked_mask = blocked if isinstance(blocked, int) else blocked_mask(blocked)
         self.can_push = can_push
         self.can_be_pushed_by = can_be_pushed_by
         self.group_id = group_id
+        self.box_id = box_id
+    
+    @property
+    def blocked(self):
+        """Заблокированные стороны именами ('up', ...) - для отладки и совместимости."""
+        return frozenset(name for code, name in enumerate(DIR_NAMES)
+                         if self.blocked_mask & (1 << code))
     
     def copy(self):
         """Создаёт копию объекта."""
         return MovableObject(
-            self.pos, 
-            self.blocked.copy(), 
+            self.start, 
+            self.blocked_mask, 
             self.can_push, 
             self.can_be_pushed_by,
-            self.group_id
+            self.group_id,
+            self.box_id
         )
 
 
-class MovableManager:
-    """Управляет всеми двигаемыми объектами на уровне."""
+class BoxLayout:
+    """
+    Неизменяемая раскладка объектов: pos -> box_id.
     
-    SIDE_MAP = {
-        'u': 'up', 'd': 'down', 'l': 'left', 'r': 'right',
-        'up': 'up', 'down': 'down', 'left': 'left', 'right': 'right'
-    }
+    Позиции разбиты по строкам (y -> {x: box_id}). Изменение создаёт новую
+    раскладку, копируя только словарь строк и затронутые строки, остальные
+    строки разделяются со старой раскладкой. Поэтому снимок стоит O(1).
     
-    OPPOSITE = {
-        'up': 'down', 'down': 'up', 'left': 'right', 'right': 'left'
-    }
+    Связанные группы двигаются только целиком, поэтому их позиции хранятся
+    как сдвиг от начальных: offsets = {group_id: (dx, dy)}.
     
-    DIRECTION_DELTA = {
-        'up': (0, -1), 'down': (0, 1), 'left': (-1, 0), 'right': (1, 0)
-    }
+    zobrist - XOR ключей zobrist_key всех объектов; обновляется в moved()
+    за O(перемещений) и переживает снимки/undo вместе с раскладкой.
+    bits - занятость клеток битовой доской (bitboard.BitBoard, ширина cols)
+    или None, если доски не включены (MovableManager.attach_board).
+    """
     
-    MOVE_TO_DIR = {
-        'u': 'up', 'd': 'down', 'l': 'left', 'r': 'right'
-    }
+    __slots__ = ("rows", "size", "offsets", "zobrist", "cols", "bits")
+    
+    def __init__(self, rows=None, size=0, offsets=None, zobrist=0, cols=0, bits=None):
+        self.rows = rows if rows is not None else {}
+        self.size = size
+        self.offsets = offsets if offsets is not None else {}
+        self.zobrist = zobrist
+        self.cols = cols
+        self.bits = bits
+    
+    def get(self, pos, default=None):
+        row = self.rows.get(pos[1])
+        if row is None:
+            return default
+        return row.get(pos[0], default)
+    
+    def __contains__(self, pos):
+        row = self.rows.get(pos[1])
+        return row is not None and pos[0] in row
+    
+    def __len__(self):
+        return self.size
+    
+    def __iter__(self):
+        for y, row in self.rows.items():
+            for x in row:
+                yield (x, y)
+    
+    def items(self):
+        for y, row in self.rows.items():
+            for x, box_id in row.items():
+                yield (x, y), box_id
+    
+    def in_rect(self, x0, y0, x1, y1):
+        """Позиции в прямоугольнике [x0, x1) x [y0, y1). O(видимых строк и клеток)."""
+        if len(self.rows) <= y1 - y0:
+            ys = [y for y in self.rows if y0 <= y < y1]
+        else:
+            ys = [y for y in range(y0, y1) if y in self.rows]
+        for y in ys:
+            row = self.rows[y]
+            if len(row) <= x1 - x0:
+                for x in row:
+                    if x0 <= x < x1:
+                        yield (x, y)
+            else:
+                for x in range(x0, x1):
+                    if x in row:
+                        yield (x, y)
+    
+    def moved(self, moves, added=(), group_shift=None):
+        """
+        Возвращает новую раскладку после перемещений.
+        
+        Args:
+            moves: список (old_pos, new_pos), применяется атомарно
+            added: новые объекты (pos, box_id)
+            group_shift: (group_id, dx, dy), если двигалась связанная группа
+        """
+        rows = dict(self.rows)
+        touched = {}
+        
+        def row(y):
+            r = touched.get(y)
+            if r is None:
+                r = dict(rows.get(y, ()))
+                touched[y] = r
+                rows[y] = r
+            return r
+        
+        zobrist = self.zobrist
+        ids = [row(old[1]).pop(old[0]) for old, _ in moves]
+        for (old, new), box_id in zip(moves, ids):
+            row(new[1])[new[0]] = box_id
+            zobrist ^= zobrist_key(old[0], old[1], box_id + 1) ^ zobrist_key(new[0], new[1], box_id + 1)
+        
+        size = self.size
+        for (x, y), box_id in added:
+            r = row(y)
+            if x not in r:
+                size += 1
+            else:
+                zobrist ^= zobrist_key(x, y, r[x] + 1)
+            r[x] = box_id
+            zobrist ^= zobrist_key(x, y, box_id + 1)
+        
+        bits, cols = self.bits, self.cols
+        if bits is not None:
+            # Цепочка: клетки между началом и концом переключаются дважды
+            for (ox, oy), (nx, ny) in moves:
+                bits ^= (1 << (oy * cols + ox)) ^ (1 << (ny * cols + nx))
+            for (x, y), _ in added:
+                bits |= 1 << (y * cols + x)
+        
+        for y, r in touched.items():
+            if not r:
+                del rows[y]
+        
+        offsets = self.offsets
+        if group_shift is not None:
+            group_id, dx, dy = group_shift
+            ox, oy = offsets.get(group_id, (0, 0))
+            offsets = dict(offsets)
+            offsets[group_id] = (ox + dx, oy + dy)
+        return BoxLayout(rows, size, offsets, zobrist, cols, bits)
+
+
+NO_MOVES = ()  # moves_made хода без толкания - общий пустой кортеж, без выделения памяти
+
+
+class MovableManager:
+    """Управляет всеми двигаемыми объектами на уровне."""
     
     def __init__(self):
-        self.objects = {}  # pos -> MovableObject
-        self.initial_objects = {}  # для сброса уровня
+        self.boxes = []  # box_id -> MovableObject (статические свойства)
+        self.layout = BoxLayout()  # текущие позиции: pos -> box_id
+        self.initial_layout = self.layout  # для сброса уровня
+        self.group_members = {}  # group_id -> [MovableObject]
+        self.group_links = {}  # group_id -> [(obj1, obj2)] соседей внутри группы
+        self.board = None  # bitboard.BitBoard уровня, если включены битовые доски
+        self.group_bits = {}  # group_id -> доска начальных клеток группы
+    
+    @property
+    def state_hash(self):
+        """Zobrist-хеш позиций всех объектов (int, O(1)): равные раскладки - равный хеш."""
+        return self.layout.zobrist
+    
+    @property
+    def objects(self):
+        """
+        Словарь текущая pos -> MovableObject (собирается заново, для отладки/совместимости).
+        Объекты общие и статические: текущая позиция - только ключ словаря.
+        """
+        return {pos: self.boxes[box_id] for pos, box_id in self.layout.items()}
     
     def copy_state(self):
-        """Создаёт копию текущего состояния для undo/save."""
-        return {pos: obj.copy() for pos, obj in self.objects.items()}
+        """Снимок текущего состояния для undo/save. Раскладка неизменяема - O(1)."""
+        return self.layout
     
     def restore_state(self, state):
-        """Восстанавливает состояние из копии."""
+        """Восстанавливает состояние из снимка."""
         if state is None:
-            self.objects = {}
-            return
-        self.objects = {pos: obj.copy() for pos, obj in state.items()}
+            state = BoxLayout(bits=0) if self.board is not None else BoxLayout()
+        self.layout = state
     
     def reset(self):
         """Сбрасывает позиции объектов к начальным."""
-        self.objects = {pos: obj.copy() for pos, obj in self.initial_objects.items()}
+        self.layout = self.initial_layout
     
     def clear(self):
         """Полностью очищает менеджер."""
-        self.objects.clear()
-        self.initial_objects.clear()
+        self.boxes = []
+        self.layout = self.initial_layout = BoxLayout()
+        self.group_members = {}
+        self.group_links = {}
+        self.board = None
+        self.group_bits = {}
+    
+    def attach_board(self, board):
+        """
+        Включает битовые доски (bitboard.BitBoard того же уровня): раскладка
+        ведёт занятость клеток, связанные группы проверяются сдвигом маски.
+        """
+        def with_bits(layout):
+            return BoxLayout(layout.rows, layout.size, layout.offsets, layout.zobrist,
+                             board.cols, board.from_cells(layout))
+        
+        same = self.layout is self.initial_layout
+        self.initial_layout = with_bits(self.initial_layout)
+        self.layout = self.initial_layout if same else with_bits(self.layout)
+        self.board = board
+        self._build_group_index()
+    
+    @property
+    def occupied(self):
+        """Доска занятых объектами клеток или None без attach_board."""
+        return self.layout.bits
+    
+    def _build_group_index(self):
+        """
+        Строит индекс групп и связи между соседями по начальной раскладке.
+        Группа сдвигается целиком, поэтому связи не меняются от хода к ходу.
+        """
+        members = {}
+        cells = {}
+        for pos, box_id in self.initial_layout.items():
+            obj = self.boxes[box_id]
+            if obj.group_id is not None:
+                members.setdefault(obj.group_id, []).append(obj)
+                cells[pos] = obj
+        
+        links = {}
+        for group_id, objs in members.items():
+            group_links = links[group_id] = []
+            for obj in objs:
+                x, y = obj.start
+                for neighbor_pos in ((x + 1, y), (x, y + 1)):
+                    other = cells.get(neighbor_pos)
+                    if other is not None and other.group_id == group_id:
+                        group_links.append((obj, other))
+        
+        self.group_members = members
+        self.group_links = links
+        board = self.board
+        self.group_bits = {} if board is None else {
+            group_id: board.from_cells(obj.start for obj in objs)
+            for group_id, objs in members.items()}
+    
+    def add_objects(self, items):
+        """
+        Добавляет объекты пачкой (при загрузке уровня).
+        items - список (pos, blocked, can_push, can_be_pushed_by, group_id).
+        """
+        added = []
+        for pos, blocked, can_push, can_be_pushed_by, group_id in items:
+            pos = tuple(pos)
+            box_id = len(self.boxes)
+            self.boxes.append(MovableObject(pos, blocked, can_push, can_be_pushed_by,
+                                            group_id, box_id))
+            added.append((pos, box_id))
+        self.layout = self.layout.moved((), added)
+        self.initial_layout = self.initial_layout.moved((), added)
+        self._build_group_index()
     
     def add_object(self, pos, blocked=None, can_push=True, can_be_pushed_by=True, group_id=None):
         """Добавляет объект."""
-        pos = tuple(pos)
-        obj = MovableObject(pos, blocked, can_push, can_be_pushed_by, group_id)
-        self.objects[pos] = obj
-        self.initial_objects[pos] = obj.copy()
+        self.add_objects([(pos, blocked, can_push, can_be_pushed_by, group_id)])
     
     def get_at(self, pos):
         """Возвращает объект в позиции или None."""
-        return self.objects.get(tuple(pos))
+        box_id = self.layout.get(tuple(pos))
+        return None if box_id is None else self.boxes[box_id]
     
     def has_object_at(self, pos):
         """Проверяет наличие объекта в позиции."""
-        return tuple(pos) in self.objects
+        return tuple(pos) in self.layout
     
     def get_group_positions(self, group_id):
-        """Возвращает все текущие позиции объектов группы."""
+        """Возвращает все текущие позиции объектов группы за O(размер группы)."""
         if group_id is None:
             return set()
-        return {pos for pos, obj in self.objects.items() if obj.group_id == group_id}
+        ox, oy = self.layout.offsets.get(group_id, (0, 0))
+        return {(obj.start[0] + ox, obj.start[1] + oy)
+                for obj in self.group_members.get(group_id, ())}
     
     def try_push(self, player_pos, move_char, grid_cols, grid_rows, 
                  walls_data, poison_data, is_path_clear_func):
         """
         Пытается выполнить ход игрока с учётом толкания объектов.
+        Общий путь для любых данных барьеров; Engine проверяет игрока
+        по маскам step_masks и вызывает push_boxes напрямую.
         
         Returns:
             dict с результатами
@@ -123,11 +364,12 @@ class MovableManager:
             'target_pos': None
         }
         
-        direction = self.MOVE_TO_DIR.get(move_char)
-        if not direction:
+        code = DIR_CODES.get(move_char)
+        if code is None:
             return result
         
-        dx, dy = self.DIRECTION_DELTA[direction]
+        dx, dy = DIR_DELTA[code]
+        player_pos = tuple(player_pos)
         target_pos = (player_pos[0] + dx, player_pos[1] + dy)
         result['target_pos'] = target_pos
         
@@ -137,189 +379,153 @@ class MovableManager:
             return result
         
         # Проверяем яд для игрока
-        if not is_path_clear_func(tuple(player_pos), target_pos, poison_data):
+        if not is_path_clear_func(player_pos, target_pos, poison_data):
             result['hit_poison'] = True
             return result
         
         # Проверяем стены для игрока
-        if not is_path_clear_func(tuple(player_pos), target_pos, walls_data):
+        if not is_path_clear_func(player_pos, target_pos, walls_data):
             result['blocked_by_wall'] = True
             return result
         
-        # Проверяем объект в целевой позиции
-        obj = self.get_at(target_pos)
-        if not obj:
-            result['can_move'] = True
-            return result
-        
-        # Проверяем заблокированную сторону
-        push_side = self.OPPOSITE[direction]
-        if push_side in obj.blocked:
-            result['blocked_by_box'] = True
-            return result
-        
-        # Если объект в группе - толкаем всю группу
-        if obj.group_id is not None:
-            return self._try_push_group(
-                obj.group_id, target_pos, direction, grid_cols, grid_rows,
-                walls_data, poison_data, is_path_clear_func
-            )
-        
-        # Иначе обычная логика с цепочкой
-        chain = self._collect_push_chain(
-            target_pos, direction, grid_cols, grid_rows,
-            walls_data, poison_data, is_path_clear_func
-        )
+        def box_blocked(x, y, code):
+            pos, new_pos = (x, y), (x + dx, y + dy)
+            return not (is_path_clear_func(pos, new_pos, walls_data)
+                        and is_path_clear_func(pos, new_pos, poison_data))
         
-        if chain is None:
+        moves = self.push_boxes(target_pos[0], target_pos[1], code, grid_cols, grid_rows,
+                                box_blocked)
+        if moves is None:
             result['blocked_by_box'] = True
             return result
         
-        # Выполняем перемещение (с конца цепочки)
-        moves = []
-        for old_pos in reversed(chain):
-            obj = self.objects.pop(old_pos)
-            new_pos = (old_pos[0] + dx, old_pos[1] + dy)
-            obj.pos = new_pos
-            self.objects[new_pos] = obj
-            moves.append((old_pos, new_pos))
-        
         result['can_move'] = True
         result['moves_made'] = moves
         return result
     
-    def _try_push_group(self, group_id, touched_pos, direction, cols, rows,
-                        walls_data, poison_data, is_path_clear_func):
-        """Пытается толкнуть связанную группу объектов как единое целое."""
-        result = {
-            'can_move': False,
-            'hit_poison': False,
-            'blocked_by_wall': False,
-            'blocked_by_box': False,
-            'out_of_bounds': False,
-            'moves_made': [],
-            'target_pos': touched_pos
-        }
+    def push_boxes(self, x, y, code, cols, rows, box_blocked):
+        """
+        Толкает объекты, начиная с клетки (x, y), по направлению code.
+        Группа сдвигается целиком, одиночные объекты - цепочкой
+        (группы не могут быть частью цепочки).
         
-        dx, dy = self.DIRECTION_DELTA[direction]
-        group_positions = self.get_group_positions(group_id)
+        Args:
+            box_blocked: функция (x, y, code) -> есть ли барьер на пути объекта из (x, y)
+        Returns:
+            moves_made - список (old_pos, new_pos) (пустой, если в клетке нет объекта)
+            или None, если объекты не сдвигаются
+        """
+        layout_rows = self.layout.rows
+        row = layout_rows.get(y)
+        box_id = row.get(x) if row is not None else None
+        if box_id is None:
+            return NO_MOVES
+        
+        # Сторона, с которой толкают, противоположна ходу
+        push_bit = 1 << (code ^ 1)
+        obj = self.boxes[box_id]
+        if obj.blocked_mask & push_bit:
+            return None
         
-        # Проверяем каждый объект группы
-        for pos in group_positions:
-            new_pos = (pos[0] + dx, pos[1] + dy)
-            
-            # Границы
-            if not (0 <= new_pos[0] < cols and 0 <= new_pos[1] < rows):
-                result['out_of_bounds'] = True
-                result['blocked_by_box'] = True
-                return result
-            
-            # Стены
-            if not is_path_clear_func(pos, new_pos, walls_data):
-                result['blocked_by_wall'] = True
-                result['blocked_by_box'] = True
-                return result
+        if obj.group_id is not None:
+            return self._push_group(obj.group_id, code, cols, rows, box_blocked)
+        
+        dx, dy = DIR_DELTA[code]
+        chain = []
+        while True:
+            chain.append((x, y))
+            nx, ny = x + dx, y + dy
+            if not (0 <= nx < cols and 0 <= ny < rows) or box_blocked(x, y, code):
+                return None
             
-            # Яд
-            if not is_path_clear_func(pos, new_pos, poison_data):
-                result['blocked_by_box'] = True
-                return result
+            row = layout_rows.get(ny)
+            next_id = row.get(nx) if row is not None else None
+            if next_id is None:
+                break
             
-            # Другой объект (не из нашей группы)
-            target_obj = self.get_at(new_pos)
-            if target_obj and new_pos not in group_positions:
-                result['blocked_by_box'] = True
-                return result
-        
-        # Перемещаем всю группу атомарно
-        moves = []
-        moved_objects = {}
-        
-        for pos in group_positions:
-            obj = self.objects.pop(pos)
-            new_pos = (pos[0] + dx, pos[1] + dy)
-            obj.pos = new_pos
-            moved_objects[new_pos] = obj
-            moves.append((pos, new_pos))
-        
-        self.objects.update(moved_objects)
+            next_obj = self.boxes[next_id]
+            if next_obj.group_id is not None or not obj.can_push \
+                    or not next_obj.can_be_pushed_by or next_obj.blocked_mask & push_bit:
+                return None
+            obj = next_obj
+            x, y = nx, ny
         
-        result['can_move'] = True
-        result['moves_made'] = moves
-        return result
+        # Выполняем перемещение (с конца цепочки)
+        moves = [(pos, (pos[0] + dx, pos[1] + dy)) for pos in reversed(chain)]
+        self.layout = self.layout.moved(moves)
+        return moves
     
-    def _collect_push_chain(self, start_pos, direction, cols, rows, 
-                            walls_data, poison_data, is_path_clear_func):
+    def _push_group(self, group_id, code, cols, rows, box_blocked):
         """
-        Собирает цепочку одиночных объектов для перемещения.
-        Группы не могут быть частью цепочки.
+        Пытается толкнуть связанную группу объектов как единое целое.
+        С битовой доской барьеры берутся из неё (box_blocked того же уровня не нужен).
         """
-        dx, dy = self.DIRECTION_DELTA[direction]
-        chain = []
-        current_pos = start_pos
-        push_side = self.OPPOSITE[direction]
+        dx, dy = DIR_DELTA[code]
+        layout = self.layout
+        group_positions = self.get_group_positions(group_id)
         
-        while True:
-            obj = self.get_at(current_pos)
-            if not obj:
-                break
-            
-            # Группы нельзя толкать через цепочку
-            if obj.group_id is not None and current_pos != start_pos:
+        board = self.board
+        if board is not None:
+            # Вся группа против краёв, барьеров и чужих объектов - несколькими сдвигами
+            ox, oy = layout.offsets.get(group_id, (0, 0))
+            group = board.translate(self.group_bits[group_id], ox, oy)
+            if board.push_group(group, code, layout.bits) is None:
                 return None
-            
-            chain.append(current_pos)
-            next_pos = (current_pos[0] + dx, current_pos[1] + dy)
-            
-            # Проверяем границы
-            if not (0 <= next_pos[0] < cols and 0 <= next_pos[1] < rows):
-                return None
-            
-            # Проверяем стены
-            if not is_path_clear_func(current_pos, next_pos, walls_data):
+            moves = [(pos, (pos[0] + dx, pos[1] + dy)) for pos in group_positions]
+            self.layout = layout.moved(moves, group_shift=(group_id, dx, dy))
+            return moves
+        
+        for pos in group_positions:
+            x, y = pos
+            new_pos = (x + dx, y + dy)
+            if not (0 <= new_pos[0] < cols and 0 <= new_pos[1] < rows) \
+                    or box_blocked(x, y, code):
                 return None
-            
-            # Проверяем яд
-            if not is_path_clear_func(current_pos, next_pos, poison_data):
+            # Другой объект (не из нашей группы)
+            if new_pos in layout and new_pos not in group_positions:
                 return None
-            
-            # Проверяем следующий объект
-            next_obj = self.get_at(next_pos)
-            if next_obj:
-                # Нельзя толкать группу как часть цепочки
-                if next_obj.group_id is not None:
-                    return None
-                
-                if not obj.can_push:
-                    return None
-                
-                if not next_obj.can_be_pushed_by:
-                    return None
-                
-                if push_side in next_obj.blocked:
-                    return None
-            
-            current_pos = next_pos
         
-        return chain if chain else None
+        # Перемещаем всю группу атомарно
+        moves = [(pos, (pos[0] + dx, pos[1] + dy)) for pos in group_positions]
+        self.layout = layout.moved(moves, group_shift=(group_id, dx, dy))
+        return moves
     
+    def undo_moves(self, moves):
+        """Откатывает перемещения из moves_made (список (old_pos, new_pos))."""
+        if not moves:
+            return
+        # Группа всегда двигается целиком и отдельно от цепочек
+        (old_x, old_y), (new_x, new_y) = moves[0]
+        group_id = self.get_at((new_x, new_y)).group_id
+        group_shift = None
+        if group_id is not None:
+            group_shift = (group_id, old_x - new_x, old_y - new_y)
+        self.layout = self.layout.moved([(new_pos, old_pos) for old_pos, new_pos in moves],
+                                        group_shift=group_shift)
+
     def get_all_positions(self):
         """Возвращает все позиции объектов."""
-        return list(self.objects.keys())
+        return list(self.layout)
     
     def is_empty(self):
         """Проверяет, есть ли объекты."""
-        return len(self.objects) == 0
+        return len(self.layout) == 0
     
     def get_groups(self):
         """Возвращает словарь {group_id: [positions]}."""
-        groups = {}
-        for pos, obj in self.objects.items():
-            if obj.group_id is not None:
-                if obj.group_id not in groups:
-                    groups[obj.group_id] = []
-                groups[obj.group_id].append(pos)
-        return groups
+        return {group_id: list(self.get_group_positions(group_id))
+                for group_id in self.group_members}
+    
+    def get_group_links(self):
+        """Возвращает текущие связи групп: список пар соседних позиций. O(связей)."""
+        offsets = self.layout.offsets
+        links = []
+        for group_id, pairs in self.group_links.items():
+            ox, oy = offsets.get(group_id, (0, 0))
+            for obj1, obj2 in pairs:
+                links.append(((obj1.start[0] + ox, obj1.start[1] + oy),
+                              (obj2.start[0] + ox, obj2.start[1] + oy)))
+        return links
 
 
 # =============================================================================
@@ -327,32 +533,22 @@ class MovableManager:
 # =============================================================================
 
 def parse_blocked_sides(blocked_raw):
-    """Парсит заблокированные стороны."""
-    SIDE_MAP = {
-        'u': 'up', 'd': 'down', 'l': 'left', 'r': 'right',
-        'up': 'up', 'down': 'down', 'left': 'left', 'right': 'right'
-    }
-    
-    if not blocked_raw:
-        return []
-    
+    """Парсит заблокированные стороны. Returns: список имён ('up', ...)."""
     if isinstance(blocked_raw, str):
-        result = []
-        for c in blocked_raw.lower():
-            if c in SIDE_MAP:
-                result.append(SIDE_MAP[c])
-        return result
-    
-    if isinstance(blocked_raw, list):
-        result = []
-        for b in blocked_raw:
-            if isinstance(b, str):
-                b_lower = b.lower()
-                if b_lower in SIDE_MAP:
-                    result.append(SIDE_MAP[b_lower])
-        return result
-    
-    return []
+        items = blocked_raw.lower()
+    elif isinstance(blocked_raw, list):
+        items = [b.lower() for b in blocked_raw if isinstance(b, str)]
+    else:
+        return []
+    return [DIR_NAMES[DIR_CODES[b]] for b in items if b in DIR_CODES]
+
+
+def blocked_mask(sides):
+    """Битовая маска 1 << code по именам сторон ('u', 'up', ...)."""
+    mask = 0
+    for side in sides or ():
+        mask |= 1 << DIR_CODES[side]
+    return mask
 
 
 def generate_rect_cells(start, end):
@@ -376,12 +572,13 @@ def parse_movable_data(movable_list):
         return manager
     
     group_counter = 0
+    items = []
     
     for item in movable_list:
         if not isinstance(item, dict):
             continue
         
-        blocked = parse_blocked_sides(item.get("blocked", []))
+        blocked = blocked_mask(parse_blocked_sides(item.get("blocked", [])))
         can_push = item.get("can_push", True)
         can_be_pushed_by = item.get("can_be_pushed_by", True)
         connected = item.get("connected", False)
@@ -412,9 +609,9 @@ def parse_movable_data(movable_list):
                 cells.extend(generate_rect_cells(r[0], r[1]))
         
         # Добавляем объекты
-        for cell in cells:
-            manager.add_object(cell, blocked, can_push, can_be_pushed_by, group_id)
+        items.extend((cell, blocked, can_push, can_be_pushed_by, group_id) for cell in cells)
     
+    manager.add_objects(items)
     return manager
 
 
@@ -435,14 +632,7 @@ def dim_color(color, factor=0.4):
         max(0, int(b * factor))
     )
 
-def _are_neighbors(pos1, pos2):
-    """Проверяет, являются ли позиции соседями (по горизонтали/вертикали)."""
-    dx = abs(pos1[0] - pos2[0])
-    dy = abs(pos1[1] - pos2[1])
-    return (dx == 1 and dy == 0) or (dx == 0 and dy == 1)
-
-
-def draw_movable_objects(surface, manager, cell_size, dim=False):
+def draw_movable_objects(surface, manager, cell_size, dim=False, view=None):
     """
     Отрисовывает все movable объекты.
     
@@ -451,7 +641,11 @@ def draw_movable_objects(surface, manager, cell_size, dim=False):
         manager: MovableManager
         cell_size: размер клетки
         dim: если True, цвета будут затемнены (для режима просмотра условий)
+        view: видимый прямоугольник клеток (x0, y0, x1, y1) или None - вся сетка
     """
+    # pygame нужен только для отрисовки - логика коробок работает без него
+    import pygame
+
     if manager.is_empty():
         return
     
@@ -464,26 +658,29 @@ def draw_movable_objects(surface, manager, cell_size, dim=False):
     c_mark = dim_color(COLOR_BLOCKED_MARK, factor)
     c_link = dim_color(COLOR_GROUP_LINK, factor)
     
-    # Получаем группы для отрисовки связей
-    groups = manager.get_groups()
-    
-    # Рисуем связи между соседними объектами групп
-    for group_id, positions in groups.items():
-        if len(positions) > 1:
-            for i, pos1 in enumerate(positions):
-                for pos2 in positions[i+1:]:
-                    if _are_neighbors(pos1, pos2):
-                        x1 = pos1[0] * cell_size + cell_size // 2
-                        y1 = pos1[1] * cell_size + cell_size // 2
-                        x2 = pos2[0] * cell_size + cell_size // 2
-                        y2 = pos2[1] * cell_size + cell_size // 2
-                        pygame.draw.line(surface, c_link, (x1, y1), (x2, y2), 4)
+    if view:
+        ox, oy, vx1, vy1 = view
+        positions = list(manager.layout.in_rect(*view))
+    else:
+        ox, oy = 0, 0
+        positions = manager.get_all_positions()
+    
+    # Рисуем связи между соседними объектами групп (связи предвычислены)
+    for pos1, pos2 in manager.get_group_links():
+        if view and not (ox <= pos1[0] < vx1 and oy <= pos1[1] < vy1) \
+                and not (ox <= pos2[0] < vx1 and oy <= pos2[1] < vy1):
+            continue
+        x1 = (pos1[0] - ox) * cell_size + cell_size // 2
+        y1 = (pos1[1] - oy) * cell_size + cell_size // 2
+        x2 = (pos2[0] - ox) * cell_size + cell_size // 2
+        y2 = (pos2[1] - oy) * cell_size + cell_size // 2
+        pygame.draw.line(surface, c_link, (x1, y1), (x2, y2), 4)
     
     # Рисуем сами объекты
-    for pos in manager.get_all_positions():
+    for pos in positions:
         x, y = pos
-        px = x * cell_size + cell_size // 2
-        py = y * cell_size + cell_size // 2
+        px = (x - ox) * cell_size + cell_size // 2
+        py = (y - oy) * cell_size + cell_size // 2
         
         obj = manager.get_at(pos)
         size = int(cell_size * 0.7)
@@ -510,16 +707,16 @@ def draw_movable_objects(surface, manager, cell_size, dim=False):
             mark_len = size // 3
             mark_thick = 3
             
-            if 'up' in obj.blocked:
+            if obj.blocked_mask & (1 << UP):
                 pygame.draw.rect(surface, c_mark, 
                     (px - mark_len//2, py - half - mark_thick, mark_len, mark_thick))
-            if 'down' in obj.blocked:
+            if obj.blocked_mask & (1 << DOWN):
                 pygame.draw.rect(surface, c_mark,
                     (px - mark_len//2, py + half, mark_len, mark_thick))
-            if 'left' in obj.blocked:
+            if obj.blocked_mask & (1 << LEFT):
                 pygame.draw.rect(surface, c_mark,
                     (px - half - mark_thick, py - mark_len//2, mark_thick, mark_len))
-            if 'right' in obj.blocked:
+            if obj.blocked_mask & (1 << RIGHT):
                 pygame.draw.rect(surface, c_mark,
                     (px + half, py - mark_len//2, mark_thick, mark_len))
             
@@ -1,46 +1,106 @@
-import copy
+from collections import deque
+
+# Записи журнала отмены (кортежи, чтобы занимать минимум памяти):
+#   (MOVE, pos, step_count, dev_count, box_moves)
+#       обычный ход: позиция игрока и длины path/dev ДО хода,
+#       box_moves - moves_made из MovableManager.try_push
+#   (SNAPSHOT, state, chained)
+#       полный снимок перед сбросом уровня (смерть, R, загрузка слота).
+#       chained=True - после восстановления снимка отменяется ещё одна запись
+MOVE = 0
+SNAPSHOT = 1
+
 
 class StateManager:
     def __init__(self, max_history=500):
-        self.history = []
+        self.history = deque(maxlen=max_history)
         self.manual_slot = None
         self.max_history = max_history
 
-    def push(self, player_pos, path_positions, player_history, dev_recording, movable_state=None):
-            state = {
-                'pos': list(player_pos),
-                'path': copy.deepcopy(path_positions),
-                'hist': list(player_history),
-                'dev': list(dev_recording),
-                # ИЗМЕНЕНО: проверка на is not None вместо простого if
-                'movable': copy.deepcopy(movable_state) if movable_state is not None else None,
-                'step_count': len(path_positions)
-            }
-            self.history.append(state)
-            if len(self.history) > self.max_history:
-                self.history.pop(0)
-
-    def pop(self):
-        if not self.history:
-            return None
-        return self.history.pop()
-
-    def save_manual(self, player_pos, path_positions, player_history, dev_recording, movable_state=None):
-        self.manual_slot = {
+    @staticmethod
+    def _snapshot(player_pos, path_positions, player_history, dev_recording, movable_state=None):
+        return {
             'pos': list(player_pos),
-            'path': copy.deepcopy(path_positions),
+            'path': list(path_positions),
             'hist': list(player_history),
             'dev': list(dev_recording),
-            # ИЗМЕНЕНО: проверка на is not None
-            'movable': copy.deepcopy(movable_state) if movable_state is not None else None,
+            'movable': movable_state,
             'step_count': len(path_positions)
         }
+
+    def push_move(self, player_pos, path_positions, dev_recording, box_moves=None):
+        """Записывает дельту хода. Вызывается ДО изменения состояния."""
+        self.history.append((
+            MOVE,
+            (player_pos[0], player_pos[1]),
+            len(path_positions),
+            len(dev_recording),
+            tuple(box_moves) if box_moves else None
+        ))
+
+    def push(self, player_pos, path_positions, player_history, dev_recording, movable_state=None,
+             chained=False):
+        """Записывает полный снимок (перед смертью/сбросом). Стоит O(длина пути)."""
+        state = self._snapshot(player_pos, path_positions, player_history, dev_recording,
+                               movable_state)
+        self.history.append((SNAPSHOT, state, chained))
+
+    def pop(self, path_positions, player_history, dev_recording, movable_manager=None):
+        """
+        Откатывает последнюю запись журнала, изменяя списки на месте.
+
+        Returns:
+            None, если история пуста, иначе dict:
+                'pos' - позиция игрока после отката
+                'popped' - сколько шагов снято с конца пути,
+                           None если путь восстановлен из снимка целиком
+        """
+        if not self.history:
+            return None
+
+        popped = 0
+        while self.history:
+            entry = self.history.pop()
+
+            if entry[0] == MOVE:
+                _, pos, step_count, dev_count, box_moves = entry
+                popped = None if popped is None else popped + len(path_positions) - step_count
+                del path_positions[step_count:]
+                del player_history[max(0, step_count - 1):]
+                del dev_recording[dev_count:]
+                if box_moves and movable_manager is not None:
+                    movable_manager.undo_moves(box_moves)
+                return {'pos': list(pos), 'popped': popped}
+
+            _, state, chained = entry
+            popped = None
+            path_positions[:] = state['path']
+            player_history[:] = state['hist']
+            dev_recording[:] = state['dev']
+            if state['movable'] is not None and movable_manager is not None:
+                movable_manager.restore_state(state['movable'])
+            if not chained or not self.history:
+                return {'pos': list(state['pos']), 'popped': None}
+
+        return None
+
+    def save_manual(self, player_pos, path_positions, player_history, dev_recording, movable_state=None):
+        self.manual_slot = self._snapshot(player_pos, path_positions, player_history,
+                                          dev_recording, movable_state)
         print(f"[SAVE] Сохранено на ходу: {len(path_positions)}")
 
     def load_manual(self):
         if not self.manual_slot:
             return None
-        return copy.deepcopy(self.manual_slot)
+        slot = self.manual_slot
+        return {
+            'pos': list(slot['pos']),
+            'path': list(slot['path']),
+            'hist': list(slot['hist']),
+            'dev': list(slot['dev']),
+            'movable': slot['movable'],
+            'step_count': slot['step_count']
+        }
 
     def reset(self):
         self.history.clear()
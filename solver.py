@@ -0,0 +1,922 @@
+"""
+Поиск кратчайшего решения уровня.
+
+Перебор A* по состояниям (позиция игрока, раскладка коробок, прогресс условий)
+поверх Engine.step/unstep. Таблица транспозиций хранит лучший найденный номер
+шага для каждого состояния, эвристика - допустимая нижняя оценка оставшихся
+ходов по условиям верхнего уровня.
+"""
+
+import heapq
+import time
+
+from array import array
+from collections import deque
+
+from engine import Engine
+from barriers import DIR_DELTA
+from bitboard import BitBoard
+from conditions import normalize_moves, resolve_cells
+from distances import DistanceMap, UNREACHABLE
+
+MOVES = ("u", "d", "l", "r")
+
+DEAD = None  # эвристика: из состояния победа недостижима
+
+
+# =============================================================================
+# ЭВРИСТИКИ
+# =============================================================================
+#
+# Каждая оценка получает Engine и возвращает нижнюю границу числа ходов
+# до выполнения условия или DEAD, если условие уже не выполнить.
+# Используются только условия верхнего уровня (они объединены через AND).
+# Расстояния - по карте DistanceMap (стены, яд, односторонние барьеры;
+# коробки не мешают), None - клетка недостижима. Ходы в запрещённые клетки
+# (visit с count 0) в карте закрыты как яд: после них условие не выполнить.
+
+INF = float("inf")
+
+
+def _safe_steps(engine, forbidden):
+    """step_masks уровня, где ход в запрещённую клетку помечен ядом (смертелен)."""
+    cols, rows = engine.cols, engine.rows
+    steps = array('B', engine.step_masks)
+    for fx, fy in forbidden:
+        if not (0 <= fx < cols and 0 <= fy < rows):
+            continue
+        for code, (dx, dy) in enumerate(DIR_DELTA):
+            # В клетку (fx, fy) ходом code входят из (fx - dx, fy - dy)
+            x, y = fx - dx, fy - dy
+            if 0 <= x < cols and 0 <= y < rows:
+                steps[y * cols + x] |= 0x10 << code
+    return steps
+
+
+def _backward_costs(steps, cols, rows, init):
+    """
+    cost[c] = min по клеткам p (ходов из c в p + init[p]) - Дейкстра по
+    обратным рёбрам от всех клеток сразу. init - список по клеткам (INF - не цель).
+    """
+    preds = [[] for _ in range(len(init))]
+    for i, mask in enumerate(steps):
+        y, x = divmod(i, cols)
+        for code, (dx, dy) in enumerate(DIR_DELTA):
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < cols and 0 <= ny < rows and not mask & (0x11 << code):
+                preds[ny * cols + nx].append(i)
+    cost = list(init)
+    heap = [(c, i) for i, c in enumerate(cost) if c < INF]
+    heapq.heapify(heap)
+    while heap:
+        c, i = heapq.heappop(heap)
+        if c > cost[i]:
+            continue
+        for j in preds[i]:
+            if c + 1 < cost[j]:
+                cost[j] = c + 1
+                heapq.heappush(heap, (c + 1, j))
+    return cost
+
+
+def _stay_masks(engine):
+    """
+    Маски ходов по клеткам в формате step_masks: 1 << code - ход может
+    оставить игрока на месте (стена, край сетки или упёртая в них цепочка
+    коробок), 0x10 << code - ход смертелен (яд).
+
+    Простые коробки цепочкой не длиннее их числа упираются, только если в
+    пределах цепочки по ходу есть стена, яд или край. Коробки с закрытыми
+    сторонами, группы и коробки, которые не толкают или не толкаются, могут
+    упереться где угодно.
+    """
+    steps, cols, rows = engine.step_masks, engine.cols, engine.rows
+    boxes = engine.movable_manager.boxes
+    plain = all(not b.blocked_mask and b.can_push and b.can_be_pushed_by and b.group_id is None
+                for b in boxes)
+    stay = array('B', [0]) * len(steps)
+    for i, mask in enumerate(steps):
+        y, x = divmod(i, cols)
+        for code, (dx, dy) in enumerate(DIR_DELTA):
+            if mask & (0x10 << code):
+                stay[i] |= 0x10 << code
+                continue
+            bx, by = x + dx, y + dy
+            if mask & (1 << code) or not (0 <= bx < cols and 0 <= by < rows):
+                stay[i] |= 1 << code
+                continue
+            if not boxes:
+                continue
+            if not plain:
+                stay[i] |= 1 << code
+                continue
+            for _ in range(len(boxes)):
+                if steps[by * cols + bx] & (0x11 << code):
+                    stay[i] |= 1 << code
+                    break
+                bx, by = bx + dx, by + dy
+                if not (0 <= bx < cols and 0 <= by < rows):
+                    stay[i] |= 1 << code
+                    break
+    return stay
+
+
+def _landing(steps, stay, cols, rows, start, moves):
+    """
+    Клетки, где может оказаться игрок после ходов moves из клетки start.
+    steps - маски с запрещёнными клетками (_safe_steps): войти в них нельзя,
+    но упереться в коробку на запрещённой клетке можно; stay - _stay_masks.
+    """
+    cells = {start}
+    for move in moves:
+        code = "udlr".index(move)
+        dx, dy = DIR_DELTA[code]
+        landed = set()
+        for i in cells:
+            bits = stay[i]
+            if bits & (0x10 << code):
+                continue
+            if bits & (1 << code):
+                landed.add(i)
+            y, x = divmod(i, cols)
+            nx, ny = x + dx, y + dy
+            if not steps[i] & (0x11 << code) and 0 <= nx < cols and 0 <= ny < rows:
+                landed.add(ny * cols + nx)
+        cells = landed
+        if not cells:
+            break
+    return cells
+
+
+def _visit_upper(cond):
+    """Максимальное допустимое число посещений клетки (None - без ограничения)."""
+    if "min" in cond or "max" in cond:
+        return cond.get("max")
+    count = cond.get("count", 1)
+    op = cond.get("operator", "==" if count == 0 else ">=")
+    if op in ("==", "=", "<="):
+        return count
+    if op == "<":
+        return count - 1
+    return None
+
+
+def _visits_needed(tracker, upper):
+    """
+    Функция: сколько ещё посещений нужно клетке с n посещениями, чтобы
+    выполнить условие visit (None - не набрать).
+    """
+    cache = {}
+
+    def needed(n):
+        k = cache.get(n, 0)
+        if k == 0:
+            # Выше наибольшего порога условия (visit_cap) предикат уже не меняется
+            limit = upper - n if upper is not None else max(1, tracker.visit_cap - n)
+            k = next((k for k in range(1, limit + 1) if tracker.pred(n + k)), None)
+            cache[n] = k
+        return k
+
+    return needed
+
+
+def _revisit_cost(steps, stay, dist, cell):
+    """Ходов от клетки до следующего посещения её же или None, если не вернуться."""
+    x, y = cell
+    cols, rows = dist.cols, dist.rows
+    i = y * cols + x
+    if stay[i] & 0xF:
+        return 1
+    best = None
+    for code, (dx, dy) in enumerate(DIR_DELTA):
+        nx, ny = x + dx, y + dy
+        if steps[i] & (0x11 << code) or not (0 <= nx < cols and 0 <= ny < rows):
+            continue
+        back = dist.distance((nx, ny), cell)
+        if back is not None and (best is None or back + 1 < best):
+            best = back + 1
+    return best
+
+
+def _estimate_visit(cond, tracker, dist, stay, steps):
+    upper = _visit_upper(cond)
+    cells = tracker.cells
+    watch = tracker.watch
+    match_any = tracker.match == "any"
+    cols, rows = dist.cols, dist.rows
+
+    # Цена каждого следующего посещения клетки: 1, если можно упереться
+    # (стена, край, коробка) и остаться в ней, иначе кратчайший цикл
+    # «выйти и вернуться» (на односторонних барьерах он длиннее двух ходов)
+    revisit = {}
+    for x, y in cells:
+        if 0 <= x < cols and 0 <= y < rows:
+            revisit[(x, y)] = _revisit_cost(steps, stay, dist, (x, y))
+
+    needed = _visits_needed(tracker, upper)
+
+    def estimate(engine):
+        counts = engine.tracker.visit_counts
+        pos = tuple(engine.player_pos)
+        # Счётчики меняются только в текущей клетке: превышение в других
+        # клетках уже отсечено на предыдущих ходах
+        if not match_any and upper is not None and pos in watch and counts[pos] > upper:
+            return DEAD
+        if tracker.satisfied(None):
+            return 0
+
+        best = None
+        worst = 0
+        for c in cells:
+            n = counts.get(c, 0)
+            if upper is not None and n > upper:
+                if not match_any:
+                    return DEAD
+                continue
+            # Счётчик меняется только при шаге в клетку
+            if tracker.pred(n):
+                h = 0
+            else:
+                k = needed(n)
+                h = None if k is None else (revisit[c] if pos == c else dist.distance(pos, c))
+                if h is None:
+                    if not match_any:
+                        return DEAD
+                    continue
+                if k > 1 and revisit[c] is None:
+                    if not match_any:
+                        return DEAD
+                    continue
+                h += (k - 1) * revisit[c]
+            worst = max(worst, h)
+            best = h if best is None else min(best, h)
+        if match_any:
+            return DEAD if best is None else best
+        return worst
+
+    return estimate
+
+
+def _tour_costs(steps, cols, rows, cells):
+    """
+    Для каждой клетки c из cells - список по клеткам: сколько ходов пути
+    оттуда до c приходится на клетки не из cells (вход в клетки cells
+    бесплатный). 0-1 BFS по обратным рёбрам от c.
+    """
+    preds = [[] for _ in range(cols * rows)]
+    for i, mask in enumerate(steps):
+        y, x = divmod(i, cols)
+        for code, (dx, dy) in enumerate(DIR_DELTA):
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < cols and 0 <= ny < rows and not mask & (0x11 << code):
+                preds[ny * cols + nx].append(i)
+    free = {y * cols + x for x, y in cells}
+    costs = {}
+    for c in cells:
+        target = c[1] * cols + c[0]
+        cost = [INF] * (cols * rows)
+        cost[target] = 0
+        queue = deque([target])
+        while queue:
+            i = queue.popleft()
+            # Ход p -> i стоит 1, если i не из cells
+            step = 0 if i in free else 1
+            for p in preds[i]:
+                if cost[i] + step < cost[p]:
+                    cost[p] = cost[i] + step
+                    if step:
+                        queue.append(p)
+                    else:
+                        queue.appendleft(p)
+        costs[c] = cost
+    return costs
+
+
+def _estimate_visits_total(visits, orders, runs, steps, cols, rows):
+    """
+    Каждый ход добавляет посещение ровно одной клетке, поэтому оставшиеся
+    ходы - это недостающие посещения нужных клеток плюс ходы в остальные
+    клетки. Клетке нужен максимум из требований условий: visit (match all),
+    ещё не пройденные клетки order и серии consecutive (match all) - серия
+    длины count стоит count ходов. Ходы в остальные клетки оцениваются
+    минимальным остовным деревом по текущей клетке и нужным клеткам с
+    весами _tour_costs: путь, обходящий их все, - одно из таких деревьев;
+    на односторонних барьерах сильнее сумма самых дешёвых входов в клетки.
+
+    visits - [(трекер, _visits_needed)], orders и runs - трекеры.
+    """
+    cells = set()
+    for tracker, _ in visits:
+        cells.update(tracker.cells)
+    for tracker in orders + runs:
+        cells.update(tracker.cells)
+    to = _tour_costs(steps, cols, rows, cells)
+    index = {c: c[1] * cols + c[0] for c in cells}
+
+    def estimate(engine):
+        state = engine.tracker
+        counts = state.visit_counts
+        need = {}
+        for tracker, needed in visits:
+            for c in tracker.cells:
+                n = counts.get(c, 0)
+                if not tracker.pred(n):
+                    k = needed(n)
+                    if k and k > need.get(c, 0):
+                        need[c] = k
+        for tracker in orders:
+            if tracker.broken_step is None:
+                for c in tracker.cells[tracker.cursor:]:
+                    need.setdefault(c, 1)
+        for tracker in runs:
+            reached = tracker.runs_reached
+            for c in tracker.cells:
+                if not reached[c]:
+                    k = tracker.count - (state.runs[-1] if state.path[-1] == c else 0)
+                    if k > need.get(c, 0):
+                        need[c] = k
+        if not need:
+            return 0
+
+        # Прим от текущей клетки
+        x, y = engine.player_pos
+        here = y * cols + x
+        nodes = list(need)
+        best = [to[c][here] for c in nodes]
+        if INF in best:
+            return DEAD
+        # В каждую нужную клетку путь впервые приходит из текущей или из
+        # другой нужной - сумма самых дешёвых входов (с учётом направления)
+        entry = 0
+        for c in nodes:
+            row = to[c]
+            entry += min([row[here]] + [row[index[p]] for p in nodes if p != c])
+        tree = 0
+        while nodes:
+            i = min(range(len(nodes)), key=best.__getitem__)
+            tree += best[i]
+            last = nodes.pop(i)
+            best.pop(i)
+            row, at = to[last], index[last]
+            for j, c in enumerate(nodes):
+                w = min(row[index[c]], to[c][at])
+                if w < best[j]:
+                    best[j] = w
+        return sum(need.values()) + max(tree, entry)
+
+    return estimate
+
+
+def _estimate_end_at(cells, dist):
+    cells = [(x, y) for x, y in cells if 0 <= x < dist.cols and 0 <= y < dist.rows]
+
+    def estimate(engine):
+        row = dist.row(engine.player_pos)
+        cols = dist.cols
+        best = min((row[y * cols + x] for x, y in cells), default=UNREACHABLE)
+        return DEAD if best == UNREACHABLE else best
+
+    return estimate
+
+
+def _estimate_order(tracker, dist):
+    cells = tracker.cells
+    # Хвостовые суммы расстояний между соседними клетками порядка
+    tail = [0] * (len(cells) + 1)
+    for i in range(len(cells) - 2, -1, -1):
+        d = dist.distance(cells[i], cells[i + 1])
+        if d is None:
+            return lambda engine: DEAD
+        tail[i] = tail[i + 1] + d
+
+    def estimate(engine):
+        if tracker.broken_step is not None:
+            return DEAD
+        i = tracker.cursor
+        if i >= len(cells):
+            return 0
+        d = dist.distance(engine.player_pos, cells[i])
+        return DEAD if d is None else d + tail[i]
+
+    return estimate
+
+
+def _estimate_consecutive(tracker, dist, stay):
+    """Серия длины count в клетке: дойти до неё и простоять count - 1 ход (упираясь)."""
+    count = tracker.count
+    cols, rows = dist.cols, dist.rows
+    cells = [c for c in tracker.cells if 0 <= c[0] < cols and 0 <= c[1] < rows]
+    match_any = tracker.match == "any"
+    if count <= 0:
+        return None
+    if len(cells) < len(tracker.cells) and not match_any:
+        return lambda engine: DEAD
+    if count > 1:
+        # Постоять в клетке можно, только упираясь в стену, край или коробку
+        cells = [c for c in cells if stay[c[1] * cols + c[0]] & 0xF]
+        if len(cells) < len(tracker.cells) and not match_any:
+            return lambda engine: DEAD
+
+    def estimate(engine):
+        if tracker.satisfied(None):
+            return 0
+        state = engine.tracker
+        pos = state.path[-1]
+        reached = tracker.runs_reached
+        best = None
+        worst = 0
+        for c in cells:
+            if reached[c]:
+                h = 0
+            elif c == pos:
+                h = count - state.runs[-1]
+            else:
+                h = dist.distance(pos, c)
+                if h is None:
+                    if not match_any:
+                        return DEAD
+                    continue
+                h += count - 1
+            worst = max(worst, h)
+            best = h if best is None else min(best, h)
+        if match_any:
+            return DEAD if best is None else best
+        return worst
+
+    return estimate
+
+
+def _estimate_at_steps(tracker):
+    if tracker.required_hits is None:
+        return lambda engine: DEAD if tracker.avoid and tracker.violations else 0
+
+    targets = sorted(s for s in range(tracker.step_cap) if tracker.step_pred(s))
+    last = targets[-1] if targets else -1
+
+    def estimate(engine):
+        if tracker.avoid:
+            return DEAD if tracker.violations else 0
+        step = engine.tracker.steps
+        passed = sum(1 for s in targets if s <= step)
+        missed = [tracker.hits[c] < passed for c in tracker.cells]
+        if tracker.match == "any" and missed and all(missed):
+            return DEAD
+        if tracker.match != "any" and any(missed):
+            return DEAD
+        return max(0, last - step)
+
+    return estimate
+
+
+def _estimate_total_steps(cond):
+    count = cond.get("count", 0)
+    op = cond.get("operator", "==")
+
+    def estimate(engine):
+        step = engine.tracker.steps
+        if op in ("==", "=", "<=") and step > count:
+            return DEAD
+        if op == "<" and step >= count:
+            return DEAD
+        if op in ("==", "=", ">="):
+            return max(0, count - step)
+        if op == ">":
+            return max(0, count + 1 - step)
+        return 0
+
+    return estimate
+
+
+def _estimate_region(engine, steps, no_revisit=None):
+    """
+    Клетки, куда войти уже нельзя, - стены: посещённые клетки при no_revisit
+    (кроме исключений) и клетки, набравшие верхнюю границу посещений
+    (visit, match all). Клетки, которые условиям ещё нужно посетить, и клетки
+    end_at должны оставаться достижимыми из текущей (заливка BitBoard).
+
+    Каждый ход - ровно одно посещение клетки, поэтому если во всех достижимых
+    клетках посещений осталось конечное число, ходов впереди не больше их
+    суммы: не добрать total_steps - тупик.
+    Returns: оценка или None, если таких стен на уровне не бывает.
+    """
+    cols, rows = engine.cols, engine.rows
+    board = BitBoard(steps, cols, rows)
+    keep = board.from_cells(no_revisit.exceptions) if no_revisit is not None else 0
+
+    needs = []   # (трекер, доска клеток, вид проверки)
+    capped = []  # (клетка, бит, верхняя граница посещений)
+    limits = {}  # клетка -> наименьшая верхняя граница посещений
+    min_steps = 0
+    for cond, tracker in zip(engine.conditions, engine.tracker.items):
+        check = cond.get("check", "")
+        if check == "visit":
+            cells = [(c, board.bit(*c)) for c in tracker.cells
+                     if 0 <= c[0] < cols and 0 <= c[1] < rows]
+            needs.append((tracker, cells, check))
+            upper = _visit_upper(cond)
+            if tracker.match != "any" and upper is not None:
+                for c, b in cells:
+                    limits[c] = min(upper, limits.get(c, upper))
+            if tracker.match != "any" and upper:
+                capped.extend((c, b, upper) for c, b in cells)
+        elif check == "total_steps" and cond.get("operator", "==") in ("==", "=", ">=", ">"):
+            min_steps = max(min_steps, cond.get("count", 0) + (cond.get("operator") == ">"))
+        elif check == "order":
+            needs.append((tracker, [board.from_cells([c]) for c in tracker.cells], check))
+        elif check == "consecutive" and tracker.count > 0:
+            needs.append((tracker, [(c, board.from_cells([c])) for c in tracker.cells], check))
+        elif check == "end_at":
+            needs.append((None, board.from_cells(
+                resolve_cells(cond.get("cells", []), cols, rows)), check))
+    if no_revisit is None and not capped:
+        return None
+
+    # Клетки без предела посещений: если такая достижима, запас ходов не ограничен
+    limited = board.from_cells(limits)
+    unlimited = board.full & ~limited & (keep if no_revisit is not None else board.full)
+    limits = [(c, board.bit(*c), upper) for c, upper in limits.items()]
+
+    def capacity(state, region, here):
+        """Сколько ещё ходов можно сделать в клетках region."""
+        counts = state.visit_counts
+        # Клетки no_revisit без предела: по одному посещению, текущая уже посещена
+        total = board.count(region & ~keep & ~limited & ~here) if no_revisit is not None else 0
+        for c, b, upper in limits:
+            if b & region:
+                left = upper - counts.get(c, 0)
+                if no_revisit is not None and not b & keep:
+                    left = min(left, 0 if b & here else 1)
+                total += max(0, left)
+        return total
+
+    def estimate(engine):
+        state = engine.tracker
+        counts = state.visit_counts
+        x, y = engine.player_pos
+        here = 1 << (y * cols + x)
+        full = 0
+        for c, b, upper in capped:
+            if counts.get(c, 0) >= upper:
+                full |= b
+        walls = full
+        if no_revisit is not None:
+            walls |= state.visited & ~keep
+        region = board.reachable(here, walls & ~here)
+        # Куда ещё можно войти: в текущую клетку - только повторно, если это разрешено
+        enter = region & ~here | here & (keep if no_revisit is not None else here) & ~full
+        for tracker, cells, check in needs:
+            if check == "visit":
+                pred = tracker.pred
+                if tracker.match == "any":
+                    if not any(pred(counts.get(c, 0)) or b & enter for c, b in cells):
+                        return DEAD
+                elif any(not pred(counts.get(c, 0)) and not b & enter for c, b in cells):
+                    return DEAD
+            elif check == "order":
+                if tracker.broken_step is None and any(
+                        not b & enter for b in cells[tracker.cursor:]):
+                    return DEAD
+            elif check == "consecutive":
+                reached = tracker.runs_reached
+                ok = [reached[c] or b & (enter | here) for c, b in cells]
+                if not (any(ok) if tracker.match == "any" else all(ok)):
+                    return DEAD
+            elif not region & cells:
+                return DEAD
+        if (min_steps > state.steps and not region & unlimited
+                and state.steps + capacity(state, region, here) < min_steps):
+            return DEAD
+        return 0
+
+    return estimate
+
+
+def _estimate_contains(seq, tracker, steps, stay, cols, rows, end_cost):
+    """
+    Нужно ещё хотя бы одно вхождение seq, а после него - дойти до end_at.
+
+    Вхождение либо продолжает уже сделанные j ходов (суффикс истории равен
+    seq[:j]) - тогда оставшиеся seq[j:] идут прямо из текущей клетки, либо
+    начинается заново из любой клетки p: путь до p + len(seq). К каждому
+    варианту добавляется путь от клеток, где игрок может оказаться после
+    вхождения (_landing), до end_at (end_cost).
+    """
+    size = len(seq)
+
+    def finish(start, moves):
+        landed = _landing(steps, stay, cols, rows, start, moves)
+        return len(moves) + min((end_cost[c] for c in landed), default=INF)
+
+    # Вхождение с нуля: Дейкстра от стоимостей finish по всем клеткам
+    restart = _backward_costs(steps, cols, rows, [finish(i, seq) for i in range(cols * rows)])
+    matcher = tracker.matcher
+    overlaps = {}   # состояние автомата -> j, при которых суффикс истории = seq[:j]
+    resumed = {}    # (клетка, j) -> finish(клетка, seq[j:])
+
+    def estimate(engine):
+        if tracker.satisfied(None):
+            return 0
+        x, y = engine.player_pos
+        cell = y * cols + x
+        best = restart[cell]
+
+        state = matcher.state
+        js = overlaps.get(state)
+        if js is None:
+            # Состояние автомата - самый длинный суффикс истории, совпадающий с
+            # началом какой-то последовательности; все подходящие j не длиннее его
+            tail = engine.tracker.history[len(engine.tracker.history) - matcher.matched():]
+            js = overlaps[state] = [j for j in range(1, min(len(tail), size - 1) + 1)
+                                    if tail[len(tail) - j:] == seq[:j]]
+        for j in js:
+            h = resumed.get((cell, j))
+            if h is None:
+                h = resumed[(cell, j)] = finish(cell, seq[j:])
+            if h < best:
+                best = h
+        return DEAD if best == INF else best
+
+    return estimate
+
+
+def _estimate_sequence(cond, tracker, contains=None):
+    """contains - (steps, stay, cols, rows, end_cost) для _estimate_contains."""
+    mode = cond.get("mode", "contains")
+    if "any" in cond or "all" in cond:
+        return None
+    seq = normalize_moves(cond.get("moves", ""))
+    if not seq:
+        return None
+
+    if mode == "contains" and "max" not in cond and (
+            "min" in cond or cond.get("operator", ">=") in (">=", ">")):
+        return _estimate_contains(seq, tracker, *contains)
+
+    if mode == "exact":
+        def estimate(engine):
+            history = engine.tracker.history
+            if len(history) > len(seq) or history != seq[:len(history)]:
+                return DEAD
+            return len(seq) - len(history)
+        return estimate
+
+    if mode == "starts_with":
+        def estimate(engine):
+            history = engine.tracker.history
+            n = min(len(history), len(seq))
+            if history[:n] != seq[:n]:
+                return DEAD
+            return len(seq) - n
+        return estimate
+
+    return None
+
+
+def build_heuristic(engine):
+    """Собирает оценку оставшихся ходов для загруженного в engine уровня."""
+    parts = []
+    forbidden = set()
+    end_sets = []
+    for cond, tracker in zip(engine.conditions, engine.tracker.items):
+        check = cond.get("check", "")
+        if check == "visit" and tracker.match != "any" and _visit_upper(cond) == 0:
+            # Запрещённые клетки: одна проверка текущей позиции на все условия
+            forbidden.update(tracker.cells)
+        elif check == "end_at":
+            end_sets.append(resolve_cells(cond.get("cells", []), engine.cols, engine.rows))
+
+    cols, rows = engine.cols, engine.rows
+    steps = _safe_steps(engine, forbidden)
+    dist = DistanceMap(steps, cols, rows)
+    stay = _stay_masks(engine)
+    # Ходов из клетки до выполнения всех end_at (каждое - своё множество клеток)
+    end_cost = [0] * (cols * rows)
+    for cells in end_sets:
+        init = [INF] * (cols * rows)
+        for x, y in cells:
+            if 0 <= x < cols and 0 <= y < rows:
+                init[y * cols + x] = 0
+        end_cost = [max(a, b) for a, b in
+                    zip(end_cost, _backward_costs(steps, cols, rows, init))]
+
+    visits, orders, runs = [], [], []
+    no_revisit = None
+    for cond, tracker in zip(engine.conditions, engine.tracker.items):
+        check = cond.get("check", "")
+        part = None
+        inside = all(0 <= x < cols and 0 <= y < rows for x, y in getattr(tracker, "cells", ()))
+        if check == "visit" and tracker.match != "any" and inside and _visit_upper(cond) != 0:
+            visits.append((tracker, _visits_needed(tracker, _visit_upper(cond))))
+        elif check == "order" and inside:
+            orders.append(tracker)
+        elif check == "consecutive" and tracker.match != "any" and inside:
+            runs.append(tracker)
+        if check == "visit" and tracker.match != "any" and _visit_upper(cond) == 0:
+            continue
+        elif check == "end_at":
+            part = _estimate_end_at(resolve_cells(cond.get("cells", []), engine.cols, engine.rows),
+                                    dist)
+        elif check == "visit":
+            part = _estimate_visit(cond, tracker, dist, stay, steps)
+        elif check == "order":
+            part = _estimate_order(tracker, dist)
+        elif check == "consecutive":
+            part = _estimate_consecutive(tracker, dist, stay)
+        elif check == "at_steps":
+            part = _estimate_at_steps(tracker)
+        elif check == "total_steps":
+            part = _estimate_total_steps(cond)
+        elif check == "no_revisit":
+            no_revisit = tracker
+            part = lambda engine, t=tracker: DEAD if t.violations else 0
+        elif check == "sequence":
+            part = _estimate_sequence(cond, tracker, (steps, stay, cols, rows, end_cost))
+        if part is not None:
+            parts.append(part)
+    region = _estimate_region(engine, steps, no_revisit)
+    if region is not None:
+        parts.append(region)
+    if visits or orders or runs:
+        parts.append(_estimate_visits_total(visits, orders, runs, steps, cols, rows))
+    if forbidden:
+        parts.insert(0, lambda engine: DEAD if tuple(engine.player_pos) in forbidden else 0)
+
+    def heuristic(engine):
+        best = 0
+        for part in parts:
+            h = part(engine)
+            if h is DEAD:
+                return DEAD
+            if h > best:
+                best = h
+        return best
+
+    return heuristic
+
+
+# =============================================================================
+# ПОИСК
+# =============================================================================
+#
+# Узел поиска - кортеж (родитель, ход, g). Состояние игры не хранится:
+# Engine один на весь поиск, и перед раскрытием узла он переводится в это
+# состояние откатом до общего предка с текущим узлом и проигрыванием ходов.
+# При равных f раскрываются более глубокие узлы - соседние раскрытия
+# почти всегда близки в дереве, и переход стоит несколько ходов.
+# Потомок, у которого f не больше, чем у родителя (он и так раскрылся бы
+# следующим), раскрывается сразу, без кучи: движок уже стоит в нём.
+# Ключ состояния - Zobrist-хэш игрока и коробок плюс progress_key трекера;
+# оба обновляются на каждом ходу за O(1).
+
+class _SearchLimit(Exception):
+    pass
+
+
+class Solver:
+    """
+    Поиск кратчайшего решения уровня.
+
+    Использование:
+        result = Solver(lvl).solve(timeout=10)
+        result['moves']  # "u u r d" - в формате ans
+    """
+
+    def __init__(self, lvl, max_depth=300, max_nodes=2000000, use_heuristic=True):
+        self.engine = Engine(max_history=1, bitboard=True)
+        self.engine.load_level(lvl)
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.heuristic = build_heuristic(self.engine) if use_heuristic else (lambda engine: 0)
+        self.nodes = 0
+        self._path = []     # [(узел, запись unstep)] - текущая ветка движка
+
+    def state_key(self):
+        engine = self.engine
+        return engine.state_hash, engine.tracker.progress_key()
+
+    def _goto(self, node):
+        """Переводит движок в состояние узла."""
+        path = self._path
+        chain = []
+        while node is not None and (len(path) < node[2] or path[node[2] - 1][0] is not node):
+            chain.append(node)
+            node = node[0]
+        depth = node[2] if node is not None else 0
+        engine = self.engine
+        while len(path) > depth:
+            engine.unstep(path.pop()[1])
+        for n in reversed(chain):
+            path.append((n, engine.step(n[1])))
+
+    def solve(self, timeout=None):
+        """
+        Returns:
+            dict:
+                'solvable' - True, False (перебор исчерпан) или None (лимит)
+                'moves' - кратчайшее решение в формате ans или None
+                'length' - длина решения
+                'optimal' - решение гарантированно кратчайшее (поиск не прерван)
+                'states' - число раскрытых состояний
+                'time' - время поиска в секундах
+                'status' - 'solved', 'unsolvable', 'timeout', 'limit'
+        """
+        start = time.perf_counter()
+        deadline = start + timeout if timeout else None
+        engine = self.engine
+        heuristic = self.heuristic
+        self.nodes = 0
+
+        status, goal, interrupted = 'unsolvable', None, False
+        if engine.tracker.is_satisfied():
+            # Условия выполнены уже на старте - решение из нуля ходов
+            return {'solvable': True, 'moves': "", 'length': 0, 'optimal': True,
+                    'states': 0, 'time': time.perf_counter() - start, 'status': 'solved'}
+        h = heuristic(engine)
+        best_g = {self.state_key(): 0}
+        # (f, -g, порядковый номер, узел); узел None - старт
+        open_heap = [] if h is DEAD else [(h, 0, 0, None)]
+        counter = 1
+
+        # Потомок, в который движок уже перешёл: (f, g, узел)
+        descend = None
+        while descend is not None or open_heap:
+            if descend is not None:
+                f, g, node = descend
+                descend = None
+            else:
+                f, neg_g, _, node = heapq.heappop(open_heap)
+                g = -neg_g
+                self._goto(node)
+            if goal is not None and f >= goal[2]:
+                break  # короче найденного решения уже ничего нет
+            if g >= self.max_depth:
+                status = 'limit'
+                continue
+
+            self.nodes += 1
+            if self.nodes & 1023 == 0:
+                if self.nodes > self.max_nodes:
+                    status, interrupted = 'limit', True
+                    break
+                if deadline and time.perf_counter() > deadline:
+                    status, interrupted = 'timeout', True
+                    break
+
+            g1 = g + 1
+            for move in MOVES:
+                record = engine.step(move)
+                if record is None:
+                    continue
+
+                if engine.tracker.is_satisfied():
+                    if goal is None or g1 < goal[2]:
+                        goal = (node, move, g1)
+                    engine.unstep(record)
+                    continue
+
+                h = heuristic(engine)
+                if h is not DEAD:
+                    key = self.state_key()
+                    seen = best_g.get(key)
+                    if seen is None or g1 < seen:
+                        best_g[key] = g1
+                        child = (node, move, g1)
+                        if descend is None and g1 + h <= f:
+                            descend = (g1 + h, g1, child)
+                        else:
+                            heapq.heappush(open_heap, (g1 + h, -g1, counter, child))
+                            counter += 1
+                engine.unstep(record)
+
+            if descend is not None:
+                child = descend[2]
+                self._path.append((child, engine.step(child[1])))
+
+        goal_len = goal[2] if goal is not None else None
+
+        # Возвращаем движок к старту уровня
+        self._goto(None)
+
+        moves = None
+        if goal is not None:
+            status = 'solved'
+            chain = []
+            while goal is not None:
+                chain.append(goal[1])
+                goal = goal[0]
+            moves = " ".join(reversed(chain))
+
+        return {
+            'solvable': {'solved': True, 'unsolvable': False}.get(status),
+            'moves': moves,
+            'length': goal_len,
+            'optimal': goal_len is not None and not interrupted,
+            'states': self.nodes,
+            'time': time.perf_counter() - start,
+            'status': status,
+        }
+
+
+def solve_level(lvl, timeout=None, max_depth=300, max_nodes=2000000):
+    """Ищет кратчайшее решение обработанного уровня. См. Solver.solve."""
+    return Solver(lvl, max_depth=max_depth, max_nodes=max_nodes).solve(timeout=timeout)
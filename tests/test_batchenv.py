@@ -0,0 +1,194 @@
+"""
+BatchEnv против Engine: на случайных уровнях каждый агент пакета должен
+ходить ровно как отдельный Engine.apply_move (исход хода, позиция, коробки).
+"""
+
+import contextlib
+import copy
+import io
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip("numpy")
+
+import batchenv  # noqa: E402
+import engine  # noqa: E402
+import levels  # noqa: E402
+from barriers import DOWN, RIGHT  # noqa: E402
+
+OPERATORS = ["==", ">=", "<=", "<", ">", "!="]
+
+
+def random_cells(rng, n, k):
+    # Иногда - клетки за краем сетки: условия на них должны вести себя как в Engine
+    return [[rng.randrange(-1, n + 1) if rng.random() < 0.1 else rng.randrange(n),
+             rng.randrange(n)] for _ in range(k)]
+
+
+def random_moves(rng):
+    return " ".join(rng.choice(["u", "d", "l", "r", "up"]) for _ in range(rng.randint(0, 3)))
+
+
+def random_visit(rng, n):
+    cond = {"check": "visit", "cells": random_cells(rng, n, rng.randint(0, 3)),
+            "match": rng.choice(["all", "any"])}
+    form = rng.randrange(5)
+    if form == 0:
+        cond["min"] = rng.randint(0, 2)
+    elif form == 1:
+        cond["max"] = rng.randint(0, 3)
+    elif form == 2:
+        cond["min"], cond["max"] = rng.randint(0, 2), rng.randint(1, 4)
+    elif form == 3:
+        cond["count"], cond["operator"] = rng.randint(0, 3), rng.choice(OPERATORS)
+    else:
+        cond["count"] = rng.randint(0, 2)
+    return cond
+
+
+def random_sequence(rng):
+    cond = {"check": "sequence", "overlapping": rng.random() < 0.5,
+            "mode": rng.choice(["contains", "contains", "exact", "starts_with", "ends_with",
+                                "not_contains"])}
+    form = rng.random()
+    if form < 0.2:
+        cond["any"] = [random_moves(rng) for _ in range(2)]
+    elif form < 0.4:
+        cond["all"] = [random_moves(rng) for _ in range(2)]
+    else:
+        cond["moves"] = random_moves(rng)
+    form = rng.random()
+    if form < 0.2:
+        cond["min"] = rng.randint(0, 2)
+    if 0.1 < form < 0.4:
+        cond["max"] = rng.randint(0, 3)
+    if form > 0.6:
+        cond["count"], cond["operator"] = rng.randint(0, 3), rng.choice(OPERATORS)
+    return cond
+
+
+def random_at_steps(rng, n):
+    cond = {"check": "at_steps", "cells": random_cells(rng, n, rng.randint(1, 2)),
+            "mode": rng.choice(["require", "avoid"]), "match": rng.choice(["all", "any"])}
+    form = rng.random()
+    if form < 0.3:
+        cond["step_expr"] = rng.choice(["even", "odd", "prime", "div:3", "mod:4:1",
+                                        "gte:5 & odd", "!even | div:5"])
+    elif form < 0.6:
+        cond["steps"] = [rng.randint(0, 10) for _ in range(rng.randint(0, 3))]
+    elif form < 0.8:
+        cond["step"] = rng.randint(0, 8)
+    else:
+        cond["step_range"] = [rng.randint(0, 4), rng.randint(3, 8)]
+    return cond
+
+
+def random_condition(rng, n, depth=0):
+    kinds = ["end_at", "visit", "visit", "order", "consecutive", "no_revisit", "total_steps",
+             "group", "sequence", "sequence", "at_steps", "at_steps"]
+    kind = rng.choice(kinds if depth < 2 else ["end_at", "visit", "order", "sequence", "at_steps"])
+    if kind == "visit":
+        return random_visit(rng, n)
+    if kind == "sequence":
+        return random_sequence(rng)
+    if kind == "at_steps":
+        return random_at_steps(rng, n)
+    if kind == "end_at":
+        return {"check": "end_at", "cells": random_cells(rng, n, 2)}
+    if kind == "order":
+        return {"check": "order", "cells": random_cells(rng, n, rng.randint(1, 3))}
+    if kind == "consecutive":
+        return {"check": "consecutive", "cells": random_cells(rng, n, 2),
+                "count": rng.randint(0, 3), "match": rng.choice(["all", "any"])}
+    if kind == "no_revisit":
+        return {"check": "no_revisit", "except": random_cells(rng, n, 2)}
+    if kind == "total_steps":
+        return {"check": "total_steps", "count": rng.randint(1, 12),
+                "operator": rng.choice(["==", ">=", "<="])}
+    return {"check": "group", "logic": rng.choice(["AND", "OR", "NOT", "XOR"]),
+            "items": [random_condition(rng, n, depth + 1) for _ in range(rng.randint(0, 3))]}
+
+
+def random_level(rng):
+    n = rng.randint(3, 7)
+    anywhere = lambda: [rng.randrange(-1, n + 1), rng.randrange(-1, n + 1)]
+    inside = lambda: [rng.randrange(n), rng.randrange(n)]
+    sides = lambda: "".join(rng.sample("udlr", rng.randint(1, 3)))
+
+    movable = []
+    for _ in range(rng.randint(0, 5)):
+        if rng.random() < 0.35:
+            x, y = inside()
+            movable.append({"range": [[x, y], [min(n - 1, x + rng.randint(0, 1)),
+                                               min(n - 1, y + rng.randint(0, 1))]],
+                            "connected": True, "blocked": sides() if rng.random() < 0.3 else ""})
+        else:
+            movable.append({"cells": [inside() for _ in range(rng.randint(1, 4))],
+                            "blocked": sides() if rng.random() < 0.4 else "",
+                            "can_push": rng.random() < 0.7,
+                            "can_be_pushed_by": rng.random() < 0.7})
+
+    if rng.random() < 0.1:
+        # Старый формат type="sequence": условия достраивают Engine и BatchEnv
+        return {"name": "t", "type": "sequence", "grid": [n, n], "start": inside(),
+                "ans": " ".join(rng.choice("udlr") for _ in range(rng.randint(1, 4))),
+                "walls": [], "poison": [], "movable": movable}
+
+    barrier = lambda k: {"cells": [anywhere() for _ in range(rng.randint(0, k))], "sides": sides(),
+                         "type": rng.choice(["inner", "outer", "both"])}
+    return {"name": "t", "type": "condition", "grid": [n, n], "start": inside(),
+            "conditions": [random_condition(rng, n) for _ in range(rng.randint(0, 3))],
+            "walls": [barrier(6), barrier(6)], "poison": [barrier(3)], "movable": movable}
+
+
+def check_against_engine(raw, rng, n_agents=6, n_steps=40):
+    with contextlib.redirect_stdout(io.StringIO()):
+        lvl = levels.process_level_data([copy.deepcopy(raw)])[0]
+    env = batchenv.BatchEnv(lvl, n_agents, auto_reset=False)
+    engines = []
+    for _ in range(n_agents):
+        e = engine.Engine()
+        e.load_level(lvl)
+        engines.append(e)
+    assert list(env.won()) == [e.is_won() for e in engines]
+
+    for step in range(n_steps):
+        actions = [rng.randrange(4) for _ in range(n_agents)]
+        result = env.step(np.array(actions))
+        for i, e in enumerate(engines):
+            r = e.apply_move("udlr"[actions[i]])
+            expected = (r['moved'], bool(r['died']), r['won'])
+            got = (bool(result['moved'][i]), bool(result['died'][i]), bool(result['won'][i]))
+            assert got == expected, (step, i, raw)
+            assert (int(env.x[i]), int(env.y[i])) == tuple(e.player_pos), (step, i, raw)
+            if env.n_boxes:
+                layout = sorted((y * env.cols + x, box_id)
+                                for (x, y), box_id in e.movable_manager.layout.items())
+                row = env.boxes[i]
+                boxes = sorted((int(c), int(row[c])) for c in np.flatnonzero(row != -1))
+                assert boxes == layout, (step, i, raw)
+                for cell, box_id in boxes:
+                    assert env.box_pos[i, box_id] == cell
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_random_levels_match_engine(seed):
+    rng = random.Random(seed)
+    check_against_engine(random_level(rng), rng)
+
+
+def test_visit_min_without_max():
+    raw = {"name": "t", "type": "condition", "grid": [3, 3], "start": [0, 0],
+           "conditions": [{"check": "visit", "cells": [[1, 0]], "min": 1}],
+           "walls": [], "poison": [], "movable": []}
+    with contextlib.redirect_stdout(io.StringIO()):
+        lvl = levels.process_level_data([raw])[0]
+    env = batchenv.BatchEnv(lvl, 2, auto_reset=False)
+    result = env.step(np.array([RIGHT, DOWN]))
+    assert list(result['won']) == [True, False]
+    assert env.visit_sets.cap < 16
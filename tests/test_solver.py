@@ -0,0 +1,104 @@
+"""
+Solver: длина найденного решения против полного перебора ходов через
+Engine.apply_move на маленьких уровнях, плюс уровни с большими порогами условий.
+"""
+
+import contextlib
+import copy
+import io
+import itertools
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine  # noqa: E402
+import levels  # noqa: E402
+import solver  # noqa: E402
+
+
+def load(raw):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return levels.process_level_data([copy.deepcopy(raw)])[0]
+
+
+def brute_force(lvl, limit):
+    """Длина кратчайшего решения не длиннее limit или None."""
+    e = engine.Engine()
+    e.load_level(lvl)
+    if e.is_won():
+        return 0
+    for n in range(1, limit + 1):
+        for combo in itertools.product("udlr", repeat=n):
+            e = engine.Engine()
+            e.load_level(lvl)
+            for i, move in enumerate(combo):
+                result = e.apply_move(move)
+                if result['died']:
+                    break
+                if result['won']:
+                    if i == n - 1:
+                        return n
+                    break
+    return None
+
+
+def random_level(rng):
+    n = 4
+    cells = lambda k: [[rng.randrange(n), rng.randrange(n)] for _ in range(k)]
+    moves = lambda k: " ".join(rng.choice("udlr") for _ in range(k))
+    kinds = [
+        lambda: {"check": "end_at", "cells": cells(1)},
+        lambda: {"check": "visit", "cells": cells(2), "count": rng.randint(1, 3),
+                 "match": rng.choice(["all", "any"])},
+        lambda: {"check": "visit", "cells": cells(1), "count": 0},
+        lambda: {"check": "visit", "cells": cells(1), "min": rng.randint(1, 3)},
+        lambda: {"check": "order", "cells": cells(2)},
+        lambda: {"check": "total_steps", "count": rng.randint(2, 5),
+                 "operator": rng.choice([">=", "==", "<="])},
+        lambda: {"check": "no_revisit"},
+        lambda: {"check": "sequence", "moves": moves(rng.randint(1, 3))},
+        lambda: {"check": "sequence", "moves": moves(2),
+                 "mode": rng.choice(["starts_with", "ends_with", "not_contains"])},
+        lambda: {"check": "at_steps", "cells": cells(1), "steps": [rng.randint(1, 4)],
+                 "mode": rng.choice(["require", "avoid"])},
+    ]
+    return {"name": "t", "type": "condition", "grid": [n, n], "start": cells(1)[0],
+            "conditions": [rng.choice(kinds)() for _ in range(rng.randint(1, 3))],
+            "walls": [{"cells": cells(1), "sides": rng.choice("udlr"),
+                       "type": rng.choice(["inner", "outer", "both"])}],
+            "poison": [{"cells": cells(1), "sides": rng.choice("udlr"), "type": "outer"}]
+            if rng.random() < 0.3 else [],
+            "movable": [{"cells": cells(1)}] if rng.random() < 0.4 else []}
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_random_levels_match_brute_force(seed):
+    rng = random.Random(seed)
+    raw = random_level(rng)
+    lvl = load(raw)
+    result = solver.solve_level(lvl, max_depth=5)
+    got = result['length'] if result['status'] == 'solved' else None
+    assert got == brute_force(lvl, 5), raw
+    if got:
+        e = engine.Engine()
+        e.load_level(lvl)
+        assert e.replay(result['moves'])
+
+
+@pytest.mark.parametrize("cond", [
+    {"count": 300},
+    {"min": 300},
+    {"count": 299, "operator": ">"},
+])
+def test_visit_threshold_beyond_search_window(cond):
+    # Каждый ход в клетку (1, 0) или в край из неё - посещение: решение - 300 ходов
+    raw = {"name": "t", "type": "condition", "grid": [2, 1], "start": [0, 0],
+           "conditions": [dict(cond, check="visit", cells=[[1, 0]])],
+           "walls": [], "poison": [], "movable": []}
+    result = solver.solve_level(load(raw), timeout=30)
+    assert result['status'] == 'solved'
+    assert result['length'] == 300
@@ -0,0 +1,173 @@
+"""
+Проверка пака уровней из командной строки.
+
+Каждый уровень проходит валидацию (editor.check_level) и автоматическое
+решение (solver), уровни раздаются по процессам ProcessPoolExecutor.
+Результат - JSON-отчёт: решаемость, длина кратчайшего решения,
+число раскрытых состояний и время по каждому уровню.
+
+Использование:
+    python verify.py levels.json
+    python verify.py user_levels.json --timeout 30 --workers 8 -o report.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from levels import load_levels_from_file
+from editor import check_level
+import solver
+
+
+# =============================================================================
+# ПРОВЕРКА ОДНОГО УРОВНЯ (выполняется в процессе-воркере)
+# =============================================================================
+
+def verify_level(idx, lvl, timeout, max_depth, max_states):
+    """Валидирует и решает один уровень. Returns: dict строки отчёта."""
+    started = time.perf_counter()
+    errors, warnings = check_level(lvl)
+    report = {
+        'index': idx + 1,
+        'name': lvl.get("name", f"Уровень {idx + 1}"),
+        'valid': not errors,
+        'errors': errors,
+        'warnings': warnings,
+        'solvable': None,
+        'status': 'invalid',
+        'length': None,
+        'optimal': False,
+        'states': 0,
+        'moves': None,
+    }
+
+    if not errors:
+        try:
+            result = solver.solve_level(lvl, timeout=timeout, max_depth=max_depth,
+                                        max_nodes=max_states)
+        except Exception as e:
+            report['status'] = 'error'
+            report['errors'].append(f"{type(e).__name__}: {e}")
+        else:
+            for key in ('solvable', 'status', 'length', 'optimal', 'states', 'moves'):
+                report[key] = result[key]
+
+    report['time'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+# =============================================================================
+# ПРОВЕРКА ПАКА
+# =============================================================================
+
+def verify_pack(levels, timeout=30.0, workers=None, max_depth=300, max_states=2000000,
+                progress=None):
+    """
+    Проверяет все уровни пака параллельно.
+
+    Args:
+        levels: обработанные уровни (результат load_levels_from_file)
+        timeout: лимит времени решения одного уровня, секунд
+        workers: число процессов (None - по числу ядер)
+        progress: функция report -> None, вызывается по готовности каждого уровня
+    Returns:
+        список отчётов по уровням в исходном порядке
+    """
+    workers = workers or os.cpu_count() or 1
+    reports = [None] * len(levels)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(verify_level, idx, lvl, timeout, max_depth, max_states): idx
+            for idx, lvl in enumerate(levels)
+        }
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                # Процесс-воркер упал (например, нехватка памяти)
+                report = {'index': idx + 1, 'name': levels[idx].get("name"),
+                          'valid': False, 'errors': [f"{type(e).__name__}: {e}"],
+                          'warnings': [], 'solvable': None, 'status': 'error',
+                          'length': None, 'optimal': False, 'states': 0,
+                          'moves': None, 'time': None}
+            reports[idx] = report
+            if progress:
+                progress(report)
+
+    return reports
+
+
+def summarize(reports, elapsed):
+    return {
+        'levels': len(reports),
+        'valid': sum(1 for r in reports if r['valid']),
+        'solvable': sum(1 for r in reports if r['solvable'] is True),
+        'unsolvable': sum(1 for r in reports if r['solvable'] is False),
+        'unknown': sum(1 for r in reports if r['valid'] and r['solvable'] is None),
+        'time': round(elapsed, 3),
+    }
+
+
+# =============================================================================
+# ТОЧКА ВХОДА
+# =============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка решаемости пака уровней")
+    parser.add_argument("pack", help="файл пака (levels.json, user_levels.json, ...)")
+    parser.add_argument("--timeout", type=float, default=30.0,
+                        help="лимит решения одного уровня, секунд (по умолчанию 30)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="число процессов (по умолчанию - все ядра)")
+    parser.add_argument("--max-depth", type=int, default=300,
+                        help="максимальная длина решения")
+    parser.add_argument("--max-states", type=int, default=2000000,
+                        help="лимит раскрытых состояний на уровень")
+    parser.add_argument("-o", "--output", help="файл JSON-отчёта (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+
+    # stdout оставляем под отчёт
+    with contextlib.redirect_stdout(sys.stderr):
+        levels = load_levels_from_file(args.pack, is_internal=False)
+    if not levels:
+        print(f"[ERROR] Не удалось загрузить пак: {args.pack}", file=sys.stderr)
+        return 2
+
+    def progress(report):
+        mark = {True: "✓", False: "✗"}.get(report['solvable'], "?")
+        length = report['length'] if report['length'] is not None else "-"
+        print(f"  {mark} {report['index']:>4}. {report['name']}: {report['status']}, "
+              f"ходов {length}, состояний {report['states']}, {report['time']} c",
+              file=sys.stderr)
+
+    started = time.perf_counter()
+    reports = verify_pack(levels, timeout=args.timeout, workers=args.workers,
+                          max_depth=args.max_depth, max_states=args.max_states,
+                          progress=progress)
+    result = {
+        'pack': os.path.abspath(args.pack),
+        'summary': summarize(reports, time.perf_counter() - started),
+        'levels': reports,
+    }
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    summary = result['summary']
+    ok = summary['valid'] == summary['levels'] == summary['solvable']
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())